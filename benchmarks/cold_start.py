@@ -0,0 +1,111 @@
+"""
+Cold start benchmark: how long a fresh process takes to import the query
+path and to bring up the shared engine (see src/engine.py).
+
+Usage (from the repo root, in the project environment; see benchmarks/README.md):
+    uv run python benchmarks/cold_start.py --runs 5
+
+Each run is a new Python process working in a temporary copy of ./chroma_db
+(so the repo's store and snapshots are never touched). It reports median
+milliseconds for:
+- import: retrieval, answer_gen, query_cache and tracing (what the app imports)
+- openai / instructor / chroma / collection / indexes: first access of each
+  engine component, in that order
+- chromadb: importing chromadb itself (timed in its own process, since the
+  runs above import it up front to count PersistentClient calls)
+- total: import plus full warm-up
+
+and checks that the ingestion and retrieval modules share one Chroma client.
+No network calls are made: clients are only constructed, and the indexes are
+loaded from (or rebuilt against) the local store.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import statistics
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+
+# chromadb is imported before timing starts only so PersistentClient calls can
+# be counted; its import cost is measured in a separate process ("chromadb")
+CHILD = r"""
+import sys, json, time
+sys.path.insert(0, sys.argv[1])
+import chromadb
+timings, clients = {}, []
+_persistent_client = chromadb.PersistentClient
+def counting_client(*args, **kwargs):
+    clients.append(1)
+    return _persistent_client(*args, **kwargs)
+chromadb.PersistentClient = counting_client
+import_started = time.perf_counter()
+import retrieval, answer_gen, query_cache, tracing
+timings["import"] = time.perf_counter() - import_started
+from engine import get_engine
+engine = get_engine()
+for name in ("openai_client", "instructor_client", "chroma_client", "collection"):
+    started = time.perf_counter()
+    getattr(engine, name)
+    timings[name.replace("_client", "")] = time.perf_counter() - started
+started = time.perf_counter()
+if engine.collection.count() > 0:
+    retrieval.get_indexes()
+timings["indexes"] = time.perf_counter() - started
+import embed_store, ingest_pipeline
+embed_store.legacy_rows()
+timings["total"] = time.perf_counter() - import_started
+print(json.dumps({"ms": {k: v * 1000 for k, v in timings.items()}, "chroma_clients": len(clients)}))
+"""
+
+
+def run_once(workdir: Path) -> Dict:
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "cold-start-benchmark"))
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, str(ROOT_DIR / "src")],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def chromadb_import_ms(workdir: Path) -> float:
+    proc = subprocess.run(
+        [sys.executable, "-c", "import time; t = time.perf_counter(); import chromadb; print((time.perf_counter() - t) * 1000)"],
+        cwd=workdir, capture_output=True, text=True, check=True,
+    )
+    return float(proc.stdout.strip())
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to measure (default: 5)")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-cold-start-"))
+    try:
+        if (ROOT_DIR / "chroma_db").exists():
+            shutil.copytree(ROOT_DIR / "chroma_db", workdir / "chroma_db")
+        runs = [run_once(workdir) for _ in range(args.runs)]
+        chromadb_ms = [chromadb_import_ms(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {name: round(statistics.median(r["ms"][name] for r in runs), 1) for name in runs[0]["ms"]}
+    report["chromadb"] = round(statistics.median(chromadb_ms), 1)
+    report["total"] = round(report["total"] + report["chromadb"], 1)
+
+    print(f"Cold start, median of {args.runs} runs (ms):")
+    for name in ("import", "openai", "instructor", "chromadb", "chroma", "collection", "indexes", "total"):
+        print(f"  {name:<11} {report[name]:9.1f}")
+    clients = max(r["chroma_clients"] for r in runs)
+    print(f"Chroma clients opened per process: {clients}")
+    return 0 if clients == 1 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
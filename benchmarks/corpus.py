@@ -0,0 +1,82 @@
+"""
+Synthetic policy-like corpus and golden question set.
+
+Every chunk mixes Zipf-distributed common words with a few words unique to
+that chunk. A golden question is built from one chunk's unique words plus a
+couple of its common words, so that chunk is the known relevant answer.
+"""
+from typing import Dict, List, Tuple
+import numpy as np
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "su", "ti", "vo", "de", "pa", "ge", "zu", "shi", "ban", "tor", "wel"]
+
+DOC_ID = "bench"
+
+
+def _pseudo_word(n: int, prefix: str = "") -> str:
+    """Deterministic pronounceable word for an integer."""
+    parts = []
+    while True:
+        n, r = divmod(n, len(SYLLABLES))
+        parts.append(SYLLABLES[r])
+        if n == 0:
+            break
+    return prefix + "".join(parts)
+
+
+def make_corpus(n_chunks: int, words_per_chunk: int = 80, vocab_size: int = 5000, unique_per_chunk: int = 3, seed: int = 0) -> Tuple[List[str], List[dict]]:
+    """
+    Chroma ids and metadata rows (the shape embed_store writes) for n_chunks chunks.
+
+    Returns:
+        (ids, metadatas); each metadata also carries "unique_words" for the golden set
+    """
+    rng = np.random.default_rng(seed)
+    vocab = [_pseudo_word(i) for i in range(vocab_size)]
+    probs = 1.0 / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+
+    ids, metadatas = [], []
+    offset = 0
+    for i in range(n_chunks):
+        common = [vocab[j] for j in rng.choice(vocab_size, size=words_per_chunk, p=probs)]
+        unique = [_pseudo_word(i * unique_per_chunk + j, prefix="q") for j in range(unique_per_chunk)]
+        words = common[:]
+        for j, word in enumerate(unique):
+            words.insert(int(rng.integers(0, len(words) + 1)), word)
+        text = " ".join(words)
+        summary = " ".join(common[:15] + unique)
+        page = i // 4 + 1
+
+        ids.append(f"{DOC_ID}:{i:08d}")
+        metadatas.append({
+            "chunk_id": i + 1,
+            "doc_id": DOC_ID,
+            "content_hash": f"{i:08d}",
+            "page_start": page,
+            "page_end": page,
+            "start_offset": offset,
+            "end_offset": offset + len(text) - 1,
+            "text": text,
+            "chunk_summary": summary,
+            "unique_words": unique,
+            "common_words": common[:4],
+        })
+        offset += len(text) + 1
+    return ids, metadatas
+
+
+def golden_questions(metadatas: List[dict], n_questions: int, seed: int = 1) -> List[Dict]:
+    """Questions with exactly one known relevant chunk each: {"question", "doc_id", "chunk_id"}."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(metadatas), size=min(n_questions, len(metadatas)), replace=False)
+    questions = []
+    for row in picks:
+        metadata = metadatas[int(row)]
+        words = metadata["unique_words"][:2] + metadata["common_words"][:2]
+        questions.append({
+            "question": " ".join(words),
+            "doc_id": metadata["doc_id"],
+            "chunk_id": metadata["chunk_id"],
+        })
+    return questions
@@ -0,0 +1,117 @@
+"""
+Local stand-ins for the OpenAI and Instructor clients used by the pipeline.
+
+- FakeOpenAI: embeddings.create returns deterministic hashed bag-of-words
+  vectors, so texts sharing words are close in cosine space
+- FakeInstructor: responses.create / create_partial return schema-valid
+  QueryVariations and Answer objects built from the prompt
+
+Both can simulate network latency (latency_ms) so overlap between stages is
+visible; with latency 0 they measure only the pipeline's own overhead.
+"""
+import re
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Iterator, List
+import numpy as np
+from model.schema import QueryVariations, Answer, Citation
+
+
+def hashed_embedding(text: str, dim: int) -> List[float]:
+    """Signed feature-hashing embedding of the lowercased words of text (unit length)."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+class _Embeddings:
+    def __init__(self, owner: "FakeOpenAI"):
+        self.owner = owner
+
+    def create(self, model: str, input: List[str]):
+        self.owner.calls += 1
+        self.owner.inputs += len(input)
+        if self.owner.latency_ms:
+            time.sleep(self.owner.latency_ms / 1000)
+        data = [SimpleNamespace(index=i, embedding=hashed_embedding(text, self.owner.dim)) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data)
+
+
+class FakeOpenAI:
+    """Drop-in for openai.OpenAI where only embeddings are used."""
+
+    def __init__(self, dim: int = 256, latency_ms: float = 0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.inputs = 0
+        self.embeddings = _Embeddings(self)
+
+
+def _user_query(prompt: str) -> str:
+    """The query embedded in a translation or answer prompt."""
+    match = re.search(r"(?:User query|QUERY):\s*(.+)", prompt)
+    return match.group(1).strip() if match else prompt[-200:]
+
+
+class _Responses:
+    def __init__(self, owner: "FakeInstructor"):
+        self.owner = owner
+
+    def _wait(self):
+        self.owner.calls += 1
+        if self.owner.latency_ms:
+            time.sleep(self.owner.latency_ms / 1000)
+
+    def _build(self, input: str, response_model):
+        query = _user_query(input)
+        if response_model is QueryVariations:
+            words = query.split()
+            return QueryVariations(variations=[
+                " ".join(reversed(words)),
+                " ".join(words[1:] + words[:1]),
+                f"what does the policy say about {query}",
+            ])
+        if response_model is Answer:
+            labels = re.findall(r"\[(?:([^\]\n]+), )?Chunk (\d+)\]", input)[:3]  # [<doc_id>, Chunk <chunk_id>]
+            return Answer(
+                answer=f"Based on the policy, {query} is covered as described in the cited sections.",
+                citations=[Citation(doc_id=doc_id, chunk_id=int(c), page_start=1, page_end=1) for doc_id, c in labels],
+                confidence="high",
+            )
+        raise NotImplementedError(f"FakeInstructor cannot build {response_model.__name__}")
+
+    def create(self, input: str, response_model, **kwargs):
+        self._wait()
+        return self._build(input, response_model)
+
+    def create_with_completion(self, input: str, response_model, **kwargs):
+        self._wait()
+        result = self._build(input, response_model)
+        usage = SimpleNamespace(input_tokens=len(input) // 4, output_tokens=len(result.model_dump_json()) // 4)
+        return result, SimpleNamespace(usage=usage)
+
+    def create_partial(self, input: str, response_model, **kwargs) -> Iterator:
+        self._wait()
+        final = self._build(input, response_model)
+        if response_model is QueryVariations:
+            for i in range(1, len(final.variations) + 1):
+                yield QueryVariations.model_construct(variations=final.variations[:i])
+        else:
+            yield final
+
+
+class FakeInstructor:
+    """Drop-in for an instructor client in RESPONSES_TOOLS mode."""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.responses = _Responses(self)
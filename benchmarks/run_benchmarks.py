@@ -0,0 +1,324 @@
+"""
+Offline per-stage benchmark of the RAG pipeline.
+
+Usage (from the repo root, in the project environment - numpy, chromadb
+and the rest of pyproject.toml's dependencies; see benchmarks/README.md):
+    uv run python benchmarks/run_benchmarks.py --sizes 1000,10000 --queries 200
+    uv run python benchmarks/run_benchmarks.py --sizes 1000000 --dim 64 --queries 100
+    uv run python benchmarks/run_benchmarks.py --compare benchmarks/results/baseline.json
+
+OpenAI and Instructor are replaced by local fakes (benchmarks/fakes.py) and
+the corpus is synthetic (benchmarks/corpus.py), so no API key or network is
+needed and runs are reproducible. Everything is written to a temporary
+working directory; the repo's chroma_db and snapshots are never touched.
+
+For each corpus size it reports:
+- build: Chroma load, index snapshot build and cold snapshot load times
+- stages: latency percentiles, throughput, mean CPU time, and tracemalloc
+  peak memory and memory retained by the stage's output for query_translate, dense_retrieval, sparse_retrieval, merge_and_rerank,
+  generate_answer, the concurrent hybrid_retrieval (always translating) and
+  adaptive_retrieval (hybrid retrieval that skips translation when the
+  first pass agrees)
+- recall: recall@5 of dense/sparse for the original query and recall@k of
+  the merged results, with and without adaptive translation, against the
+  golden question set
+- translation_skip_rate: share of questions adaptive_retrieval answered
+  without generating variations
+- context: mean answer-prompt context tokens after packing (overlapping
+  chunks merged, token budget applied) vs. every ranked chunk in full
+
+The persistent variation cache is disabled so every question pays for (or
+skips) a real translation call.
+
+The dense backend follows $DENSE_BACKEND / $VECTOR_QUANTIZATION (recorded in
+the results' meta); benchmarks/vector_backends.py compares backends directly.
+
+Peak memory covers Python-level allocations only (NumPy included, ChromaDB's
+native index excluded).
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from contextlib import redirect_stdout
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR / "src"))
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+
+STAGES = ["query_translate", "dense_retrieval", "sparse_retrieval", "merge_and_rerank", "generate_answer", "hybrid_retrieval", "adaptive_retrieval"]
+
+
+def percentile_summary(latencies_s: List[float]) -> Dict[str, float]:
+    ms = np.array(latencies_s) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "throughput_qps": round(len(ms) / (ms.sum() / 1000), 2) if ms.sum() else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Pipeline:
+    """The pipeline modules, imported inside the scratch directory and wired to the fakes."""
+
+    def __init__(self, dim: int, llm_latency_ms: float, embed_latency_ms: float):
+        from fakes import FakeOpenAI, FakeInstructor
+        from engine import Engine, set_engine
+        import retrieval, query_translate, answer_gen, context_packer
+
+        self.retrieval = retrieval
+        self.context_packer = context_packer
+        self.query_translate = query_translate
+        self.answer_gen = answer_gen
+        self.openai = FakeOpenAI(dim=dim, latency_ms=embed_latency_ms)
+        self.instructor = FakeInstructor(latency_ms=llm_latency_ms)
+        self.engine = Engine(openai_client=self.openai, instructor_client=self.instructor)
+        set_engine(self.engine)
+        query_translate.variation_cache.enabled = False
+
+    def load_corpus(self, ids: List[str], metadatas: List[dict], batch_size: int = 5000) -> Dict[str, float]:
+        """Replace the collection with the synthetic corpus and build the index snapshots."""
+        from fakes import hashed_embedding
+        from index_store import write_indexes
+
+        engine = self.engine
+        try:
+            engine.chroma_client.delete_collection("vector_store")
+        except Exception:
+            pass
+        engine.__dict__.pop("collection", None)  # recreated empty on next access
+        engine.reset_indexes()
+
+        started = time.perf_counter()
+        for start in range(0, len(ids), batch_size):
+            rows = metadatas[start:start + batch_size]
+            engine.collection.add(
+                ids=ids[start:start + batch_size],
+                embeddings=[hashed_embedding(row["chunk_summary"], self.openai.dim) for row in rows],
+                metadatas=[{k: v for k, v in row.items() if k not in ("unique_words", "common_words")} for row in rows],
+            )
+        load_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            write_indexes(engine.collection)
+        build_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            engine.get_indexes()
+        index_load_s = time.perf_counter() - started
+        return {"chroma_load_s": round(load_s, 3), "index_build_s": round(build_s, 3), "index_load_s": round(index_load_s, 3)}
+
+    def stage_calls(self, question: str) -> Dict[str, Callable[[Dict[str, Any]], Any]]:
+        """One callable per stage; each reads the previous stages' outputs from state."""
+        retrieval = self.retrieval
+        return {
+            "query_translate": lambda s: s.__setitem__("queries", self.query_translate.query_translate(question)),
+            "dense_retrieval": lambda s: s.__setitem__("dense", retrieval.dense_retrieval(
+                [s["queries"].original_query] + s["queries"].variations)),
+            "sparse_retrieval": lambda s: s.__setitem__("sparse", retrieval.sparse_retrieval(
+                [s["queries"].original_query] + s["queries"].variations)),
+            "merge_and_rerank": lambda s: s.__setitem__("final", retrieval.merge_and_rerank(s["dense"], s["sparse"])),
+            "generate_answer": lambda s: s.__setitem__("answer", self.answer_gen.generate_answer(question, s["final"])),
+            "hybrid_retrieval": lambda s: retrieval.hybrid_retrieval(question, adaptive=False),
+            "adaptive_retrieval": lambda s: s.__setitem__("adaptive", retrieval.hybrid_retrieval(question, adaptive=True)),
+        }
+
+
+def hit(results, doc_id: str, chunk_id: int, k: int) -> bool:
+    return any(c.doc_id == doc_id and c.chunk_id == chunk_id for c in results[:k])
+
+
+def run_size(pipeline: Pipeline, n_chunks: int, args) -> Dict[str, Any]:
+    from corpus import make_corpus, golden_questions
+
+    print(f"\n=== {n_chunks} chunks ===")
+    ids, metadatas = make_corpus(n_chunks, words_per_chunk=args.words_per_chunk, seed=args.seed)
+    golden = golden_questions(metadatas, args.queries, seed=args.seed + 1)
+    build = pipeline.load_corpus(ids, metadatas)
+    del ids, metadatas
+    print(f"build: {build}")
+
+    # Warm-up (imports, first-call caches) is not measured
+    with redirect_stdout(io.StringIO()):
+        state: Dict[str, Any] = {}
+        for call in pipeline.stage_calls(golden[0]["question"]).values():
+            call(state)
+
+    # Pass 1: latency (no tracemalloc overhead)
+    latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    cpu_s = {stage: 0.0 for stage in STAGES}
+    recall_hits = {"dense@5": 0, "sparse@5": 0, f"final@{args.top_k}": 0, f"adaptive@{args.top_k}": 0}
+    skipped = 0
+    context_tokens, context_tokens_unpacked = 0, 0
+    for item in golden:
+        state = {}
+        with redirect_stdout(io.StringIO()):
+            for stage, call in pipeline.stage_calls(item["question"]).items():
+                started, cpu_started = time.perf_counter(), time.process_time()
+                call(state)
+                latencies[stage].append(time.perf_counter() - started)
+                cpu_s[stage] += time.process_time() - cpu_started
+        recall_hits["dense@5"] += hit(state["dense"].results[0].chunks, item["doc_id"], item["chunk_id"], 5)
+        recall_hits["sparse@5"] += hit(state["sparse"].results[0].chunks, item["doc_id"], item["chunk_id"], 5)
+        recall_hits[f"final@{args.top_k}"] += hit(state["final"].chunks, item["doc_id"], item["chunk_id"], args.top_k)
+        adaptive_dense, adaptive_sparse = state["adaptive"]
+        adaptive_final = pipeline.retrieval.merge_and_rerank(adaptive_dense, adaptive_sparse)
+        recall_hits[f"adaptive@{args.top_k}"] += hit(adaptive_final.chunks, item["doc_id"], item["chunk_id"], args.top_k)
+        skipped += len(adaptive_dense.results) == 1
+        with redirect_stdout(io.StringIO()):
+            packed = pipeline.context_packer.pack_context(state["final"].chunks)
+        context_tokens += packed.tokens
+        context_tokens_unpacked += packed.tokens_unpacked
+
+    # Pass 2: peak Python memory per stage, and what its output keeps alive for the next stage
+    peaks = {stage: 0 for stage in STAGES}
+    retained = {stage: 0 for stage in STAGES}
+    tracemalloc.start()
+    for item in golden[:args.memory_queries]:
+        state = {}
+        with redirect_stdout(io.StringIO()):
+            for stage, call in pipeline.stage_calls(item["question"]).items():
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                call(state)
+                current, peak = tracemalloc.get_traced_memory()
+                peaks[stage] = max(peaks[stage], peak - baseline)
+                retained[stage] += current - baseline
+    tracemalloc.stop()
+    memory_queries = max(1, min(args.memory_queries, len(golden)))
+
+    stages = {}
+    for stage in STAGES:
+        stages[stage] = {
+            **percentile_summary(latencies[stage]),
+            "cpu_mean_ms": round(cpu_s[stage] / len(golden) * 1000, 3),
+            "peak_mem_kb": round(peaks[stage] / 1024, 1),
+            "retained_mem_kb": round(retained[stage] / memory_queries / 1024, 1),
+        }
+        s = stages[stage]
+        print(f"{stage:18s} p50 {s['p50_ms']:9.3f} ms  p99 {s['p99_ms']:9.3f} ms  {s['throughput_qps']:9.2f} q/s  "
+              f"cpu {s['cpu_mean_ms']:8.3f} ms  peak {s['peak_mem_kb']:9.1f} KB  retained {s['retained_mem_kb']:8.1f} KB")
+    recall = {name: round(count / len(golden), 4) for name, count in recall_hits.items()}
+    print(f"recall: {recall}")
+    skip_rate = round(skipped / len(golden), 4)
+    print(f"translation skip rate: {skip_rate}")
+    context = {
+        "mean_tokens": round(context_tokens / len(golden), 1),
+        "mean_tokens_unpacked": round(context_tokens_unpacked / len(golden), 1),
+        "tokens_saved_pct": round(100 * (1 - context_tokens / context_tokens_unpacked), 2) if context_tokens_unpacked else 0.0,
+    }
+    print(f"context: {context}")
+    return {"n_chunks": n_chunks, "n_queries": len(golden), "build": build, "stages": stages, "recall": recall,
+            "translation_skip_rate": skip_rate, "context": context}
+
+
+def compare(current: Dict[str, Any], baseline_path: str, threshold: float) -> int:
+    """Print p50 ratios against a baseline results file; returns the number of regressions."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    baseline_runs = {run["n_chunks"]: run for run in baseline["runs"]}
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (commit {baseline['meta'].get('git_commit')}):")
+    for run in current["runs"]:
+        old = baseline_runs.get(run["n_chunks"])
+        if old is None:
+            continue
+        for stage, stats in run["stages"].items():
+            old_stats = old["stages"].get(stage)
+            if not old_stats or not old_stats["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / old_stats["p50_ms"]
+            flag = "REGRESSION" if ratio > 1 + threshold else ""
+            regressions += bool(flag)
+            print(f"  {run['n_chunks']:>8} {stage:18s} p50 {old_stats['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} ms (x{ratio:.2f}) {flag}")
+        if old["n_queries"] != run["n_queries"]:
+            continue  # different golden sets, recall is not comparable
+        for name, value in run["recall"].items():
+            old_value = old["recall"].get(name)
+            if old_value is not None and value < old_value:
+                regressions += 1
+                print(f"  {run['n_chunks']:>8} recall {name} {old_value} -> {value} REGRESSION")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Offline per-stage RAG pipeline benchmark.",
+        epilog="Run it in the project environment, e.g. `uv run python benchmarks/run_benchmarks.py`.",
+    )
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes in chunks (1k to 1M)")
+    parser.add_argument("--queries", type=int, default=200, help="golden questions per size")
+    parser.add_argument("--memory-queries", type=int, default=20, help="questions used for the tracemalloc pass")
+    parser.add_argument("--top-k", type=int, default=10, help="k for recall of the merged results")
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--words-per-chunk", type=int, default=80)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated latency per LLM call")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency per embeddings call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(ROOT_DIR / "benchmarks" / "results" / "latest.json"))
+    parser.add_argument("--compare", help="baseline results file to compare p50 latency and recall against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative p50 slowdown counted as a regression")
+    args = parser.parse_args(argv)
+    output_path = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Run in a scratch directory: ./chroma_db, ./index_snapshot and ./embedding_cache are relative
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    try:
+        pipeline = Pipeline(args.dim, args.llm_latency_ms, args.embed_latency_ms)
+        runs = [run_size(pipeline, int(size), args) for size in args.sizes.split(",") if size.strip()]
+    finally:
+        os.chdir(ROOT_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "git_commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dense_backend": os.getenv("DENSE_BACKEND", "chroma"),
+            "vector_quantization": os.getenv("VECTOR_QUANTIZATION", "float32"),
+            "args": vars(args),
+        },
+        "runs": runs,
+    }
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if compare_path:
+        return 1 if compare(results, compare_path, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
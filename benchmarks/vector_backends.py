@@ -0,0 +1,217 @@
+"""
+Dense backend benchmark: Chroma (HNSW) vs the flat vector index
+(src/vector_index.py) at float32, float16 and int8, and two-stage
+Matryoshka search (coarse --coarse-dim scan, full-vector rescoring of
+--candidates hits), to pick a backend (DENSE_BACKEND / VECTOR_QUANTIZATION /
+MATRYOSHKA_DIM) per corpus size.
+
+Usage (from the repo root, in the project environment; see benchmarks/README.md):
+    uv run python benchmarks/vector_backends.py --sizes 1000,10000,50000 --queries 200
+
+For each size, clustered synthetic embeddings with text-embedding-3-small's
+dimensionality (1536) are loaded into a fresh Chroma store in a temporary
+directory, and flat snapshots are written next to it; the repo's chroma_db
+is never touched. Their variance decays over the dimensions, so leading
+dimensions carry most of the signal, as in Matryoshka-trained embeddings;
+how well truncation preserves recall on real summaries should still be
+checked on a real corpus before switching. Queries are noisy copies of
+stored vectors, searched in batches of --batch (the original query plus 3
+variations).
+
+Each backend is then measured in its own Python process, reporting:
+- load_ms: opening the store / memory-mapping the snapshot
+- first_ms: first query batch (HNSW or snapshot pages read in)
+- p50_ms, p99_ms: per query batch afterwards
+- rss_mb: resident memory growth from loading and querying
+- index_mb: on-disk size of everything the backend keeps (the chroma
+  store; the flat snapshot; for two-stage, the full snapshot plus the
+  coarse one, about 17% more than single-stage at --coarse-dim 256)
+- scan_mb: bytes read per query batch: the whole flat index, or the coarse
+  index plus at most --candidates full rows per query for two-stage (not
+  measured for chroma, whose HNSW graph visits a data-dependent subset)
+
+Two-stage trades storage for scanning: it stores (and, once warm, pages in)
+both snapshots, but on large corpora reads up to 1536 / --coarse-dim (6x)
+fewer bytes per query than a single-stage scan of the same quantization; on
+small ones the full rows re-scored per query take a bigger share.
+- recall@5: against exact float32 search over the raw embeddings (the
+  single-stage flat-float32 row is that search itself)
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+DIM = 1536
+BACKENDS = ["chroma", "flat-float32", "flat-float16", "flat-int8", "two-stage-float32", "two-stage-int8"]
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux), or peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_embeddings(n: int, n_queries: int, seed: int):
+    """Clustered unit vectors (like summaries of one policy's sections) and noisy queries near them."""
+    rng = np.random.default_rng(seed)
+    decay = (1 / np.sqrt(1 + np.arange(DIM) / 64)).astype(np.float32)  # Matryoshka-like: leading dims dominate
+    centers = rng.normal(size=(max(8, n // 50), DIM)).astype(np.float32) * decay
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.8 * rng.normal(size=(n, DIM)).astype(np.float32) * decay
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(0, n, n_queries)] + 0.04 * rng.normal(size=(n_queries, DIM)).astype(np.float32) * decay
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def prepare(workdir: Path, n: int, args):
+    """Chroma store, flat snapshots, queries and exact top-5 for one corpus size."""
+    import chromadb
+    from vector_index import FlatVectorIndex, QUANTIZATIONS
+
+    vectors, queries = make_embeddings(n, args.queries, args.seed)
+    truth = np.argsort(-(queries @ vectors.T), axis=1, kind="stable")[:, :5]
+    np.save(workdir / "queries.npy", queries)
+    np.save(workdir / "truth.npy", truth)
+
+    collection = chromadb.PersistentClient(path=str(workdir / "chroma_db")).get_or_create_collection(
+        name="vector_store", metadata={"hnsw:space": "cosine"}
+    )
+    for start in range(0, n, 4000):
+        collection.add(
+            ids=[f"c{i}" for i in range(start, min(n, start + 4000))],
+            embeddings=vectors[start:start + 4000].tolist(),
+        )
+    for quantization in QUANTIZATIONS:
+        FlatVectorIndex.build(vectors, quantization).save(str(workdir / f"vectors-{quantization}.bin"))
+        FlatVectorIndex.build(vectors[:, :args.coarse_dim], quantization).save(str(workdir / f"vectors-{quantization}-coarse.bin"))
+
+
+def child(backend: str, workdir: Path, batch: int, candidates: int) -> Dict:
+    """Measure one backend (runs in a fresh process)."""
+    import chromadb
+    from vector_index import FlatVectorIndex, two_stage_search
+
+    queries = np.load(workdir / "queries.npy")
+    truth = np.load(workdir / "truth.npy")
+    baseline_rss = rss_mb()
+
+    started = time.perf_counter()
+    if backend == "chroma":
+        collection = chromadb.PersistentClient(path=str(workdir / "chroma_db")).get_collection("vector_store")
+        index_bytes = sum(f.stat().st_size for f in (workdir / "chroma_db").rglob("*") if f.is_file())
+        scan_bytes = None
+
+        def search(batch_queries: np.ndarray) -> np.ndarray:
+            results = collection.query(query_embeddings=batch_queries.tolist(), n_results=5, include=["distances"])
+            return np.array([[int(chroma_id[1:]) for chroma_id in ids] for ids in results["ids"]])
+    elif backend.startswith("two-stage-"):
+        quantization = backend.rsplit("-", 1)[1]
+        paths = [workdir / f"vectors-{quantization}.bin", workdir / f"vectors-{quantization}-coarse.bin"]
+        full, coarse = (FlatVectorIndex.load(str(path)) for path in paths)
+        index_bytes = sum(path.stat().st_size for path in paths)
+        scan_bytes = coarse.nbytes + batch * min(candidates, len(full)) * full.nbytes // len(full)
+
+        def search(batch_queries: np.ndarray) -> np.ndarray:
+            return two_stage_search(coarse, full, batch_queries, 5, candidates)[0]
+    else:
+        path = workdir / f"vectors-{backend.split('-', 1)[1]}.bin"
+        index = FlatVectorIndex.load(str(path))
+        index_bytes = path.stat().st_size
+        scan_bytes = index.nbytes
+
+        def search(batch_queries: np.ndarray) -> np.ndarray:
+            return index.search(batch_queries, 5)[0]
+    load_ms = (time.perf_counter() - started) * 1000
+
+    latencies, hits = [], 0
+    first_ms = None
+    for start in range(0, len(queries), batch):
+        batch_queries = queries[start:start + batch]
+        started = time.perf_counter()
+        rows = search(batch_queries)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if first_ms is None:
+            first_ms = elapsed_ms
+        else:
+            latencies.append(elapsed_ms)
+        hits += sum(len(set(found) & set(expected)) for found, expected in zip(rows.tolist(), truth[start:start + batch].tolist()))
+
+    return {
+        "load_ms": round(load_ms, 2),
+        "first_ms": round(first_ms, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3) if latencies else None,
+        "rss_mb": round(rss_mb() - baseline_rss, 1),
+        "index_mb": round(index_bytes / 2**20, 1),
+        "scan_mb": round(scan_bytes / 2**20, 1) if scan_bytes is not None else None,
+        "recall@5": round(hits / truth.size, 4),
+    }
+
+
+def run_backend(backend: str, workdir: Path, args) -> Dict:
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", backend, "--workdir", str(workdir), "--batch", str(args.batch),
+         "--candidates", str(args.candidates)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated corpus sizes (default: 1000,10000)")
+    parser.add_argument("--queries", type=int, default=200, help="query embeddings per size (default: 200)")
+    parser.add_argument("--batch", type=int, default=4, help="query embeddings per search call (default: 4)")
+    parser.add_argument("--coarse-dim", type=int, default=256, help="two-stage: dimensions of the coarse index (default: 256)")
+    parser.add_argument("--candidates", type=int, default=64, help="two-stage: coarse hits re-scored per query (default: 64)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(child(args.child, Path(args.workdir), args.batch, args.candidates)))
+        return 0
+
+    report = []
+    for n in [int(size) for size in args.sizes.split(",")]:
+        workdir = Path(tempfile.mkdtemp(prefix="rag-vector-backends-"))
+        try:
+            prepare(workdir, n, args)
+            results = {backend: run_backend(backend, workdir, args) for backend in BACKENDS}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        print(f"\n=== {n} vectors, {DIM}-d, batches of {args.batch} ===")
+        print(f"{'backend':<18}{'load ms':>9}{'first ms':>10}{'p50 ms':>9}{'p99 ms':>9}{'rss MB':>8}{'index MB':>10}{'scan MB':>9}{'recall@5':>10}")
+        for backend, r in results.items():
+            scan_mb = f"{r['scan_mb']:.1f}" if r["scan_mb"] is not None else "-"
+            print(f"{backend:<18}{r['load_ms']:>9.1f}{r['first_ms']:>10.2f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}"
+                  f"{r['rss_mb']:>8.1f}{r['index_mb']:>10.1f}{scan_mb:>9}{r['recall@5']:>10.4f}")
+        report.append({"n_vectors": n, "dim": DIM, "batch": args.batch, "coarse_dim": args.coarse_dim,
+                       "candidates": args.candidates, "backends": results})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,35 @@
 import os
-from openai import OpenAI
-import instructor
-from model.schema import FinalRankedResults, Answer, Citation
+from typing import AsyncIterator, Iterator, Optional, Tuple
+from engine import get_engine
+from model.schema import FinalRankedResults, Answer, Citation, PackedContext
+from context_packer import pack_context, context_text
 from dotenv import load_dotenv
+from tracing import Span, span, start_span, usage_attributes, get_logger
 
 load_dotenv()
 
-# Initialize Instructor client with OpenAI Responses API
-client = instructor.from_provider(
-    "openai/gpt-5-mini",
-    mode=instructor.Mode.RESPONSES_TOOLS
-)
+logger = get_logger(__name__)
 
+# The Instructor client (OpenAI Responses API) comes from the shared engine
 
-def generate_answer(query: str, final_results: FinalRankedResults) -> Answer:
+
+def build_prompt(query: str, final_results: FinalRankedResults, packed: Optional[PackedContext] = None) -> str:
     """
-    Generate a comprehensive answer using retrieved chunks.
+    Build the answer prompt from the top ranked chunks.
     
     Args:
         query: The original user query
         final_results: Top ranked chunks after RRF
-        
-    Returns:
-        Answer object with answer text, citations, and confidence
+        packed: Context already packed from final_results (default: pack it
+            now with the default token budget, see context_packer)
     """
-    print(f"\nGenerating answer for query: {query}")
-    print(f"Using {len(final_results.chunks)} chunks")
-    
-    # Prepare context from chunks
-    context_parts = []
-    for i, chunk in enumerate(final_results.chunks, 1):
-        context_parts.append(
-            f"[Chunk {chunk.chunk_id}] (Pages {chunk.page_start}-{chunk.page_end})\n{chunk.text}\n"
-        )
-    
-    context = "\n".join(context_parts)
+    # Prepare context: overlapping chunks merged, within the token budget
+    if packed is None:
+        packed = pack_context(final_results.chunks)
+    context = context_text(packed)
     
     # Create prompt
-    prompt = f"""You are an expert insurance policy assistant. Answer the user's query based ONLY on the provided context from the insurance policy document.
+    return f"""You are an expert insurance policy assistant. Answer the user's query based ONLY on the provided context from the insurance policy document.
 
 CONTEXT:
 {context}
@@ -47,7 +39,7 @@ QUERY: {query}
 INSTRUCTIONS:
 1. Provide a clear, brief, informative answer based on the context unless the question asks to explain in detail.
 2. Use specific details from the chunks.
-3. Add inline citations immediately after the claim they support using the format [Chunk <chunk_id>, p.<page_start>-<page_end>].
+3. Add inline citations immediately after the claim they support using the format [<doc_id>, Chunk <chunk_id>, p.<page_start>-<page_end>], with the doc_id from the passage label (chunk ids repeat across documents). A passage labelled with several chunks is consecutive chunks merged; cite the chunk_id the claim comes from. Set doc_id on every structured citation too.
 4. If the context doesn't fully answer the query, acknowledge the limitations. If the question is unrelated to the policy or you do not know the answer from the context, say so plainly and DO NOT include any citations.
 5. Set confidence level:
    - "high": Query is fully answered with clear information
@@ -56,16 +48,159 @@ INSTRUCTIONS:
 6. If the question is not related to the context, acknowledge that you are an insurance policy assistant and you can only answer questions related to the insurance policy document and politely decline to answer or say you don't know. In that case, do not provide citations.
 Return your answer in the structured format with citations."""
 
+
+def generate_answer(query: str, final_results: FinalRankedResults) -> Answer:
+    """
+    Generate a comprehensive answer using retrieved chunks.
+    
+    Args:
+        query: The original user query
+        final_results: Top ranked chunks after RRF
+        
+    Returns:
+        Answer object with answer text, citations, and confidence
+    """
+    logger.info(f"Generating answer for query: {query}")
+    logger.info(f"Using {len(final_results.chunks)} chunks")
+    
+    packed = pack_context(final_results.chunks)
+    prompt = build_prompt(query, final_results, packed)
+
     # Generate structured answer using instructor
-    answer = client.responses.create(
-        input=prompt,
-        response_model=Answer
-    )
+    with span("generate_answer", model="gpt-5-mini", chunks=len(final_results.chunks),
+              context_tokens=packed.tokens, context_tokens_saved=packed.tokens_saved) as s:
+        answer, completion = get_engine().instructor_client.responses.create_with_completion(
+            input=prompt,
+            response_model=Answer
+        )
+        s.set(citations=len(answer.citations), confidence=answer.confidence, **usage_attributes(completion))
     
-    print(f"Answer generated with {len(answer.citations)} citations")
-    print(f"Confidence: {answer.confidence}")
+    logger.info(f"Answer generated with {len(answer.citations)} citations")
+    logger.info(f"Confidence: {answer.confidence}")
+    
+    return answer
+
+
+async def generate_answer_async(query: str, final_results: FinalRankedResults) -> Answer:
+    """generate_answer with the async Instructor client (cancellable)."""
+    packed = pack_context(final_results.chunks)
+    prompt = build_prompt(query, final_results, packed)
+    with span("generate_answer", model="gpt-5-mini", chunks=len(final_results.chunks),
+              context_tokens=packed.tokens, context_tokens_saved=packed.tokens_saved) as s:
+        answer, completion = await get_engine().async_instructor_client.responses.create_with_completion(
+            input=prompt,
+            response_model=Answer
+        )
+        s.set(citations=len(answer.citations), confidence=answer.confidence, **usage_attributes(completion))
     
+    logger.info(f"Answer generated with {len(answer.citations)} citations")
     return answer
 
 
+class AnswerStream:
+    """
+    Streaming answer generation.
+    
+    Iterate text_deltas() to receive answer.answer as it is generated (e.g.
+    with st.write_stream), or text_deltas_async() from asyncio code (the
+    HTTP service). Once the stream is exhausted, `answer` holds the
+    validated Answer with its final citations and confidence, and `context`
+    the PackedContext the prompt was built from.
+    """
+    
+    def __init__(self, query: str, final_results: FinalRankedResults):
+        self.query = query
+        self.final_results = final_results
+        self.answer: Optional[Answer] = None
+        self.context: Optional[PackedContext] = None
+    
+    def _start(self) -> Tuple[str, Span]:
+        """Build the prompt and start the stream's span."""
+        logger.info(f"Streaming answer for query: {self.query}")
+        logger.info(f"Using {len(self.final_results.chunks)} chunks")
+        
+        # Not a context manager: the span must not become current in the consumer's context between yields
+        self.context = pack_context(self.final_results.chunks)
+        prompt = build_prompt(self.query, self.final_results, self.context)
+        s = start_span("generate_answer", model="gpt-5-mini", streaming=True, chunks=len(self.final_results.chunks),
+                       input_tokens_estimated=len(prompt) // 4, context_tokens=self.context.tokens,
+                       context_tokens_saved=self.context.tokens_saved)
+        return prompt, s
+    
+    def _finish(self, s: Span, last: Optional[Answer]):
+        """Fields are final once the stream ends; validate into a full Answer."""
+        self.answer = Answer.model_validate(last.model_dump()) if last is not None else None
+        if self.answer is not None:
+            s.set(citations=len(self.answer.citations), confidence=self.answer.confidence,
+                  output_tokens_estimated=len(self.answer.answer) // 4)
+            logger.info(f"Answer generated with {len(self.answer.citations)} citations")
+            logger.info(f"Confidence: {self.answer.confidence}")
+    
+    def partials(self) -> Iterator[Answer]:
+        """Yield progressively more complete partial Answer objects."""
+        prompt, s = self._start()
+        last = None
+        try:
+            for partial in get_engine().instructor_client.responses.create_partial(
+                input=prompt,
+                response_model=Answer
+            ):
+                if last is None:
+                    s.set(first_token_ms=round(s.elapsed_ms(), 1))
+                last = partial
+                yield partial
+            self._finish(s, last)
+        except GeneratorExit:
+            s.set(abandoned=True)  # consumer stopped reading early
+            raise
+        except BaseException as e:
+            s.fail(e)
+            raise
+        finally:
+            s.end()
+    
+    async def partials_async(self) -> AsyncIterator[Answer]:
+        """Async partials(); cancelling the consuming task aborts the model request."""
+        prompt, s = self._start()
+        last = None
+        try:
+            async for partial in get_engine().async_instructor_client.responses.create_partial(
+                input=prompt,
+                response_model=Answer
+            ):
+                if last is None:
+                    s.set(first_token_ms=round(s.elapsed_ms(), 1))
+                last = partial
+                yield partial
+            self._finish(s, last)
+        except GeneratorExit:
+            s.set(abandoned=True)
+            raise
+        except BaseException as e:
+            s.fail(e)
+            raise
+        finally:
+            s.end()
+    
+    def text_deltas(self) -> Iterator[str]:
+        """Yield only the newly generated part of the answer text."""
+        emitted = 0
+        for partial in self.partials():
+            text = partial.answer or ""
+            if len(text) > emitted:
+                yield text[emitted:]
+                emitted = len(text)
+    
+    async def text_deltas_async(self) -> AsyncIterator[str]:
+        """Async text_deltas()."""
+        emitted = 0
+        async for partial in self.partials_async():
+            text = partial.answer or ""
+            if len(text) > emitted:
+                yield text[emitted:]
+                emitted = len(text)
+
 
+def generate_answer_stream(query: str, final_results: FinalRankedResults) -> AnswerStream:
+    """Streaming counterpart of generate_answer (see AnswerStream)."""
+    return AnswerStream(query, final_results)
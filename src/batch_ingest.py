@@ -0,0 +1,224 @@
+"""
+Batch ingestion of many documents with resumable checkpoints.
+
+Usage (from the repo root):
+    python src/batch_ingest.py doc_a doc_b
+    python src/batch_ingest.py --manifest doc_ids.txt
+    python src/batch_ingest.py --prefix documents/ --workers 4 --parse
+
+Each document goes through two stages:
+1. parsed   - markdown.md + page_map.json exist in R2 (with --parse, missing
+              ones are produced from documents/{doc_id}/original.pdf)
+2. ingested - chunks summarized, embedded and stored (ingest_pipeline);
+              not recorded while any chunk's summary failed, so the next
+              run retries those chunks (the others are skipped as unchanged)
+
+Completed stages are recorded per document in a JSON checkpoint file, so a
+crashed or interrupted run picks up where it stopped. All workers share one
+rate-limited scheduler, so the OpenAI limits hold across documents, and the
+index snapshots are rebuilt once at the end of the run (also when an earlier
+run stored chunks but crashed before writing them).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+from r2.r2_client import download_parsed_files, list_doc_ids, parsed_files_exist, parse_pdf, upload_parsed_files
+from ingest_pipeline import ingest_document
+from engine import get_engine
+from index_store import write_indexes, load_or_build_indexes
+from rate_limit import RateLimitedScheduler
+from tracing import configure_logging, get_logger
+
+DEFAULT_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", "./ingest_checkpoint.json")
+
+logger = get_logger(__name__)
+
+
+class Checkpoint:
+    """Per-document stage completion, persisted (atomically) after every update."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.docs = json.load(f)
+        self._lock = asyncio.Lock()
+
+    def done(self, doc_id: str, stage: str) -> bool:
+        return stage in self.docs.get(doc_id, {}).get("stages", {})
+
+    async def mark(self, doc_id: str, stage: str, **info):
+        async with self._lock:
+            entry = self.docs.setdefault(doc_id, {"stages": {}})
+            entry["stages"][stage] = time.time()
+            entry.pop("error", None)
+            entry.update(info)
+            self._save()
+
+    async def fail(self, doc_id: str, error: Exception):
+        async with self._lock:
+            entry = self.docs.setdefault(doc_id, {"stages": {}})
+            entry["error"] = f"{type(error).__name__}: {error}"
+            self._save()
+
+    def reset(self, doc_id: str):
+        self.docs.pop(doc_id, None)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.docs, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def read_manifest(path: str) -> List[str]:
+    """doc_ids from a JSON list or a text file with one doc_id per line (# comments allowed)."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return [str(doc_id) for doc_id in json.loads(content)]
+    lines = (line.split("#", 1)[0].strip() for line in content.splitlines())
+    return [line for line in lines if line]
+
+
+async def process_document(doc_id: str, checkpoint: Checkpoint, scheduler: RateLimitedScheduler, parse: bool) -> Dict[str, Any]:
+    """Run the remaining stages for one document and record each one."""
+    # Stage 1: parsed markdown + page_map in R2
+    if not checkpoint.done(doc_id, "parsed"):
+        if not await asyncio.to_thread(parsed_files_exist, doc_id):
+            if not parse:
+                raise FileNotFoundError(f"no parsed files for {doc_id} in R2 (run with --parse)")
+            logger.info(f"Parsing {doc_id}...")
+            markdown_text, page_map = await asyncio.to_thread(parse_pdf, doc_id)
+            await asyncio.to_thread(upload_parsed_files, doc_id, markdown_text, page_map)
+        await checkpoint.mark(doc_id, "parsed")
+
+    # Stage 2: chunks summarized, embedded and stored
+    if not checkpoint.done(doc_id, "ingested"):
+        markdown_text, page_map = await asyncio.to_thread(download_parsed_files, doc_id)
+        stats = await ingest_document(doc_id, markdown_text, page_map, scheduler=scheduler, write_snapshots=False)
+        if stats["failed"]:
+            # Not marked ingested: the next run retries the failed chunks
+            await checkpoint.fail(doc_id, RuntimeError(f"{stats['failed']} of {stats['total']} chunk summaries failed"))
+        else:
+            await checkpoint.mark(doc_id, "ingested", pages=len(page_map), chunks=stats["total"], stats=stats)
+        return {"pages": len(page_map), "chunks": stats["total"], "changed": stats["changed"],
+                "failed_chunks": stats["failed"], "skipped": False}
+
+    entry = checkpoint.docs[doc_id]
+    return {"pages": entry.get("pages", 0), "chunks": entry.get("chunks", 0), "changed": 0, "failed_chunks": 0, "skipped": True}
+
+
+async def run_batch(doc_ids: List[str], workers: int, checkpoint_path: str, parse: bool = False, force: bool = False) -> Dict[str, Any]:
+    """
+    Ingest doc_ids across a pool of concurrent workers.
+
+    Returns:
+        Summary with processed/skipped/failed/incomplete doc counts (incomplete:
+        ingested, but some chunks failed and are retried on the next run) and
+        docs, pages and chunks per minute for the documents processed in this run
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    if force:
+        for doc_id in doc_ids:
+            checkpoint.reset(doc_id)
+    scheduler = RateLimitedScheduler(name="Summaries")
+    queue: asyncio.Queue = asyncio.Queue()
+    for doc_id in dict.fromkeys(doc_ids):  # drop duplicates, keep order
+        queue.put_nowait(doc_id)
+    total = queue.qsize()
+
+    summary = {"docs": 0, "skipped": 0, "failed": 0, "incomplete": 0, "pages": 0, "chunks": 0, "changed": 0}
+    failures: Dict[str, str] = {}
+    started = time.monotonic()
+
+    async def worker():
+        while True:
+            try:
+                doc_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await process_document(doc_id, checkpoint, scheduler, parse)
+            except Exception as e:  # one bad document must not stop the batch
+                summary["failed"] += 1
+                failures[doc_id] = f"{type(e).__name__}: {e}"
+                await checkpoint.fail(doc_id, e)
+                logger.warning(f"{doc_id} failed: {failures[doc_id]}")
+                continue
+            if result["skipped"]:
+                summary["skipped"] += 1
+                continue
+            summary["docs"] += 1
+            summary["pages"] += result["pages"]
+            summary["chunks"] += result["chunks"]
+            summary["changed"] += result["changed"]
+            if result["failed_chunks"]:
+                summary["incomplete"] += 1
+                failures[doc_id] = f"{result['failed_chunks']} chunks failed (retried on the next run)"
+            finished = summary["docs"] + summary["skipped"] + summary["failed"]
+            logger.info(f"[{finished}/{total}] {doc_id}: {result['pages']} pages, {result['chunks']} chunks")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, total)))))
+
+    # Snapshots are rebuilt once for the whole batch. Without changes in this run they
+    # are still rebuilt if they don't match the collection (a crashed run's upserts)
+    collection = get_engine().collection
+    if summary["changed"]:
+        write_indexes(collection)
+    elif collection.count():
+        load_or_build_indexes(collection)
+
+    elapsed_min = max(time.monotonic() - started, 1e-9) / 60
+    summary.update({
+        "elapsed_s": round(elapsed_min * 60, 1),
+        "docs_per_min": round(summary["docs"] / elapsed_min, 2),
+        "pages_per_min": round(summary["pages"] / elapsed_min, 2),
+        "chunks_per_min": round(summary["chunks"] / elapsed_min, 2),
+        "failures": failures,
+    })
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest many documents into the vector store.")
+    parser.add_argument("doc_ids", nargs="*", help="doc_ids to ingest")
+    parser.add_argument("--manifest", help="file with doc_ids (JSON list or one per line)")
+    parser.add_argument("--prefix", help="ingest every document under this R2 prefix (e.g. documents/)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "4")), help="documents processed concurrently")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="checkpoint file used to resume")
+    parser.add_argument("--parse", action="store_true", help="parse PDFs whose markdown/page_map are missing in R2")
+    parser.add_argument("--force", action="store_true", help="ignore the checkpoint and redo every stage")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    doc_ids = list(args.doc_ids)
+    if args.manifest:
+        doc_ids += read_manifest(args.manifest)
+    if args.prefix:
+        doc_ids += list_doc_ids(args.prefix)
+    if not doc_ids:
+        parser.error("no documents: pass doc_ids, --manifest or --prefix")
+
+    summary = asyncio.run(run_batch(doc_ids, args.workers, args.checkpoint, parse=args.parse, force=args.force))
+    print(
+        f"\nBatch complete in {summary['elapsed_s']}s: {summary['docs']} docs ingested, "
+        f"{summary['skipped']} already done, {summary['failed']} failed, {summary['incomplete']} incomplete"
+    )
+    print(
+        f"Throughput: {summary['docs_per_min']} docs/min, {summary['pages_per_min']} pages/min, "
+        f"{summary['chunks_per_min']} chunks/min"
+    )
+    for doc_id, error in summary["failures"].items():
+        print(f"  {doc_id}: {error}")
+    return 1 if summary["failed"] or summary["incomplete"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Inverted-index BM25 (Okapi) for sparse retrieval.
+
+Scores match rank_bm25.BM25Okapi exactly (same idf with epsilon floor, same
+k1/b normalisation, same float64 arithmetic order), but a query only touches
+the postings of its own terms instead of scoring the whole corpus, and top-k
+is selected with np.partition instead of a full sort.
+
+Postings are stored CSR-style in flat NumPy arrays:
+    term_offsets[t]:term_offsets[t+1] -> slice of postings_docs / postings_tfs
+
+The index can be persisted as a versioned snapshot (written at ingestion
+time) and memory-mapped on load, so retrieval never has to pull the corpus
+out of Chroma and re-tokenize it at startup (see index_store).
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from snapshot_io import write_arrays, read_arrays, encode_lines, decode_lines
+
+SNAPSHOT_MAGIC = b"BM25SNAP"
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizer shared by indexing and querying."""
+    return text.lower().split()
+
+
+class BM25Index:
+    def __init__(
+        self,
+        vocab: Dict[str, int],
+        idf: np.ndarray,
+        term_offsets: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_tfs: np.ndarray,
+        doc_len: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+        doc_ids: Optional[List[str]] = None,
+        version: str = "",
+    ):
+        self.vocab = vocab
+        self.idf = idf
+        self.term_offsets = term_offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = doc_ids or []  # Chroma id of each document row
+        self.version = version  # collection version this index was built from
+        self.corpus_size = len(doc_len)
+        self.avgdl = int(doc_len.sum()) / self.corpus_size if self.corpus_size else 0.0
+        # Per-document length normalisation, computed once (same expression as rank_bm25)
+        self.norm = self.k1 * (1 - self.b + self.b * doc_len.astype(np.int64) / self.avgdl) if self.corpus_size else np.zeros(0)
+
+    @classmethod
+    def build(
+        cls,
+        tokenized_corpus: List[List[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+        doc_ids: Optional[List[str]] = None,
+        version: str = "",
+    ) -> "BM25Index":
+        """Build postings and idf from a tokenized corpus (one token list per chunk)."""
+        vocab: Dict[str, int] = {}
+        postings: List[List[Tuple[int, int]]] = []
+        doc_len = np.zeros(len(tokenized_corpus), dtype=np.int32)
+
+        for doc_idx, tokens in enumerate(tokenized_corpus):
+            doc_len[doc_idx] = len(tokens)
+            frequencies: Dict[str, int] = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, tf in frequencies.items():
+                term_id = vocab.setdefault(token, len(vocab))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc_idx, tf))
+
+        # idf with rank_bm25's epsilon floor for very common terms
+        corpus_size = len(tokenized_corpus)
+        idf = np.zeros(len(vocab), dtype=np.float64)
+        idf_sum = 0.0
+        negative = []
+        for term_id, plist in enumerate(postings):  # vocab order == rank_bm25's nd order
+            value = math.log(corpus_size - len(plist) + 0.5) - math.log(len(plist) + 0.5)
+            idf[term_id] = value
+            idf_sum += value
+            if value < 0:
+                negative.append(term_id)
+        if len(vocab):
+            idf[negative] = epsilon * (idf_sum / len(vocab))
+
+        # Flatten postings into CSR arrays
+        term_offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(plist) for plist in postings])
+        postings_docs = np.fromiter((d for plist in postings for d, _ in plist), dtype=np.int32, count=int(term_offsets[-1]))
+        postings_tfs = np.fromiter((tf for plist in postings for _, tf in plist), dtype=np.int32, count=int(term_offsets[-1]))
+
+        return cls(vocab, idf, term_offsets, postings_docs, postings_tfs, doc_len, k1=k1, b=b, doc_ids=doc_ids, version=version)
+
+    def __len__(self) -> int:
+        return self.corpus_size
+
+    def _score_touched(self, query_tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores for documents containing at least one query term: (doc indices, scores)."""
+        doc_parts = []
+        score_parts = []
+        for token in query_tokens:  # duplicates count twice, as in rank_bm25
+            term_id = self.vocab.get(token)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end]
+            doc_parts.append(docs)
+            score_parts.append(self.idf[term_id] * (tfs * (self.k1 + 1) / (tfs + self.norm[docs])))
+
+        if not doc_parts:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+
+        # Accumulate per document in query-term order (unbuffered, like score += ...)
+        touched, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.zeros(len(touched), dtype=np.float64)
+        np.add.at(scores, inverse, np.concatenate(score_parts))
+        return touched, scores
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        """Dense score vector over the whole corpus (BM25Okapi.get_scores equivalent)."""
+        scores = np.zeros(self.corpus_size, dtype=np.float64)
+        touched, touched_scores = self._score_touched(query_tokens)
+        scores[touched] = touched_scores
+        return scores
+
+    def top_k(self, query_tokens: List[str], k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Top-k (doc index, score) pairs, ordered by score desc then doc index asc.
+
+        Produces the same ranking as a stable descending sort of get_scores().
+        """
+        k = min(k, self.corpus_size)
+        if k <= 0:
+            return []
+        all_touched, scores = self._score_touched(query_tokens)
+        touched = all_touched
+
+        # Keep every candidate tied with the k-th best score, then order exactly
+        if len(scores) > k:
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = scores >= threshold
+            touched, scores = touched[keep], scores[keep]
+        order = np.lexsort((touched, -scores))[:k]
+        candidates = [(float(scores[i]), int(touched[i])) for i in order]
+
+        # Documents without any query term score 0; they fill remaining slots,
+        # outrank negative scores and tie with zero scores in doc index order
+        if len(candidates) < k or candidates[-1][0] <= 0:
+            touched_set = set(all_touched.tolist())
+            zeros = []
+            doc_idx = 0
+            while len(zeros) < k and doc_idx < self.corpus_size:
+                if doc_idx not in touched_set:
+                    zeros.append((0.0, doc_idx))
+                doc_idx += 1
+            candidates = sorted(candidates + zeros, key=lambda c: (-c[0], c[1]))[:k]
+
+        return [(doc_idx, score) for score, doc_idx in candidates]
+
+    # SNAPSHOT PERSISTENCE (see snapshot_io for the file layout)
+
+    def save(self, path: str):
+        """Write the index to a versioned snapshot file (atomically)."""
+        write_arrays(
+            path,
+            SNAPSHOT_MAGIC,
+            {"format_version": SNAPSHOT_FORMAT_VERSION, "version": self.version, "k1": self.k1, "b": self.b},
+            {
+                "idf": self.idf,
+                "term_offsets": self.term_offsets,
+                "postings_docs": self.postings_docs,
+                "postings_tfs": self.postings_tfs,
+                "doc_len": self.doc_len,
+                "vocab": encode_lines(list(self.vocab)),  # tokens never contain whitespace
+                "doc_ids": encode_lines(self.doc_ids),
+            },
+        )
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = True) -> Optional["BM25Index"]:
+        """Load a snapshot (memory-mapped by default). Returns None if missing or incompatible."""
+        snapshot = read_arrays(path, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, use_mmap=use_mmap)
+        if snapshot is None:
+            return None
+        header, arrays = snapshot
+
+        return cls(
+            {term: term_id for term_id, term in enumerate(decode_lines(arrays["vocab"]))},
+            arrays["idf"],
+            arrays["term_offsets"],
+            arrays["postings_docs"],
+            arrays["postings_tfs"],
+            arrays["doc_len"],
+            k1=header["k1"],
+            b=header["b"],
+            doc_ids=decode_lines(arrays["doc_ids"]),
+            version=header["version"],
+        )
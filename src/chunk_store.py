@@ -0,0 +1,115 @@
+"""
+Columnar in-memory chunk store.
+
+Holds everything the query path needs per chunk (text, summary, page range,
+offsets) in flat arrays, one row per Chroma id, so dense, sparse and fusion
+stages resolve chunks without any per-chunk ChromaDB access. Each chunk's
+text and summary live exactly once, in a UTF-8 blob addressed by byte
+offsets; the snapshot can be memory-mapped so the blob is paged in lazily.
+
+Row order matches the BM25 index built alongside it (see index_store), so a
+BM25 document index is also a chunk store row.
+"""
+from typing import Dict, List, Optional
+import numpy as np
+from snapshot_io import write_arrays, read_arrays, encode_lines, decode_lines, encode_texts
+
+SNAPSHOT_MAGIC = b"CHUNKSTO"
+SNAPSHOT_FORMAT_VERSION = 2
+
+INT_COLUMNS = ["chunk_id", "page_start", "page_end", "start_offset", "end_offset"]
+
+
+class ChunkStore:
+    def __init__(
+        self,
+        ids: List[str],
+        doc_ids: List[str],
+        columns: Dict[str, np.ndarray],
+        text_blob: np.ndarray,
+        text_offsets: np.ndarray,
+        summary_blob: np.ndarray,
+        summary_offsets: np.ndarray,
+        version: str = "",
+    ):
+        self.ids = ids
+        self.doc_ids = doc_ids
+        self.columns = columns
+        self.text_blob = text_blob
+        self.text_offsets = text_offsets
+        self.summary_blob = summary_blob
+        self.summary_offsets = summary_offsets
+        self.version = version
+        self.row_by_id = {chroma_id: row for row, chroma_id in enumerate(ids)}
+        self.row_by_chunk_id = {(doc_ids[row], int(chunk_id)): row for row, chunk_id in enumerate(columns["chunk_id"])}
+
+    @classmethod
+    def from_metadatas(cls, ids: List[str], metadatas: List[dict], version: str = "") -> "ChunkStore":
+        """Build the store from Chroma ids + metadata rows (as written by embed_and_store)."""
+        columns = {
+            name: np.array([metadata[name] for metadata in metadatas], dtype=np.int64)
+            for name in INT_COLUMNS
+        }
+        text_blob, text_offsets = encode_texts([metadata["text"] for metadata in metadatas])
+        summary_blob, summary_offsets = encode_texts([metadata.get("chunk_summary", "") for metadata in metadatas])
+        doc_ids = [metadata.get("doc_id", "") for metadata in metadatas]
+        return cls(ids, doc_ids, columns, text_blob, text_offsets, summary_blob, summary_offsets, version=version)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, chroma_id: str) -> int:
+        return self.row_by_id[chroma_id]
+
+    def row_for_chunk_id(self, chunk_id: int, doc_id: str = "") -> Optional[int]:
+        """Row of a chunk by (doc_id, chunk_id); chunk_ids are only unique within a document."""
+        return self.row_by_chunk_id.get((doc_id, chunk_id))
+
+    def text(self, row: int) -> str:
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return self.text_blob[start:end].tobytes().decode("utf-8")
+
+    def summary(self, row: int) -> str:
+        start, end = self.summary_offsets[row], self.summary_offsets[row + 1]
+        return self.summary_blob[start:end].tobytes().decode("utf-8")
+
+    def get(self, row: int, name: str) -> int:
+        """Integer column value (chunk_id, page_start, page_end, start_offset, end_offset)."""
+        return int(self.columns[name][row])
+
+    def save(self, path: str):
+        """Write the store to a versioned snapshot file (atomically)."""
+        write_arrays(
+            path,
+            SNAPSHOT_MAGIC,
+            {"format_version": SNAPSHOT_FORMAT_VERSION, "version": self.version},
+            {
+                **self.columns,
+                "ids": encode_lines(self.ids),
+                "doc_ids": encode_lines(self.doc_ids),
+                "text_blob": self.text_blob,
+                "text_offsets": self.text_offsets,
+                "summary_blob": self.summary_blob,
+                "summary_offsets": self.summary_offsets,
+            },
+        )
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = True) -> Optional["ChunkStore"]:
+        """Load a snapshot (memory-mapped by default). Returns None if missing or incompatible."""
+        snapshot = read_arrays(path, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, use_mmap=use_mmap)
+        if snapshot is None:
+            return None
+        header, arrays = snapshot
+        ids = decode_lines(arrays["ids"])
+
+        return cls(
+            ids,
+            decode_lines(arrays["doc_ids"]) or [""] * len(ids),  # a single empty doc_id encodes to nothing
+            {name: arrays[name] for name in INT_COLUMNS},
+            arrays["text_blob"],
+            arrays["text_offsets"],
+            arrays["summary_blob"],
+            arrays["summary_offsets"],
+            version=header["version"],
+        )
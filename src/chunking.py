@@ -1,20 +1,80 @@
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
 import os
-import asyncio
-from openai import AsyncOpenAI
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from dotenv import load_dotenv
 from model.schema import Chunk
+from engine import get_engine
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from rate_limit import RateLimitedScheduler
+from tracing import span, usage_attributes, get_logger
 
 load_dotenv()
 
-# Initialize OpenAI async client
-openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = get_logger(__name__)
+
+# The async OpenAI client comes from the shared engine (see engine.py)
+
+SUMMARY_OUTPUT_TOKENS = 150  # budgeted per summary call for the TPM limiter
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Optional parallel splitting of large documents by page group
+SPLIT_WORKERS = int(os.getenv("CHUNK_SPLIT_WORKERS", "1"))
+SPLIT_PAGES_PER_GROUP = int(os.getenv("CHUNK_SPLIT_PAGES_PER_GROUP", "50"))
 
 
 async def chunking_markdown(markdown_text, page_map) -> List[Chunk]:
-    CHUNK_SIZE = 1000
-    CHUNK_OVERLAP = 200
+    """Split markdown into page-mapped chunks and summarize every chunk."""
+    chunks = split_markdown(markdown_text, page_map)
+    
+    # Generate summaries for all texts (rate-limited, bounded concurrency)
+    summaries = await generate_summaries([chunk.text for chunk in chunks])
+    for chunk, summary in zip(chunks, summaries):
+        chunk.chunk_summary = summary or ""
+    
+    # Chunks whose summary failed can't be embedded; leave them for a re-run
+    failed = [chunk.chunk_id for chunk in chunks if not chunk.chunk_summary]
+    if failed:
+        logger.warning(f"dropping {len(failed)} chunks without summaries: {failed}")
+    return [chunk for chunk in chunks if chunk.chunk_summary]
+
+
+class PageIndex:
+    """
+    Sorted interval index over a page_map, built once per document.
+
+    Maps character offsets to page numbers with a binary search
+    (np.searchsorted) instead of scanning every page per chunk. Accepts
+    page_map keys as ints (parse_pdf) or strings (page_map.json).
+    """
+    def __init__(self, page_map: Dict[Any, Dict[str, Any]]):
+        if not page_map:
+            raise ValueError("page_map is empty")
+        by_key = [page_map[key] for key in sorted(page_map, key=int)]
+        # Fallbacks: first page for an unmatched chunk start, last page for an unmatched chunk end
+        self.first_page = int(by_key[0]["page"])
+        self.last_page = int(by_key[-1]["page"])
+        
+        # Page intervals don't overlap, so sorted by start their ends are sorted too
+        entries = sorted(by_key, key=lambda info: (int(info["start_offset"]), int(info["end_offset"])))
+        self.starts = np.array([int(info["start_offset"]) for info in entries], dtype=np.int64)
+        self.ends = np.array([int(info["end_offset"]) for info in entries], dtype=np.int64)
+        self.pages = np.array([int(info["page"]) for info in entries], dtype=np.int64)
+    
+    def lookup(self, offsets: np.ndarray, fallback: int) -> np.ndarray:
+        """Page containing each offset (first page whose end is >= offset), or fallback if none."""
+        offsets = np.asarray(offsets, dtype=np.int64)
+        idx = np.searchsorted(self.ends, offsets, side="left")
+        clipped = np.minimum(idx, len(self.ends) - 1)
+        hit = (idx < len(self.ends)) & (self.starts[clipped] <= offsets)
+        return np.where(hit, self.pages[clipped], fallback)
+
+
+def _split_text(segment: Tuple[str, int]) -> List[Tuple[str, int]]:
+    """Split one segment; returns (chunk_text, start_offset in the full document) pairs."""
+    text, base_offset = segment
     
     # Use create_documents with add_start_index=True to get offsets
     splitter = RecursiveCharacterTextSplitter(
@@ -25,59 +85,67 @@ async def chunking_markdown(markdown_text, page_map) -> List[Chunk]:
     )
     
     # create_documents returns Document objects with metadata['start_index']
-    doc_objs = splitter.create_documents([markdown_text])
+    doc_objs = splitter.create_documents([text])
+    return [(doc.page_content, base_offset + doc.metadata.get("start_index", 0)) for doc in doc_objs]
+
+
+def _page_group_segments(markdown_text: str, page_index: PageIndex, pages_per_group: int) -> List[Tuple[str, int]]:
+    """Cut the document every pages_per_group pages, snapped back to the nearest paragraph break."""
+    cuts = [0]
+    for page_start in page_index.starts[pages_per_group::pages_per_group]:
+        page_start = int(page_start)
+        if page_start >= len(markdown_text):
+            break
+        cut = markdown_text.rfind("\n\n", cuts[-1] + 1, page_start + 1)
+        if cut <= cuts[-1]:
+            cut = page_start
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(len(markdown_text))
+    return [(markdown_text[start:end], start) for start, end in zip(cuts, cuts[1:])]
+
+
+def split_markdown(markdown_text, page_map, workers: Optional[int] = None) -> List[Chunk]:
+    """
+    Split markdown into page-mapped chunks (no summaries yet).
     
-    # Extract texts for summary generation
-    texts = [doc.page_content for doc in doc_objs]
+    Args:
+        markdown_text: Parsed markdown of the whole document
+        page_map: Page -> offsets mapping (int or str keys)
+        workers: Split groups of SPLIT_PAGES_PER_GROUP pages in this many
+            processes (default: $CHUNK_SPLIT_WORKERS, 1 = single pass). Chunks
+            never span a group boundary, so boundaries near the cuts differ
+            from a single-pass split.
+    """
+    page_index = PageIndex(page_map)
+    workers = SPLIT_WORKERS if workers is None else workers
     
-    # Generate summaries for all texts in parallel
-    summaries = await generate_summaries(texts)
+    segments = [(markdown_text, 0)]
+    if workers > 1:
+        segments = _page_group_segments(markdown_text, page_index, SPLIT_PAGES_PER_GROUP)
+    if len(segments) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(segments))) as pool:
+            pieces = [piece for part in pool.map(_split_text, segments) for piece in part]
+    else:
+        pieces = _split_text(segments[0])
     
-    chunks = []
+    # Page lookups for all chunks at once
+    start_offsets = np.array([start for _, start in pieces], dtype=np.int64)
+    end_offsets = start_offsets + np.array([len(text) for text, _ in pieces], dtype=np.int64) - 1
+    page_starts = page_index.lookup(start_offsets, page_index.first_page)
+    page_ends = page_index.lookup(end_offsets, page_index.last_page)
     
-    for chunk_id, (doc, summary) in enumerate(zip(doc_objs, summaries), start=1):
-        chunk_text = doc.page_content
-        start_offset = doc.metadata.get("start_index", 0)
-        end_offset = start_offset + len(chunk_text) - 1
-        
-        # Find page_start: which page contains start_offset
-        page_start = None
-        for page_idx, page_info in page_map.items():
-            if page_info["start_offset"] <= start_offset <= page_info["end_offset"]:
-                page_start = page_info["page"]
-                break
-        
-        # Find page_end: which page contains end_offset
-        page_end = None
-        for page_idx, page_info in page_map.items():
-            if page_info["start_offset"] <= end_offset <= page_info["end_offset"]:
-                page_end = page_info["page"]
-                break
-        
-        # Fallback if not found
-        if page_start is None:
-            page_start = page_map["0"]["page"]
-        
-        if page_end is None:
-            # Find the last page_map entry
-            last_key = "0"
-            for page_idx in page_map.keys():
-                if int(page_idx) > int(last_key):
-                    last_key = page_idx
-            page_end = page_map[last_key]["page"]
-        
-        # Create Chunk object with summary
-        chunk = Chunk(
-            chunk_id=chunk_id,
+    # Create Chunk objects (summary is filled in later)
+    chunks = []
+    for i, (chunk_text, _) in enumerate(pieces):
+        chunks.append(Chunk(
+            chunk_id=i + 1,
             text=chunk_text,
-            start_offset=start_offset,
-            end_offset=end_offset,
-            page_start=page_start,
-            page_end=page_end,
-            chunk_summary=summary
-        )
-        chunks.append(chunk)
-    
+            start_offset=int(start_offsets[i]),
+            end_offset=int(end_offsets[i]),
+            page_start=int(page_starts[i]),
+            page_end=int(page_ends[i])
+        ))
     return chunks
 
 
@@ -86,26 +154,32 @@ async def summarize_single_text(text: str) -> str:
     prompt = "Write 2 sentences summarizing the main information in this text that would help answer user questions."
     input_text = f"{prompt}\n\nText: {text}"
     
-    response = await openai_client.responses.create(
-        model="gpt-5-mini",
-        input=input_text
-    )
+    with span("openai.summary", model="gpt-5-mini") as s:
+        response = await get_engine().async_openai_client.responses.create(
+            model="gpt-5-mini",
+            input=input_text
+        )
+        s.set(**usage_attributes(response))
     
     return response.output_text.strip()
 
 
-async def generate_summaries(texts: List[str]) -> List[str]:
-    """Generate summaries for all texts in parallel using async processing."""
-    print(f"Generating summaries for {len(texts)} chunks...")
+async def generate_summaries(texts: List[str], scheduler: Optional[RateLimitedScheduler] = None) -> List[Optional[str]]:
+    """
+    Generate summaries for all texts through the rate-limited scheduler.
     
-    # Create async tasks for all texts
-    tasks = []
-    for text in texts:
-        task = summarize_single_text(text)
-        tasks.append(task)
+    Concurrency, RPM/TPM limits and retries are handled by the scheduler;
+    a text whose summary still fails after retries gets None instead of
+    failing the whole batch.
+    """
+    logger.info(f"Generating summaries for {len(texts)} chunks...")
     
-    # Run all tasks in parallel
-    summaries = await asyncio.gather(*tasks)
+    scheduler = scheduler or RateLimitedScheduler(name="Summaries")
+    summaries = await scheduler.run(
+        summarize_single_text,
+        texts,
+        estimate_tokens=lambda text: len(text) // 4 + SUMMARY_OUTPUT_TOKENS  # rough chars-per-token estimate
+    )
     
-    print(f"Summaries generated for {len(summaries)} chunks")
-    return summaries
\ No newline at end of file
+    logger.info(f"Summaries generated for {scheduler.stats['done']} chunks ({scheduler.stats['failed']} failed)")
+    return summaries
@@ -0,0 +1,169 @@
+"""
+Token-budgeted context packing for the answer prompt.
+
+chunking_markdown splits with a 200-character overlap, so neighbouring
+chunks in the top-k repeat text, and the prompt used to grow with every
+chunk. pack_context instead:
+1. merges chunks of the same document that overlap or touch (by their
+   start/end offsets) into one passage, keeping the overlapping text once
+2. adds chunks in RRF order while the packed context fits the token budget
+   (a chunk that extends an already selected passage only costs its new text)
+3. orders passages by their best ranked chunk
+
+and reports the tokens saved against putting every chunk in full.
+
+Tokens are counted with tiktoken when its encoding is available, otherwise
+estimated from the character count.
+"""
+import os
+from functools import lru_cache
+from typing import List, Optional
+from model.schema import RankedChunk, ContextSection, PackedContext
+from tracing import span, get_logger
+
+logger = get_logger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_ENCODING = os.getenv("CONTEXT_ENCODING", "o200k_base")  # gpt-5-mini's tokenizer
+MERGE_MAX_GAP = int(os.getenv("CONTEXT_MERGE_MAX_GAP", "2"))  # chars between chunks still treated as adjacent (stripped whitespace)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """tiktoken encoding, or None if tiktoken or its vocabulary is unavailable (e.g. offline)."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(CONTEXT_ENCODING)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {CONTEXT_ENCODING} unavailable ({e}); estimating tokens from characters")
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1  # rough chars-per-token estimate
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def format_section(doc_id: str, chunk_ids: List[int], page_start: int, page_end: int, text: str) -> str:
+    """One passage as it appears in the prompt (chunk ids repeat across documents, so the doc_id is part of the label)."""
+    label = f"Chunk {chunk_ids[0]}" if len(chunk_ids) == 1 else "Chunks " + ", ".join(str(c) for c in chunk_ids)
+    if doc_id:
+        label = f"{doc_id}, {label}"
+    return f"[{label}] (Pages {page_start}-{page_end})\n{text}\n"
+
+
+def _section(group: List[RankedChunk], text: str) -> ContextSection:
+    chunk_ids = [chunk.chunk_id for chunk in group]
+    page_start = min(chunk.page_start for chunk in group)
+    page_end = max(chunk.page_end for chunk in group)
+    return ContextSection(
+        doc_id=group[0].doc_id,
+        chunk_ids=chunk_ids,
+        text=text,
+        page_start=page_start,
+        page_end=page_end,
+        tokens=count_tokens(format_section(group[0].doc_id, chunk_ids, page_start, page_end, text)),
+    )
+
+
+def merge_chunks(chunks: List[RankedChunk]) -> List[ContextSection]:
+    """
+    Merge overlapping or adjacent chunks into passages.
+
+    Args:
+        chunks: Chunks in RRF order. Chunks without offsets are never merged.
+
+    Returns:
+        Passages ordered by the best RRF rank among their chunks
+    """
+    rank = {id(chunk): i for i, chunk in enumerate(chunks)}
+    sections = []  # (best rank, section)
+
+    # Step 1: Chunks without offsets stand alone
+    for chunk in chunks:
+        if chunk.start_offset is None or chunk.end_offset is None:
+            sections.append((rank[id(chunk)], _section([chunk], chunk.text)))
+
+    # Step 2: Sweep each document's chunks in offset order, extending the current passage
+    located = sorted(
+        (chunk for chunk in chunks if chunk.start_offset is not None and chunk.end_offset is not None),
+        key=lambda chunk: (chunk.doc_id, chunk.start_offset, chunk.end_offset)
+    )
+    group: List[RankedChunk] = []
+    text, end = "", -1
+    for chunk in located:
+        if group and chunk.doc_id == group[0].doc_id and chunk.start_offset <= end + 1 + MERGE_MAX_GAP:
+            if chunk.end_offset > end:
+                overlap = end + 1 - chunk.start_offset  # chars of this chunk already in the passage
+                text += chunk.text[overlap:] if overlap >= 0 else "\n" + chunk.text
+                end = chunk.end_offset
+            group.append(chunk)
+            continue
+        if group:
+            sections.append((min(rank[id(c)] for c in group), _section(group, text)))
+        group, text, end = [chunk], chunk.text, chunk.end_offset
+    if group:
+        sections.append((min(rank[id(c)] for c in group), _section(group, text)))
+
+    # Step 3: Best ranked passage first
+    sections.sort(key=lambda item: item[0])
+    return [section for _, section in sections]
+
+
+def pack_context(chunks: List[RankedChunk], token_budget: Optional[int] = None) -> PackedContext:
+    """
+    Pack ranked chunks into at most token_budget tokens of merged passages.
+
+    Args:
+        chunks: Ranked chunks (RRF order)
+        token_budget: Default CONTEXT_TOKEN_BUDGET. The best ranked chunk is
+            always included, even if it alone exceeds the budget.
+
+    Returns:
+        PackedContext with the passages and token accounting
+    """
+    token_budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    with span("pack_context", chunks=len(chunks), token_budget=token_budget) as s:
+        tokens_unpacked = sum(
+            count_tokens(format_section(chunk.doc_id, [chunk.chunk_id], chunk.page_start, chunk.page_end, chunk.text))
+            for chunk in chunks
+        )
+
+        selected: List[RankedChunk] = []
+        sections: List[ContextSection] = []
+        dropped = 0
+        for chunk in chunks:
+            candidate = merge_chunks(selected + [chunk])
+            if selected and sum(section.tokens for section in candidate) > token_budget:
+                dropped += 1
+                continue
+            selected.append(chunk)
+            sections = candidate
+
+        tokens = sum(section.tokens for section in sections)
+        packed = PackedContext(
+            sections=sections,
+            token_budget=token_budget,
+            tokens=tokens,
+            tokens_unpacked=tokens_unpacked,
+            tokens_saved=tokens_unpacked - tokens,
+            chunks_dropped=dropped,
+        )
+        s.set(sections=len(sections), chunks_merged=len(selected) - len(sections), chunks_dropped=dropped,
+              tokens=tokens, tokens_unpacked=tokens_unpacked, tokens_saved=packed.tokens_saved)
+
+    if tokens > token_budget:
+        logger.warning(f"Top chunk alone is {tokens} tokens, over the {token_budget} token context budget")
+    logger.info(f"Packed {len(selected)} chunks into {len(sections)} passages: {tokens} tokens ({packed.tokens_saved} saved)")
+    return packed
+
+
+def context_text(context: PackedContext) -> str:
+    """The packed passages as prompt text."""
+    return "\n".join(
+        format_section(section.doc_id, section.chunk_ids, section.page_start, section.page_end, section.text)
+        for section in context.sections
+    )
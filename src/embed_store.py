@@ -1,55 +1,83 @@
-from typing import List
-import os
-import chromadb
-from openai import OpenAI
-from dotenv import load_dotenv
+from typing import Dict, List
+import hashlib
 from model.schema import Chunk
+from engine import get_engine
+from embedding_cache import embed_texts, embedding_cache
+from index_store import write_indexes
+from tracing import get_logger
 
-load_dotenv()
+logger = get_logger(__name__)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI and ChromaDB clients come from the shared engine (see engine.py)
 
-# Initialize ChromaDB (local, persistent)
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(
-    name="vector_store",
-    metadata={"hnsw:space": "cosine"}  # Use cosine similarity
-)
 
+def chroma_id(chunk: Chunk) -> str:
+    """Chroma id scoped by document and content; legacy chunks without a doc_id keep their sequential id."""
+    if chunk.doc_id:
+        return f"{chunk.doc_id}:{chunk.content_hash}"
+    return str(chunk.chunk_id)  # chroma requires ids to be strings
 
-def embed_and_store(chunks: List[Chunk]):
+
+def chunk_metadata(chunk: Chunk) -> dict:
+    return {
+        "chunk_id": chunk.chunk_id,
+        "doc_id": chunk.doc_id,
+        "content_hash": chunk.content_hash,
+        "page_start": chunk.page_start,
+        "page_end": chunk.page_end,
+        "start_offset": chunk.start_offset,
+        "end_offset": chunk.end_offset,
+        "text": chunk.text,
+        "chunk_summary": chunk.chunk_summary
+    }
+
+
+def embed_and_store(chunks: List[Chunk], write_snapshots: bool = True):
     # Extract summaries for embedding (dense retrieval)
     summaries = [chunk.chunk_summary for chunk in chunks]
     
-    # Create embeddings using OpenAI on summaries
-    response = openai_client.embeddings.create(
-        model="text-embedding-3-small",
-        input=summaries
-    )
-    embeddings = [item.embedding for item in response.data]
-    
-    # Prepare metadata and IDs
-    ids = []
-    metadatas = []
+    # Create embeddings using OpenAI on summaries (cached summaries are not re-embedded)
+    embeddings = embed_texts(get_engine().openai_client, summaries)
+    store_chunks(chunks, embeddings)
     
-    for chunk in chunks:
-        ids.append(str(chunk.chunk_id)) #chroma requires ids to be strings
-        metadatas.append({
-            "chunk_id": chunk.chunk_id,
-            "page_start": chunk.page_start,
-            "page_end": chunk.page_end,
-            "start_offset": chunk.start_offset,
-            "end_offset": chunk.end_offset,
-            "text": chunk.text,
-            "chunk_summary": chunk.chunk_summary
-        })
+    logger.info(f"Stored {len(chunks)} chunks in vector_store (embedded summaries)")
+    logger.info(f"Embedding cache: {embedding_cache.stats()}")
     
-    # Store in ChromaDB (embeddings are from summaries)
-    collection.add(
-        ids=ids,
-        embeddings=embeddings,
-        metadatas=metadatas  # Metadata has everything: full text, summary, citations
+    # Persist chunk store + BM25 snapshots so retrieval can load them instead of rebuilding
+    if write_snapshots:
+        write_indexes(get_engine().collection)
+
+
+def store_chunks(chunks: List[Chunk], embeddings: List[List[float]]):
+    """Upsert already-embedded chunks; upsert keeps re-runs idempotent."""
+    get_engine().collection.upsert(
+        ids=[chroma_id(chunk) for chunk in chunks],
+        embeddings=embeddings,  # embeddings are from summaries
+        metadatas=[chunk_metadata(chunk) for chunk in chunks]  # Metadata has everything: full text, summary, citations
     )
-    
-    print(f"Stored {len(chunks)} chunks in vector_store (embedded summaries)")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def assign_content_ids(doc_id: str, chunks: List[Chunk]):
+    """Set doc_id and a per-document unique content hash on every chunk."""
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        digest = text_hash(chunk.text)
+        # Identical texts (repeated headers/footers) get an occurrence suffix
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        chunk.doc_id = doc_id
+        chunk.content_hash = digest if occurrence == 0 else f"{digest}-{occurrence}"
+
+
+def legacy_rows() -> Dict[str, dict]:
+    """Rows stored before ids were scoped by document (sequential ids, no doc_id)."""
+    collection = get_engine().collection
+    legacy_ids = [i for i in collection.get(include=[])["ids"] if ":" not in i]
+    if not legacy_ids:
+        return {}
+    legacy = collection.get(ids=legacy_ids, include=["metadatas"])
+    return dict(zip(legacy["ids"], legacy["metadatas"]))
@@ -0,0 +1,213 @@
+"""
+Content-addressed embedding cache shared by ingestion and retrieval.
+
+Vectors are keyed by (model, sha256(text)) and kept in two tiers:
+1. In-memory LRU (hot query embeddings, no I/O)
+2. On-disk SQLite store (survives restarts, shared by main.py and the app)
+
+The disk tier is size-bounded: once it holds more than `max_disk_entries`
+vectors, the least recently used ones are evicted.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from singleflight import SingleFlight
+from tracing import span
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_CACHE_PATH = os.path.join(os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache"), "embeddings.sqlite3")
+
+# Per-request limits for embeddings.create (API caps are 2048 inputs / 300k tokens)
+EMBED_BATCH_MAX_INPUTS = 512
+EMBED_BATCH_MAX_TOKENS = 100_000
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address for one (model, text) pair."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, memory_size: int = 4096, max_disk_entries: int = 500_000):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the SQLite store on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        return self._conn
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up vectors for texts; None marks a miss."""
+        keys = [cache_key(model, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # Tier 1: memory
+            for key in keys:
+                if key in self._memory and key not in found:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self.memory_hits += 1
+
+            # Tier 2: disk (promote hits into memory)
+            missing = list({k for k in keys if k not in found})
+            if missing:
+                db = self._db()
+                rows = []
+                for i in range(0, len(missing), 500):  # stay under SQLite's variable limit
+                    batch = missing[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows.extend(db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                    ).fetchall())
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                if rows:
+                    now = time.time()
+                    db.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, k) for k, _ in rows])
+                    db.commit()
+
+            self.misses += len({k for k in keys if k not in found})
+
+        return [found.get(k) for k in keys]
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Store freshly computed vectors in both tiers."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model, text)
+                self._remember(key, vector)
+                rows.append((key, model, array("f", vector).tobytes(), now))
+            db = self._db()
+            db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        """Drop least recently used disk entries above max_disk_entries."""
+        (count,) = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since process start."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Process-wide cache used by embed_store and retrieval
+embedding_cache = EmbeddingCache()
+
+# Identical concurrent embedding requests (e.g. the same question from several
+# sessions at once) share one API call
+embedding_flight = SingleFlight()
+
+
+def embed_texts(openai_client, texts: List[str], model: str = EMBEDDING_MODEL, cache: Optional[EmbeddingCache] = None) -> List[List[float]]:
+    """
+    Embed texts through the cache; only misses go to the OpenAI API.
+
+    Args:
+        openai_client: OpenAI client used for cache misses
+        texts: Texts to embed
+        model: Embedding model name
+        cache: Cache to use (default: the process-wide embedding_cache)
+
+    Returns:
+        One embedding per input text, in input order
+    """
+    cache = cache or embedding_cache
+    with span("embed", model=model, texts=len(texts)) as s:
+        vectors = cache.get_many(model, texts)
+
+        # Embed each distinct missing text once, in size-limited requests
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        s.set(cache_hits=sum(v is not None for v in vectors), cache_misses=len(missing), api_calls=0)
+        if missing:
+            by_text = {}
+            for batch in embedding_batches(missing):
+                fresh, shared = embedding_flight.do(
+                    (model, id(cache), tuple(batch)),
+                    lambda: _embed_batch(openai_client, batch, model, cache, s)
+                )
+                s.add("coalesced_calls" if shared else "api_calls")
+                by_text.update(zip(batch, fresh))
+            vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+
+    return vectors
+
+
+def _embed_batch(openai_client, batch: List[str], model: str, cache: EmbeddingCache, embed_span) -> List[List[float]]:
+    """One embeddings request; the vectors are stored in the cache before returning."""
+    with span("openai.embeddings", inputs=len(batch)) as call:
+        response = openai_client.embeddings.create(model=model, input=batch)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            call.set(input_tokens=usage.prompt_tokens)
+            embed_span.add("input_tokens", usage.prompt_tokens)
+    fresh = [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+    cache.put_many(model, batch, fresh)
+    return fresh
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) for request sizing."""
+    return len(text) // 4 + 1
+
+
+def embedding_batches(texts: List[str], max_inputs: int = EMBED_BATCH_MAX_INPUTS, max_tokens: int = EMBED_BATCH_MAX_TOKENS) -> List[List[str]]:
+    """Split texts into consecutive batches that respect the per-request limits."""
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_inputs or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
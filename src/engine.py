@@ -0,0 +1,188 @@
+"""
+Process-wide engine: the OpenAI, Instructor and Chroma clients plus the
+retrieval indexes (and the flat vector index, if used), each created on first use and shared by every caller
+(ingestion, retrieval, answer generation, the Streamlit app).
+
+Nothing heavy is imported or opened when this module (or a module that
+uses it) is imported, so the app can render before any client exists, and
+exactly one Chroma client is ever opened per process.
+"""
+import os
+import threading
+from functools import cached_property
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from index_store import BM25_SNAPSHOT_PATH, DENSE_BACKEND, VECTOR_QUANTIZATION, MATRYOSHKA_DIM, load_or_build_indexes, load_or_build_vector_index
+from tracing import span
+
+load_dotenv()
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+COLLECTION_NAME = "vector_store"
+LLM_MODEL = "gpt-5-mini"
+
+
+def snapshot_stamp() -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of the BM25 snapshot file (written last), or None if it doesn't exist."""
+    try:
+        stat = os.stat(BM25_SNAPSHOT_PATH)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Engine:
+    """
+    Lazily constructed clients and indexes.
+
+    Clients passed to the constructor are used as-is (e.g. fakes in the
+    benchmarks); everything else is built the first time it is accessed.
+    """
+
+    def __init__(self, chroma_path: str = CHROMA_PATH, openai_client=None, async_openai_client=None,
+                 instructor_client=None, async_instructor_client=None):
+        self.chroma_path = chroma_path
+        # Injected clients pre-fill the cached_property slots
+        for name, client in (
+            ("openai_client", openai_client),
+            ("async_openai_client", async_openai_client),
+            ("instructor_client", instructor_client),
+            ("async_instructor_client", async_instructor_client),
+        ):
+            if client is not None:
+                self.__dict__[name] = client
+        self._indexes = None
+        self._snapshot_stamp = None
+        self._indexes_stale = False
+        self._index_lock = threading.Lock()
+        self._vector_indexes: Dict[Tuple[str, Optional[int]], object] = {}  # (quantization, dims) -> FlatVectorIndex
+        self._vector_lock = threading.Lock()
+
+    @cached_property
+    def openai_client(self):
+        with span("engine.init", component="openai"):
+            from openai import OpenAI
+            return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    @cached_property
+    def async_openai_client(self):
+        with span("engine.init", component="async_openai"):
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    @cached_property
+    def instructor_client(self):
+        # Instructor with Responses API mode (query translation and answers)
+        with span("engine.init", component="instructor"):
+            import instructor
+            return instructor.from_provider(f"openai/{LLM_MODEL}", mode=instructor.Mode.RESPONSES_TOOLS)
+
+    @cached_property
+    def async_instructor_client(self):
+        # Async variant for the HTTP service: cancelling the awaiting task aborts the LLM request
+        with span("engine.init", component="async_instructor"):
+            import instructor
+            return instructor.from_provider(f"openai/{LLM_MODEL}", mode=instructor.Mode.RESPONSES_TOOLS, async_client=True)
+
+    @cached_property
+    def chroma_client(self):
+        # The only ChromaDB client in the process (local, persistent)
+        with span("engine.init", component="chroma"):
+            import chromadb
+            return chromadb.PersistentClient(path=self.chroma_path)
+
+    @cached_property
+    def collection(self):
+        return self.chroma_client.get_or_create_collection(
+            name=COLLECTION_NAME,
+            metadata={"hnsw:space": "cosine"}  # Use cosine similarity
+        )
+
+    def get_indexes(self):
+        """
+        Load (or rebuild, if out of sync with ChromaDB) the chunk store and BM25
+        snapshots once per process. Reloads when ingestion has rewritten them
+        since, when ChromaDB's row count no longer matches the chunk store (an
+        ingestion that hasn't written its snapshots yet, or crashed before it
+        did), or after mark_indexes_stale().
+        """
+        with self._index_lock:
+            count = self.collection.count()
+            if (
+                self._indexes is None or self._indexes_stale or snapshot_stamp() != self._snapshot_stamp
+                or count != len(self._indexes[0])
+            ):
+                if count == 0:
+                    raise RuntimeError("Index is empty. Run `python src/main.py` to build the vector store before querying.")
+                with span("load_indexes"):
+                    self._indexes = load_or_build_indexes(self.collection)
+                self._snapshot_stamp = snapshot_stamp()
+                self._indexes_stale = False
+            return self._indexes
+
+    def mark_indexes_stale(self):
+        """
+        Have the next get_indexes() check the snapshots against ChromaDB's
+        current version (and rebuild them if they differ), e.g. after a
+        search returned ids the chunk store doesn't know.
+        """
+        with self._index_lock:
+            self._indexes_stale = True
+
+    def get_vector_index(self, quantization: str = VECTOR_QUANTIZATION, dims: Optional[int] = None):
+        """
+        A flat vector index (see vector_index) aligned with the current chunk
+        store: the full embeddings, or their first dims dimensions (coarse
+        two-stage index). Loaded once, and reloaded or rebuilt when the
+        chunk store's version changes.
+        """
+        chunk_store, _ = self.get_indexes()
+        key = (quantization, dims)
+        with self._vector_lock:
+            index = self._vector_indexes.get(key)
+            if index is None or index.version != chunk_store.version:
+                with span("load_vector_index", quantization=quantization, dims=dims):
+                    index = self._vector_indexes[key] = load_or_build_vector_index(self.collection, chunk_store, quantization, dims)
+            return index
+    
+    def reset_indexes(self):
+        """Forget the loaded indexes; the next get_indexes() reloads them."""
+        with self._index_lock:
+            self._indexes = None
+            self._snapshot_stamp = None
+            self._indexes_stale = False
+        with self._vector_lock:
+            self._vector_indexes.clear()
+
+    def warm_up(self):
+        """Open every client and load the indexes now instead of on the first query."""
+        with span("engine.warm_up"):
+            self.openai_client
+            self.instructor_client
+            if self.collection.count() > 0:
+                self.get_indexes()
+                if DENSE_BACKEND in ("flat", "two_stage"):
+                    self.get_vector_index()
+                if DENSE_BACKEND == "two_stage":
+                    self.get_vector_index(dims=MATRYOSHKA_DIM)
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """The process-wide engine (created on first call, nothing opened yet)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = Engine()
+    return _engine
+
+
+def set_engine(engine: Engine):
+    """Replace the process-wide engine (benchmarks and tools that inject clients)."""
+    global _engine
+    with _engine_lock:
+        _engine = engine
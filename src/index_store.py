@@ -0,0 +1,146 @@
+"""
+Versioned on-disk snapshots of the in-process indexes.
+
+Ingestion writes, from a single pass over the Chroma collection:
+1. chunks.bin  - columnar chunk store (text, summary, pages, offsets)
+2. vectors.bin - flat summary-embedding matrix over the same rows (only
+   with DENSE_BACKEND=flat or two_stage, see vector_index), plus
+   vectors-256d.bin, its truncated Matryoshka prefix (two_stage only)
+3. bm25.bin    - BM25 postings over the same rows
+
+Retrieval loads them lazily (memory-mapped) and only rebuilds them when
+their recorded collection version no longer matches ChromaDB.
+"""
+import os
+import hashlib
+from typing import List, Optional, Tuple
+import numpy as np
+from bm25_index import BM25Index, tokenize
+from chunk_store import ChunkStore
+from vector_index import FlatVectorIndex
+from tracing import span, get_logger
+
+logger = get_logger(__name__)
+
+SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "./index_snapshot")
+CHUNK_STORE_PATH = os.path.join(SNAPSHOT_DIR, "chunks.bin")
+VECTOR_INDEX_PATH = os.path.join(SNAPSHOT_DIR, "vectors.bin")
+BM25_SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "bm25.bin")  # written last
+
+# Dense retrieval backend: "chroma" (HNSW), "flat" (exact scan) or
+# "two_stage" (coarse scan of truncated vectors, full-vector rescoring), see vector_index
+DENSE_BACKEND = os.getenv("DENSE_BACKEND", "chroma")
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "float32")  # flat/two_stage: float32, float16 or int8
+MATRYOSHKA_DIM = int(os.getenv("MATRYOSHKA_DIM", "256"))  # two_stage: dimensions of the coarse index
+MATRYOSHKA_CANDIDATES = int(os.getenv("MATRYOSHKA_CANDIDATES", "64"))  # two_stage: coarse hits re-scored per query
+
+
+def ids_version(ids: List[str]) -> str:
+    """Version stamp for a set of Chroma ids: count plus a digest of the ids."""
+    digest = hashlib.sha1("\n".join(sorted(ids)).encode("utf-8")).hexdigest()
+    return f"{len(ids)}-{digest}"
+
+
+def collection_version(collection) -> str:
+    """
+    Current version of a Chroma collection.
+
+    Only ids are read (no metadata or embeddings), so this is much cheaper
+    than rebuilding the indexes.
+    """
+    return ids_version(collection.get(include=[])["ids"])
+
+
+def build_indexes(collection) -> Tuple[ChunkStore, BM25Index]:
+    """Build the chunk store and BM25 index from one read of Chroma metadata."""
+    data = collection.get(include=["metadatas"])
+    ids = data["ids"]
+    metadatas = data["metadatas"]
+    version = ids_version(ids)
+
+    chunk_store = ChunkStore.from_metadatas(ids, metadatas, version=version)
+    bm25_index = BM25Index.build([tokenize(metadata["text"]) for metadata in metadatas], doc_ids=ids, version=version)
+    return chunk_store, bm25_index
+
+
+def vector_index_path(dims: Optional[int] = None) -> str:
+    """Snapshot path of the full (dims=None) or a truncated vector index."""
+    return VECTOR_INDEX_PATH if dims is None else os.path.join(SNAPSHOT_DIR, f"vectors-{dims}d.bin")
+
+
+def chunk_embeddings(collection, chunk_store: ChunkStore) -> np.ndarray:
+    """Chroma's summary embeddings as a float32 matrix in chunk store row order."""
+    data = collection.get(include=["embeddings"])
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    ordered = np.zeros((len(chunk_store), embeddings.shape[1] if embeddings.ndim == 2 else 0), dtype=np.float32)
+    ordered[[chunk_store.row(chroma_id) for chroma_id in data["ids"]]] = embeddings
+    return ordered
+
+
+def build_vector_index(collection, chunk_store: ChunkStore, quantization: str = VECTOR_QUANTIZATION,
+                       dims: Optional[int] = None, embeddings: Optional[np.ndarray] = None) -> FlatVectorIndex:
+    """
+    Build a flat vector index from Chroma's embeddings, in chunk store row order.
+
+    Args:
+        dims: Keep only the first dims dimensions (coarse Matryoshka index)
+        embeddings: chunk_embeddings() if already read
+    """
+    if embeddings is None:
+        embeddings = chunk_embeddings(collection, chunk_store)
+    return FlatVectorIndex.build(embeddings[:, :dims], quantization, version=chunk_store.version)
+
+
+def load_or_build_vector_index(collection, chunk_store: ChunkStore, quantization: str = VECTOR_QUANTIZATION,
+                               dims: Optional[int] = None) -> FlatVectorIndex:
+    """Load the vector snapshot if it matches the chunk store, otherwise rebuild and rewrite it."""
+    path = vector_index_path(dims)
+    vector_index = FlatVectorIndex.load(path)
+    if (
+        vector_index is not None and vector_index.version == chunk_store.version
+        and vector_index.quantization == quantization and (dims is None or vector_index.dim == dims)
+    ):
+        logger.info(f"Vector index snapshot loaded with {len(vector_index)} rows ({vector_index.dim}-d, {quantization})")
+        return vector_index
+
+    logger.info("Vector index snapshot missing or out of date, rebuilding from ChromaDB...")
+    with span("write_vector_index", quantization=quantization, dims=dims) as s:
+        vector_index = build_vector_index(collection, chunk_store, quantization, dims)
+        vector_index.save(path)
+        s.set(rows=len(vector_index), bytes=vector_index.nbytes)
+    return vector_index
+
+
+def write_indexes(collection) -> Tuple[ChunkStore, BM25Index]:
+    """Rebuild the snapshots from the collection and persist them (ingestion path)."""
+    with span("write_indexes") as s:
+        chunk_store, bm25_index = build_indexes(collection)
+        chunk_store.save(CHUNK_STORE_PATH)
+        if DENSE_BACKEND in ("flat", "two_stage"):
+            embeddings = chunk_embeddings(collection, chunk_store)
+            build_vector_index(collection, chunk_store, embeddings=embeddings).save(VECTOR_INDEX_PATH)
+            if DENSE_BACKEND == "two_stage":
+                build_vector_index(collection, chunk_store, dims=MATRYOSHKA_DIM, embeddings=embeddings).save(vector_index_path(MATRYOSHKA_DIM))
+        bm25_index.save(BM25_SNAPSHOT_PATH)
+        s.set(chunks=len(chunk_store))
+    logger.info(f"Index snapshots written with {len(chunk_store)} chunks -> {SNAPSHOT_DIR}")
+    return chunk_store, bm25_index
+
+
+def load_or_build_indexes(collection) -> Tuple[ChunkStore, BM25Index]:
+    """
+    Load both snapshots if they match the collection's current version,
+    otherwise rebuild them from Chroma and rewrite the snapshots.
+    """
+    current_version = collection_version(collection)
+    chunk_store = ChunkStore.load(CHUNK_STORE_PATH)
+    bm25_index = BM25Index.load(BM25_SNAPSHOT_PATH)
+    if (
+        chunk_store is not None and bm25_index is not None
+        and chunk_store.version == current_version and bm25_index.version == current_version
+    ):
+        logger.info(f"Index snapshots loaded with {len(chunk_store)} chunks")
+        return chunk_store, bm25_index
+
+    logger.info("Index snapshots missing or out of date, rebuilding from ChromaDB...")
+    return write_indexes(collection)
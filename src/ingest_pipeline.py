@@ -0,0 +1,237 @@
+"""
+Pipelined, incremental ingestion of one parsed document.
+
+Stages run concurrently and are connected by bounded asyncio queues, so a
+slow stage applies backpressure instead of letting work pile up in memory:
+
+    split -> classify -> summarize (N workers) -> embed (micro-batches) -> store
+
+- classify: chunks already stored under the same doc_id + content hash are
+  skipped (or get a metadata-only update if they moved); only new ones flow on
+- summarize: rate-limited through RateLimitedScheduler, one worker per slot
+- embed: summaries are grouped into micro-batches capped by item count and
+  approximate tokens, flushed when full or when the oldest item has waited
+  EMBED_FLUSH_SECONDS, so embedding overlaps with summarization
+- store: each embedded batch is upserted into Chroma as soon as it is ready
+
+Index snapshots are rebuilt once at the end, and only if anything changed.
+"""
+import os
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+from model.schema import Chunk
+from chunking import split_markdown, summarize_single_text, SUMMARY_OUTPUT_TOKENS
+from embedding_cache import embed_texts, embedding_cache, estimate_tokens
+from embed_store import (
+    chroma_id, chunk_metadata, store_chunks, text_hash, assign_content_ids, legacy_rows,
+)
+from engine import get_engine
+from index_store import write_indexes
+from rate_limit import RateLimitedScheduler
+from tracing import span, get_logger
+
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "64"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "128"))
+EMBED_BATCH_TOKENS = int(os.getenv("INGEST_EMBED_BATCH_TOKENS", "50000"))
+EMBED_FLUSH_SECONDS = float(os.getenv("INGEST_EMBED_FLUSH_SECONDS", "2.0"))
+
+_DONE = object()  # end-of-stream marker passed between stages
+
+logger = get_logger(__name__)
+
+
+async def ingest_document(
+    doc_id: str,
+    markdown_text: str,
+    page_map: Dict[str, Any],
+    scheduler: Optional[RateLimitedScheduler] = None,
+    write_snapshots: bool = True,
+) -> Dict[str, int]:
+    """
+    Incrementally (re-)index one document through the streaming pipeline.
+
+    Chunks are identified by doc_id + content hash, so after a revision only
+    chunks whose text changed are summarized and embedded. Unchanged chunks
+    that merely moved get a metadata-only update, and chunks that no longer
+    exist are deleted. Running it twice on the same input is a no-op.
+
+    Args:
+        doc_id: Document identifier (namespaces the Chroma ids)
+        markdown_text: Parsed markdown of the whole document
+        page_map: Page number -> offsets mapping from parse_pdf
+        scheduler: Rate-limited scheduler for summary calls (default: a new one);
+            share one across concurrent documents so the API limits hold globally
+        write_snapshots: Rebuild the index snapshots if anything changed (batch
+            runs turn this off and write them once at the end)
+
+    Returns:
+        Counts of total, new, summarized, unchanged, moved, deleted and failed chunks,
+        plus "changed" (1 if the collection was modified)
+    """
+    with span("ingest_document", doc_id=doc_id) as s:
+        stats = await _run_pipeline(doc_id, markdown_text, page_map, scheduler, write_snapshots)
+        s.set(**stats)
+    return stats
+
+
+async def _run_pipeline(
+    doc_id: str,
+    markdown_text: str,
+    page_map: Dict[str, Any],
+    scheduler: Optional[RateLimitedScheduler],
+    write_snapshots: bool,
+) -> Dict[str, int]:
+    started = time.monotonic()
+    scheduler = scheduler or RateLimitedScheduler(name="Summaries")
+    engine = get_engine()
+    collection = engine.collection
+
+    # Step 1: Split and identify chunks
+    with span("split", chars=len(markdown_text), pages=len(page_map)) as split_span:
+        chunks = await asyncio.to_thread(split_markdown, markdown_text, page_map)
+        split_span.set(chunks=len(chunks))
+    assign_content_ids(doc_id, chunks)
+    current_ids = [chroma_id(chunk) for chunk in chunks]
+
+    # What is already stored for this document
+    existing = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+    existing_by_id = dict(zip(existing["ids"], existing["metadatas"]))
+
+    # Legacy rows (sequential ids, no doc_id) are the single document the old
+    # pipeline indexed. Once any of them matches this document, they are all its
+    # previous revision: unchanged ones donate their summaries, and every one of
+    # them (removed or rewritten chunks included) is replaced by the new rows.
+    current_hashes = {text_hash(chunk.text) for chunk in chunks}
+    legacy = legacy_rows()
+    legacy_summaries = {}
+    for metadata in legacy.values():
+        digest = text_hash(metadata["text"])
+        if digest in current_hashes:
+            legacy_summaries[digest] = metadata.get("chunk_summary", "")
+    migrated_legacy = list(legacy) if legacy_summaries else []
+
+    stats = {"total": len(chunks), "new": 0, "summarized": 0, "unchanged": 0, "moved": 0, "deleted": 0, "failed": 0}
+    moved_ids, moved_metadatas = [], []
+    summarize_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    store_queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+    n_workers = max(1, scheduler.max_concurrency)
+
+    # Step 2: Classify - skip unchanged chunks, send new ones downstream
+    async def classify():
+        for chunk, cid in zip(chunks, current_ids):
+            stored = existing_by_id.get(cid)
+            if stored is not None:
+                # Unchanged text: reuse the stored summary and embedding
+                stats["unchanged"] += 1
+                chunk.chunk_summary = stored.get("chunk_summary", "")
+                metadata = chunk_metadata(chunk)
+                if any(stored.get(key) != value for key, value in metadata.items()):
+                    moved_ids.append(cid)
+                    moved_metadatas.append(metadata)
+                continue
+            chunk.chunk_summary = legacy_summaries.get(text_hash(chunk.text), "")
+            if chunk.chunk_summary:
+                await embed_queue.put(chunk)
+            else:
+                await summarize_queue.put(chunk)
+        for _ in range(n_workers):
+            await summarize_queue.put(_DONE)
+
+    # Step 3: Summarize new chunks (rate-limited, bounded concurrency)
+    async def summarize_worker():
+        while (chunk := await summarize_queue.get()) is not _DONE:
+            try:
+                tokens = estimate_tokens(chunk.text) + SUMMARY_OUTPUT_TOKENS
+                chunk.chunk_summary = (await scheduler.call(summarize_single_text, chunk.text, tokens)) or ""
+            except Exception as e:  # one bad chunk must not sink the document
+                logger.warning(f"summary for chunk {chunk.chunk_id} failed: {type(e).__name__}: {e}")
+                chunk.chunk_summary = ""
+            stats["summarized"] += 1
+            if not chunk.chunk_summary:
+                # Chunks whose summary failed are not stored, so the next run retries them
+                stats["failed"] += 1
+                continue
+            await embed_queue.put(chunk)
+
+    async def summarize():
+        await asyncio.gather(*(summarize_worker() for _ in range(n_workers)))
+        if stats["summarized"]:
+            scheduler.report()
+        await embed_queue.put(_DONE)
+
+    # Step 4: Embed summaries in size-limited micro-batches
+    async def embed():
+        batch: List[Chunk] = []
+        batch_tokens = 0
+        deadline = None
+
+        async def flush():
+            nonlocal batch, batch_tokens, deadline
+            embeddings = await asyncio.to_thread(
+                embed_texts, engine.openai_client, [chunk.chunk_summary for chunk in batch]
+            )
+            await store_queue.put((batch, embeddings))
+            batch, batch_tokens, deadline = [], 0, None
+
+        while True:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                chunk = await asyncio.wait_for(embed_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush()  # oldest item waited long enough
+                continue
+            if chunk is _DONE:
+                break
+            tokens = estimate_tokens(chunk.chunk_summary)
+            if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_BATCH_TOKENS):
+                await flush()
+            batch.append(chunk)
+            batch_tokens += tokens
+            if deadline is None:
+                deadline = time.monotonic() + EMBED_FLUSH_SECONDS
+        if batch:
+            await flush()
+        await store_queue.put(_DONE)
+
+    # Step 5: Upsert each embedded batch as soon as it is ready
+    async def store():
+        while (item := await store_queue.get()) is not _DONE:
+            batch, embeddings = item
+            with span("chroma.upsert", chunks=len(batch)):
+                await asyncio.to_thread(store_chunks, batch, embeddings)
+            stats["new"] += len(batch)
+            logger.info(f"Stored {stats['new']} new chunks for {doc_id} ({time.monotonic() - started:.1f}s)")
+
+    tasks = [asyncio.create_task(stage()) for stage in (classify, summarize, embed, store)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    # Step 6: Metadata-only update for moved chunks
+    if moved_ids:
+        collection.update(ids=moved_ids, metadatas=moved_metadatas)
+    stats["moved"] = len(moved_ids)
+
+    # Step 7: Delete chunks that no longer exist in this revision (and migrated legacy rows)
+    current = set(current_ids)
+    stale_ids = [i for i in existing_by_id if i not in current] + migrated_legacy
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    stats["deleted"] = len(stale_ids)
+
+    logger.info(
+        f"Ingested {doc_id}: {stats['total']} chunks, {stats['unchanged']} unchanged (skipped), "
+        f"{stats['new']} new ({stats['summarized']} summarized), {stats['moved']} moved, {stats['deleted']} deleted, "
+        f"{stats['failed']} failed in {time.monotonic() - started:.1f}s"
+    )
+    logger.info(f"Embedding cache: {embedding_cache.stats()}")
+
+    stats["changed"] = int(bool(stats["new"] or moved_ids or stale_ids))
+    if write_snapshots and stats["changed"]:
+        write_indexes(collection)
+    return stats
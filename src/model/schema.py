@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 class Chunk(BaseModel):
     chunk_id: int = Field(..., description="Sequential chunk number")
@@ -9,10 +9,18 @@ class Chunk(BaseModel):
     page_start: int = Field(..., description="First page covered by this chunk")
     page_end: int = Field(..., description="Last page covered by this chunk")
     chunk_summary: str = Field(default="", description="2-sentence summary of chunk content")
+    doc_id: str = Field(default="", description="Document this chunk belongs to")
+    content_hash: str = Field(default="", description="Hash of chunk text, unique within the document")
 
 class InputQuery(BaseModel):
     query: str = Field(..., description="User query")
 
+class QueryRequest(BaseModel): #Body of the HTTP service's /query and /retrieve endpoints
+    query: str = Field(..., min_length=1, max_length=2000, description="User query")
+    top_k: int = Field(default=10, ge=1, le=50, description="Number of ranked chunks to return")
+    timeout_s: Optional[float] = Field(default=None, gt=0, description="Deadline for the whole request in seconds (server default if omitted)")
+    stream: bool = Field(default=True, description="/query only: stream NDJSON events instead of one JSON response")
+
 class QueryVariations(BaseModel):
     variations: List[str] = Field(..., min_length=3, max_length=3, description="3 query variations")
 
@@ -22,6 +30,7 @@ class FinalQueries(BaseModel):
 
 class RetrievalChunk(BaseModel): #Individual chunk result from dense/sparse
     chunk_id: int = Field(..., description="Chunk ID")
+    doc_id: str = Field(default="", description="Document the chunk belongs to")
     text: str = Field(..., description="Full chunk text")
     similarity_score: float = Field(..., description="Similarity/BM25 score")
     page_start: int = Field(..., description="Starting page number")
@@ -29,16 +38,17 @@ class RetrievalChunk(BaseModel): #Individual chunk result from dense/sparse
 
 class QueryRetrievalResult(BaseModel): #Result for ONE question using RetrievalChunk
     question: str = Field(..., description="Query question text")
-    chunks: List[RetrievalChunk] = Field(..., min_length=5, max_length=15, description="Top retrieved chunks for this query (up to 15)")
+    chunks: List[RetrievalChunk] = Field(..., min_length=1, max_length=15, description="Top retrieved chunks for this query (1-15; small collections or filters can return fewer than requested)")
 
-class DenseRetrievalResults(BaseModel): #Results for ALL 4 questions (1 original + 3 variations)
-    results: List[QueryRetrievalResult] = Field(..., min_length=4, max_length=4, description="Results for all 4 queries (1 original + 3 variations)")
+class DenseRetrievalResults(BaseModel): #Results for the original question plus its variations (up to 4)
+    results: List[QueryRetrievalResult] = Field(..., min_length=1, max_length=4, description="Results for the original query and its variations (1-4 queries; variations are skipped when the original query's results already agree)")
 
-class SparseRetrievalResults(BaseModel): #Results for ALL 4 questions using BM25
-    results: List[QueryRetrievalResult] = Field(..., min_length=4, max_length=4, description="Results for all 4 queries (1 original + 3 variations)")
+class SparseRetrievalResults(BaseModel): #Results for the original question plus its variations using BM25
+    results: List[QueryRetrievalResult] = Field(..., min_length=1, max_length=4, description="Results for the original query and its variations (1-4 queries; variations are skipped when the original query's results already agree)")
 
 class RankedChunk(BaseModel): #Final ranked chunk after RRF
     chunk_id: int = Field(..., description="Chunk ID")
+    doc_id: str = Field(default="", description="Document the chunk belongs to")
     text: str = Field(..., description="Full chunk text")
     chunk_summary: str = Field(..., description="Chunk summary")
     page_start: int = Field(..., description="Starting page number")
@@ -46,13 +56,32 @@ class RankedChunk(BaseModel): #Final ranked chunk after RRF
     rrf_score: float = Field(..., description="Reciprocal Rank Fusion score")
     appearances: int = Field(..., description="Number of times chunk appeared in results")
     sources: List[str] = Field(..., description="Retrieval sources: dense, sparse, or both")
+    start_offset: Optional[int] = Field(default=None, description="Start char offset in full document (None if unknown)")
+    end_offset: Optional[int] = Field(default=None, description="End char offset in full document (None if unknown)")
 
 class FinalRankedResults(BaseModel): #Final results after RRF merge and deduplication
     chunks: List[RankedChunk] = Field(..., description="Top ranked chunks after RRF")
     total_before_dedup: int = Field(..., description="Total chunks before deduplication")
     total_after_dedup: int = Field(..., description="Total unique chunks after deduplication")
 
+class ContextSection(BaseModel): #One contiguous passage of the answer prompt (one chunk, or overlapping/adjacent chunks merged)
+    doc_id: str = Field(default="", description="Document the passage belongs to")
+    chunk_ids: List[int] = Field(..., description="Chunks merged into this passage, in document order")
+    text: str = Field(..., description="Passage text, overlapping text included once")
+    page_start: int = Field(..., description="Starting page number")
+    page_end: int = Field(..., description="Ending page number")
+    tokens: int = Field(..., description="Prompt tokens of the passage, header included")
+
+class PackedContext(BaseModel): #Answer prompt context after merging and token budgeting
+    sections: List[ContextSection] = Field(..., description="Passages in prompt order (best RRF rank first)")
+    token_budget: int = Field(..., description="Token budget the context was packed into")
+    tokens: int = Field(..., description="Tokens of the packed context")
+    tokens_unpacked: int = Field(..., description="Tokens of every ranked chunk in full, one by one")
+    tokens_saved: int = Field(..., description="tokens_unpacked - tokens")
+    chunks_dropped: int = Field(..., description="Ranked chunks left out to stay within the budget")
+
 class Citation(BaseModel): #Individual citation reference
+    doc_id: str = Field(default="", description="Document of the cited chunk (from the passage label)")
     chunk_id: int = Field(..., description="Chunk ID used for this citation")
     page_start: int = Field(..., description="Starting page number")
     page_end: int = Field(..., description="Ending page number")
@@ -0,0 +1,160 @@
+"""
+Semantic query-result cache.
+
+Stores the FinalRankedResults and Answer for each answered question under a
+normalized-query key. A lookup first tries the exact key (get_exact, no
+embedding needed), then falls back to an approximate hit when the new
+query's embedding is within a cosine similarity threshold of a cached one
+(get_similar).
+
+Entries expire after a TTL, the cache is LRU-bounded, and everything is
+dropped as soon as the index version (Chroma collection + BM25 snapshot)
+changes, so answers never outlive the data they were built from.
+"""
+import re
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from model.schema import FinalRankedResults, Answer
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop surrounding punctuation."""
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip("?!.,;: ")
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    embedding: Optional[np.ndarray]  # unit-normalized query embedding
+    final_results: FinalRankedResults
+    answer: Answer
+    created_at: float
+
+
+class QueryResultCache:
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._index_version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _check_version(self, index_version: str):
+        """Invalidate everything when the underlying index changed."""
+        if index_version != self._index_version:
+            if self._entries:
+                logger.info(f"Query cache invalidated ({len(self._entries)} entries): index version changed")
+            self._entries.clear()
+            self._index_version = index_version
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key in [k for k, e in self._entries.items() if e.created_at < cutoff]:
+            del self._entries[key]
+
+    def get(self, query: str, index_version: str, query_embedding: Optional[List[float]] = None) -> Optional[Tuple[CacheEntry, str]]:
+        """
+        Look up a cached result: get_exact, then get_similar if an embedding is given.
+
+        Returns:
+            (entry, "exact" | "semantic") on a hit, None on a miss
+        """
+        hit = self.get_exact(query, index_version)
+        if hit is None:
+            hit = self.get_similar(query_embedding, index_version)
+        return hit
+
+    def get_exact(self, query: str, index_version: str) -> Optional[Tuple[CacheEntry, str]]:
+        """
+        Exact normalized-query hit. Needs no embedding, so callers should
+        try it before embedding the query; on None, follow up with
+        get_similar (which records the miss).
+
+        Returns:
+            (entry, "exact") on a hit, None otherwise
+        """
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version(index_version)
+            self._expire()
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key], "exact"
+            return None
+
+    def get_similar(self, query_embedding: Optional[List[float]], index_version: str) -> Optional[Tuple[CacheEntry, str]]:
+        """
+        Approximate hit: the nearest cached query embedding above the
+        similarity threshold. Counts a miss if there is none.
+
+        Returns:
+            (entry, "semantic") on a hit, None on a miss
+        """
+        with self._lock:
+            self._check_version(index_version)
+            self._expire()
+            if query_embedding is not None:
+                candidates = [(k, e) for k, e in self._entries.items() if e.embedding is not None]
+                if candidates:
+                    vector = _unit(query_embedding)
+                    similarities = np.stack([e.embedding for _, e in candidates]) @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.similarity_threshold:
+                        best_key, entry = candidates[best]
+                        self._entries.move_to_end(best_key)
+                        self.semantic_hits += 1
+                        return entry, "semantic"
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, index_version: str, final_results: FinalRankedResults, answer: Answer, query_embedding: Optional[List[float]] = None):
+        """Store a pipeline result for query under the given index version."""
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[key] = CacheEntry(
+                query=query,
+                embedding=_unit(query_embedding) if query_embedding is not None else None,
+                final_results=final_results,
+                answer=answer,
+                created_at=time.time(),
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+        }
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
+
+
+# Process-wide cache (survives Streamlit reruns since modules stay imported)
+query_cache = QueryResultCache()
@@ -1,21 +1,24 @@
 from dotenv import load_dotenv
 from model.schema import QueryVariations, FinalQueries, InputQuery
-import instructor
+from engine import get_engine, LLM_MODEL
+from query_cache import normalize_query
+from variation_cache import VariationCache
 import os
+from typing import AsyncIterator, Iterator, List, Optional
+from tracing import span, start_span, set_attributes, usage_attributes, get_logger
 
 load_dotenv()
 
-# Initialize Instructor with Responses API mode
-client = instructor.from_provider(
-    "openai/gpt-5-mini",
-    mode=instructor.Mode.RESPONSES_TOOLS
-)
+logger = get_logger(__name__)
 
+# The Instructor client (Responses API mode) comes from the shared engine
+
+# Generated variations are reused across sessions and restarts
+variation_cache = VariationCache()
 
-def query_translate(query: str) -> FinalQueries:
-    input_query = InputQuery(query=query)
-    response = client.responses.create(
-        input=f"""You are given a user query.
+
+def _translation_prompt(query: str) -> str:
+    return f"""You are given a user query.
 
     Generate 3 alternative queries that express the same intent
     using different wording and phrasing.
@@ -29,13 +32,127 @@ def query_translate(query: str) -> FinalQueries:
 
     Return only the list of rewritten queries.
 
-    User query: {query}""",
-        response_model=QueryVariations,
-    )
+    User query: {query}"""
+
+
+def _cache_prompt(query: str) -> str:
+    """Variation cache key material: the prompt for the normalized query."""
+    return _translation_prompt(normalize_query(query))
+
+
+def cached_variations(query: str) -> Optional[List[str]]:
+    """Previously generated variations for this (normalized) query, if any."""
+    return variation_cache.get(LLM_MODEL, _cache_prompt(query))
+
+
+# Default of the cached argument below: look the query up in the variation cache.
+# Callers that already called cached_variations pass its result instead, so
+# each request counts one cache lookup.
+LOOKUP = object()
+
+
+def query_translate(query: str, cached: Optional[List[str]] = LOOKUP) -> FinalQueries:
+    input_query = InputQuery(query=query)
+    if cached is LOOKUP:
+        cached = cached_variations(query)
+    if cached is not None:
+        set_attributes(variations_cached=True)
+        return FinalQueries(original_query=query, variations=cached)
     
-    print(f"Generated {len(response.variations)} variations")
+    with span("query_translate", model="gpt-5-mini") as s:
+        response, completion = get_engine().instructor_client.responses.create_with_completion(
+            input=_translation_prompt(query),
+            response_model=QueryVariations,
+        )
+        s.set(variations=len(response.variations), **usage_attributes(completion))
+    
+    logger.info(f"Generated {len(response.variations)} variations")
+    variation_cache.put(LLM_MODEL, _cache_prompt(query), response.variations)
     
     # Return FinalQueries with original + variations
     return FinalQueries(original_query=query, variations=response.variations)
 
 
+def query_translate_stream(query: str, cached: Optional[List[str]] = LOOKUP) -> Iterator[str]:
+    """
+    Stream query variations, yielding each one as soon as the model has finished it.
+    
+    A variation is complete once the model starts writing the next one; the
+    last variation is complete when the stream ends.
+    """
+    if cached is LOOKUP:
+        cached = cached_variations(query)
+    if cached is not None:
+        set_attributes(variations_cached=True)
+        yield from cached
+        return
+    
+    emitted = 0
+    variations: List[str] = []
+    
+    for partial in get_engine().instructor_client.responses.create_partial(
+        input=_translation_prompt(query),
+        response_model=QueryVariations,
+    ):
+        variations = [v for v in (partial.variations or []) if v][:3]
+        while emitted < len(variations) - 1:
+            yield variations[emitted]
+            emitted += 1
+    
+    while emitted < len(variations):
+        yield variations[emitted]
+        emitted += 1
+    
+    set_attributes(model="gpt-5-mini", input_tokens_estimated=len(_translation_prompt(query)) // 4)
+    logger.info(f"Generated {emitted} variations")
+    if emitted == 3:
+        variation_cache.put(LLM_MODEL, _cache_prompt(query), variations)
+
+
+async def query_translate_stream_async(query: str, cached: Optional[List[str]] = LOOKUP) -> AsyncIterator[str]:
+    """
+    Async counterpart of query_translate_stream (async Instructor client).
+    
+    Cancelling the consuming task aborts the in-flight model request. Records
+    its own "query_translate" span, since an async generator can't use the
+    consumer's current span.
+    """
+    if cached is LOOKUP:
+        cached = cached_variations(query)
+    if cached is not None:
+        set_attributes(variations_cached=True)
+        for variation in cached:
+            yield variation
+        return
+    
+    emitted = 0
+    variations: List[str] = []
+    prompt = _translation_prompt(query)
+    s = start_span("query_translate", streaming=True, model="gpt-5-mini", input_tokens_estimated=len(prompt) // 4)
+    try:
+        async for partial in get_engine().async_instructor_client.responses.create_partial(
+            input=prompt,
+            response_model=QueryVariations,
+        ):
+            variations = [v for v in (partial.variations or []) if v][:3]
+            while emitted < len(variations) - 1:
+                yield variations[emitted]
+                emitted += 1
+                s.add("variations")
+        
+        while emitted < len(variations):
+            yield variations[emitted]
+            emitted += 1
+            s.add("variations")
+    except GeneratorExit:
+        s.set(abandoned=True)
+        raise
+    except BaseException as e:
+        s.fail(e)
+        raise
+    finally:
+        s.end()
+    
+    logger.info(f"Generated {emitted} variations")
+    if emitted == 3:
+        variation_cache.put(LLM_MODEL, _cache_prompt(query), variations)
@@ -3,46 +3,139 @@
 2. parse_pdf – use presigned URL + LlamaParse → return markdown, page_map in memory
 3. upload_parsed_files – take markdown + page_map and store them in R2
 4. Download stored markdown and page_map for a given doc_id from R2.
-5. os.environ - we don't have to write the validation
-6. S3 is a storage API/protocol. A common language for object storage.
+5. list_doc_ids / parsed_files_exist – discover documents for batch ingestion
+6. os.environ - we don't have to write the validation
+7. S3 is a storage API/protocol. A common language for object storage.
+8. fetch_objects – concurrent downloads through a local artifact cache
+   (R2_CACHE_DIR). A cached object is revalidated with a conditional GET
+   (If-None-Match: <ETag>), so an unchanged object costs one 304 and no body.
+   Large objects are fetched with parallel ranged GETs; bodies are streamed
+   to disk, never held in memory whole.
+9. upload_file – multipart (parallel parts) above R2_MULTIPART_THRESHOLD_MB,
+   skipped when the stored object already has the same sha256.
+10. parse_pdf – parsed output is cached in R2 by the PDF's sha256
+   (parse_cache/), so the same PDF bytes are never parsed twice, whatever
+   doc_id they are uploaded under. PDFs longer than PARSE_PAGES_PER_RANGE
+   pages are parsed as page ranges in parallel (LlamaParse target_pages)
+   and stitched back together.
+
+Transfers share one pooled client (R2_MAX_POOL_CONNECTIONS) and a thread
+pool of R2_TRANSFER_CONCURRENCY. Any S3-compatible endpoint works, e.g. a
+local MinIO for testing: R2_ENDPOINT=http://localhost:9000 R2_BUCKET=test.
 """
 import os
 import json
-from typing import Tuple, Dict, Any
+import logging
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, Any, List, Optional
 from pathlib import Path
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from llama_parse import LlamaParse
 
 load_dotenv()
 
+logger=logging.getLogger(__name__)
+
 R2_ENDPOINT=os.environ.get("R2_ENDPOINT")
 R2_BUCKET=os.environ.get("R2_BUCKET")
 R2_ACCESS_KEY=os.environ.get("R2_ACCESS_KEY")
 R2_SECRET_KEY=os.environ.get("R2_SECRET_KEY")
 LLAMA_API_KEY=os.environ.get("LLAMA_API_KEY")
 
-# R2 client 
+R2_CACHE_DIR=os.environ.get("R2_CACHE_DIR", "./r2_cache")  # "" disables the artifact cache
+R2_MAX_POOL_CONNECTIONS=int(os.environ.get("R2_MAX_POOL_CONNECTIONS", "32"))
+R2_TRANSFER_CONCURRENCY=int(os.environ.get("R2_TRANSFER_CONCURRENCY", "8"))
+R2_MULTIPART_THRESHOLD_MB=int(os.environ.get("R2_MULTIPART_THRESHOLD_MB", "16"))
+R2_MULTIPART_CHUNKSIZE_MB=int(os.environ.get("R2_MULTIPART_CHUNKSIZE_MB", "8"))
+
+PARSE_PAGES_PER_RANGE=int(os.environ.get("PARSE_PAGES_PER_RANGE", "25"))  # pages per LlamaParse job for large PDFs
+PARSE_CONCURRENCY=int(os.environ.get("PARSE_CONCURRENCY", "4"))  # page ranges parsed at once
+PARSE_CACHE_PREFIX="parse_cache/v1/"  # bump when the parser options change
+PAGE_SEPARATOR="\n\n"  # between pages in the stitched markdown
+
+# R2 client (thread-safe; pooled keep-alive connections shared by every transfer)
 
 r2_client=boto3.client(
     "s3",
     endpoint_url=R2_ENDPOINT,
     aws_access_key_id=R2_ACCESS_KEY,
     aws_secret_access_key=R2_SECRET_KEY,
-    config=Config(signature_version="s3v4"),
+    config=Config(
+        signature_version="s3v4",
+        max_pool_connections=R2_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={"max_attempts": 5, "mode": "adaptive"}
+    ),
     region_name="auto"
 )
 
+# Multipart uploads / ranged downloads for large objects, parts in parallel
+transfer_config=TransferConfig(
+    multipart_threshold=R2_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+    multipart_chunksize=R2_MULTIPART_CHUNKSIZE_MB * 1024 * 1024,
+    max_concurrency=R2_TRANSFER_CONCURRENCY,
+    use_threads=True
+)
+
+# Concurrent whole-object transfers (e.g. markdown + page_map of a document)
+transfer_pool=ThreadPoolExecutor(max_workers=R2_TRANSFER_CONCURRENCY, thread_name_prefix="r2-transfer")
+
+cache_stats={"hits": 0, "misses": 0, "bytes_downloaded": 0, "uploads_skipped": 0}
+parse_stats={"cache_hits": 0, "parsed": 0, "ranges": 0}
+
+PARSER_OPTIONS={"result_type": "markdown", "verbose": False}
+
 parser=LlamaParse(
     api_key=LLAMA_API_KEY,
-    result_type="markdown",
-    verbose=False
+    **PARSER_OPTIONS
 )
 
+def _is_status(error: ClientError, *codes: str) -> bool:
+    return error.response.get("Error", {}).get("Code") in codes or str(error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")) in codes
+
+def file_sha256(path: Path) -> str:
+    digest=hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def upload_file(local_path:str,key:str,content_type:str="application/octet-stream",metadata:Optional[Dict[str,str]]=None) -> bool:
+    """
+    Upload a local file to R2 (multipart with parallel parts above the
+    multipart threshold). The file's sha256 is stored in the object metadata;
+    if the stored object already has the same sha256, nothing is sent.
+
+    Returns True if the file was uploaded, False if it was already there.
+    """
+    path=Path(local_path)
+    sha256=file_sha256(path)
+    try:
+        head=r2_client.head_object(Bucket=R2_BUCKET, Key=key)
+        if head.get("Metadata", {}).get("sha256") == sha256:
+            cache_stats["uploads_skipped"] += 1
+            return False
+    except ClientError as e:
+        if not _is_status(e, "404", "NoSuchKey", "NotFound"):
+            raise
+
+    r2_client.upload_file(
+        str(path), R2_BUCKET, key,
+        ExtraArgs={"ContentType": content_type, "Metadata": {**(metadata or {}), "sha256": sha256}},
+        Config=transfer_config
+    )
+    return True
+
 def upload_pdf(pdf_path:str,doc_id:str) -> str:
     """
     Upload local PDF to R2 as: documents/{doc_id}/original.pdf
+    (multipart for large PDFs; skipped if the same PDF is already stored).
     Returns the R2 object key.
     """
     path=Path(pdf_path)
@@ -50,84 +143,282 @@ def upload_pdf(pdf_path:str,doc_id:str) -> str:
         raise FileNotFoundError(pdf_path)
     pdf_key=f"documents/{doc_id}/original.pdf"
 
-    with path.open("rb") as f:
-        r2_client.put_object(
-            Bucket=R2_BUCKET,
-            Key=pdf_key,
-            Body=f,
-            ContentType="application/pdf",
-            Metadata={
-                "doc_id": doc_id,
-                "original_filename": path.name
-            }
-        )
+    upload_file(
+        str(path), pdf_key,
+        content_type="application/pdf",
+        metadata={
+            "doc_id": doc_id,
+            "original_filename": path.name
+        }
+    )
     return pdf_key
+
+def _cache_paths(key:str) -> Tuple[Path, Path]:
+    """Cached body and its metadata sidecar ({"etag": ..., "size": ...}) for an object key."""
+    path=Path(R2_CACHE_DIR) / (R2_BUCKET or "default") / key
+    return path, path.with_name(path.name + ".meta.json")
+
+def fetch_object(key:str) -> Path:
+    """
+    Local path (under R2_CACHE_DIR) of an object's current body, downloaded
+    only if the cached copy is missing or its ETag no longer matches
+    (conditional GET).
+    """
+    path, meta_path=_cache_paths(key)
+    cached_etag=None
+    if path.exists() and meta_path.exists():
+        cached_etag=json.loads(meta_path.read_text(encoding="utf-8")).get("etag")
+
+    # Step 1: Revalidate a cached copy (304, no body) or find out the object's size
+    obj=None
+    if cached_etag:
+        try:
+            obj=r2_client.get_object(Bucket=R2_BUCKET, Key=key, IfNoneMatch=cached_etag)
+        except ClientError as e:
+            if _is_status(e, "304", "NotModified"):
+                cache_stats["hits"] += 1
+                return path
+            raise
+        size, etag=obj["ContentLength"], obj["ETag"]
+    else:
+        head=r2_client.head_object(Bucket=R2_BUCKET, Key=key)  # cold: choose single vs. ranged GETs before any body is sent
+        size, etag=head["ContentLength"], head["ETag"]
+    cache_stats["misses"] += 1
+
+    # Step 2: Stream the body to a temp file (ranged, parallel GETs for large objects).
+    # The recorded ETag is never newer than the body: it comes from the GET that
+    # returned the body, or from the request before a ranged download (if the object
+    # is overwritten in between, the older ETag just makes the next fetch download it again).
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path=path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")  # concurrent fetches of one key
+    if size > transfer_config.multipart_threshold:
+        if obj is not None:
+            obj["Body"].close()  # changed large object: rare, drop this response for the ranged download
+        r2_client.download_file(R2_BUCKET, key, str(tmp_path), Config=transfer_config)
+    else:
+        if obj is None:
+            # No If-Match: an overwrite since the HEAD would fail it with 412; take whatever is current
+            obj=r2_client.get_object(Bucket=R2_BUCKET, Key=key)
+            size, etag=obj["ContentLength"], obj["ETag"]
+        with tmp_path.open("wb") as f:
+            for block in obj["Body"].iter_chunks(chunk_size=1024 * 1024):
+                f.write(block)
+    cache_stats["bytes_downloaded"] += size
+
+    # Step 3: Publish body, then metadata (a crash in between only costs a re-download)
+    os.replace(tmp_path, path)
+    meta_path.write_text(json.dumps({"etag": etag, "size": size}), encoding="utf-8")
+    return path
+
+def fetch_objects(keys:List[str]) -> Dict[str, Path]:
+    """fetch_object for several keys concurrently (e.g. a document's artifacts, index snapshots)."""
+    return dict(zip(keys, transfer_pool.map(fetch_object, keys)))
+
+def _remember_upload(key:str,body:bytes,etag:str):
+    """Put a just-uploaded body in the cache, so this node's next fetch is a 304."""
+    if not R2_CACHE_DIR:
+        return
+    path, meta_path=_cache_paths(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(body)
+    meta_path.write_text(json.dumps({"etag": etag, "size": len(body)}), encoding="utf-8")
     
-def parse_pdf(doc_id:str)->Tuple[str,Dict[str,Any]]:
+def _object_exists(key:str) -> bool:
+    try:
+        r2_client.head_object(Bucket=R2_BUCKET, Key=key)
+    except ClientError as e:
+        if _is_status(e, "404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+def _pdf_sha256(pdf_key:str) -> str:
+    """sha256 of a stored PDF: from its metadata (upload_pdf), else by hashing the (cached) body."""
+    head=r2_client.head_object(Bucket=R2_BUCKET, Key=pdf_key)
+    sha256=head.get("Metadata", {}).get("sha256")
+    if sha256:
+        return sha256
+    if R2_CACHE_DIR:
+        return file_sha256(fetch_object(pdf_key))
+    digest=hashlib.sha256()
+    for block in r2_client.get_object(Bucket=R2_BUCKET, Key=pdf_key)["Body"].iter_chunks(chunk_size=1024 * 1024):
+        digest.update(block)
+    return digest.hexdigest()
+
+def _pdf_page_count(pdf_key:str) -> Optional[int]:
+    """
+    Number of pages, or None (logged; the PDF is then parsed whole) if it
+    can't be read locally: pypdf is missing, the cache is disabled or the
+    PDF can't be fetched or read (any error).
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning(f"pypdf is not installed; parsing {pdf_key} as a single range")
+        return None
+    if not R2_CACHE_DIR:
+        logger.warning(f"R2_CACHE_DIR is disabled, page count of {pdf_key} unknown; parsing it as a single range")
+        return None
+    try:
+        return len(PdfReader(str(fetch_object(pdf_key))).pages)
+    except Exception as e:  # pypdf raises assorted errors on damaged or unusual PDFs
+        logger.warning(f"Could not read the page count of {pdf_key} ({e}); parsing it as a single range")
+        return None
+
+def _page_ranges(page_count:int, pages_per_range:int) -> List[Tuple[int,int]]:
+    """[start, end) zero-based page ranges covering the document."""
+    return [(start, min(start + pages_per_range, page_count)) for start in range(0, page_count, pages_per_range)]
+
+def _parse_range(url:str, page_range:Tuple[int,int]) -> List[Tuple[int,str]]:
+    """Parse pages [start, end) of the PDF at url; returns (page number, text) pairs."""
+    start, end=page_range
+    range_parser=LlamaParse(
+        api_key=LLAMA_API_KEY,
+        target_pages=",".join(str(page) for page in range(start, end)),  # zero-based
+        **PARSER_OPTIONS
+    )
+    docs=range_parser.load_data(url)
+    return [(start + i + 1, d.text if hasattr(d, "text") else "") for i, d in enumerate(docs)]
+
+def stitch_pages(pages:List[Tuple[int,str]]) -> Tuple[str,Dict[int,Any]]:
+    """
+    Join parsed pages into one markdown document (PAGE_SEPARATOR between
+    pages) and map each page to its character offsets in it.
+
+    Args:
+        pages: (page number, text) pairs in document order
+
+    Returns:
+        (markdown_text, page_map); end_offset is inclusive, and offsets
+        account for the separators, so markdown_text[start:end + 1] is the page
+    """
+    markdown_text=PAGE_SEPARATOR.join(text for _, text in pages)
+
+    page_map={}
+    running_offset=0  # cumulative character offset across pages
+    for i, (page, text) in enumerate(pages):
+        start_offset=running_offset
+        end_offset=start_offset + len(text) - 1 if text else start_offset
+        page_map[i]={
+            "page": page,
+            "document_index": i,
+            "text_length": len(text),
+            "start_offset": start_offset,
+            "end_offset": end_offset
+        }
+        running_offset += len(text) + len(PAGE_SEPARATOR)
+
+    return markdown_text, page_map
+
+def parse_pdf(doc_id:str, use_cache:bool=True)->Tuple[str,Dict[int,Any]]:
+    """
+    Parse documents/{doc_id}/original.pdf into markdown and a page_map.
+
+    The result is cached in R2 under the PDF's sha256, so re-parsing the
+    same bytes (re-uploads, the same policy under another doc_id) is a
+    download. use_cache=False forces a fresh parse (the cache is still
+    refreshed).
+    """
     pdf_key=f"documents/{doc_id}/original.pdf"
 
+    # Step 1: Cached parse of the same PDF bytes
+    cache_prefix=PARSE_CACHE_PREFIX + _pdf_sha256(pdf_key) + "/"
+    if use_cache and all(transfer_pool.map(_object_exists, _parsed_keys(cache_prefix))):
+        markdown_text, page_map=_get_parsed(cache_prefix)
+        parse_stats["cache_hits"] += 1
+        return markdown_text, {int(key): info for key, info in page_map.items()}
+
     presigned_url=r2_client.generate_presigned_url(
         "get_object",
         Params={
             "Bucket":R2_BUCKET,
             "Key":pdf_key
         },
-        ExpiresIn=900 # 15 minutes
+        ExpiresIn=3600 # 1 hour: covers every range job of a large PDF
     )
 
-    docs=parser.load_data(presigned_url)
-    markdown_text = "\n\n".join(d.text for d in docs)
-
-    page_map = {}
-    running_offset = 0  # cumulative character offset across pages
-    for i, d in enumerate(docs):
-        doc_text_len = len(d.text) if hasattr(d, "text") else 0
-        start_offset = running_offset
-        end_offset = start_offset + doc_text_len - 1 if doc_text_len else start_offset
-        page_map[i] = {
-            "page": i + 1,
-            "document_index": i,
-            "text_length": doc_text_len,
-            "start_offset": start_offset,
-            "end_offset": end_offset
-        }
-        running_offset += doc_text_len
-    
+    # Step 2: Parse, as concurrent page ranges if the PDF is large
+    page_count=_pdf_page_count(pdf_key)
+    if page_count is None or page_count <= PARSE_PAGES_PER_RANGE:
+        docs=parser.load_data(presigned_url)
+        pages=[(i + 1, d.text if hasattr(d, "text") else "") for i, d in enumerate(docs)]
+        parse_stats["ranges"] += 1
+    else:
+        page_ranges=_page_ranges(page_count, PARSE_PAGES_PER_RANGE)
+        with ThreadPoolExecutor(max_workers=min(PARSE_CONCURRENCY, len(page_ranges)), thread_name_prefix="llamaparse") as pool:
+            pages=[page for range_pages in pool.map(lambda page_range: _parse_range(presigned_url, page_range), page_ranges) for page in range_pages]
+        parse_stats["ranges"] += len(page_ranges)
+    parse_stats["parsed"] += 1
+
+    # Step 3: Stitch, then cache under the content hash
+    markdown_text, page_map=stitch_pages(pages)
+    _put_parsed(cache_prefix, markdown_text, page_map)
     return markdown_text, page_map
 
-def upload_parsed_files(doc_id:str,markdown_text:str,page_map:Dict[str,Any]):
-    base_prefix=f"documents/{doc_id}/"
-    markdown_key=base_prefix + "markdown.md"
-    page_map_key=base_prefix + "page_map.json"
-
-    r2_client.put_object(
-        Bucket=R2_BUCKET,
-        Key=markdown_key,
-        Body=markdown_text.encode("utf-8"),
-        ContentType="text/markdown"
-    )
+def _parsed_keys(base_prefix:str) -> Tuple[str,str]:
+    return base_prefix + "markdown.md", base_prefix + "page_map.json"
 
-    r2_client.put_object(
-        Bucket=R2_BUCKET,
-        Key=page_map_key,
-        Body=json.dumps(page_map,indent=2).encode("utf-8"),
-        ContentType="application/json"
-    )
+def _put_parsed(base_prefix:str,markdown_text:str,page_map:Dict[str,Any]) -> Tuple[str,str]:
+    markdown_key, page_map_key=_parsed_keys(base_prefix)
 
-    return markdown_key, page_map_key
+    def put(key:str,body:bytes,content_type:str):
+        response=r2_client.put_object(
+            Bucket=R2_BUCKET,
+            Key=key,
+            Body=body,
+            ContentType=content_type
+        )
+        _remember_upload(key, body, response["ETag"])
 
-def download_parsed_files(doc_id: str) -> Tuple[str, Dict[str, Any]]:
+    # Both uploads in parallel
+    uploads=[
+        transfer_pool.submit(put, markdown_key, markdown_text.encode("utf-8"), "text/markdown"),
+        transfer_pool.submit(put, page_map_key, json.dumps(page_map,indent=2).encode("utf-8"), "application/json")
+    ]
+    for upload in uploads:
+        upload.result()
+
+    return markdown_key, page_map_key
 
-    base_prefix = f"documents/{doc_id}/"
-    markdown_key = base_prefix + "markdown.md"
-    page_map_key = base_prefix + "page_map.json"
+def _get_parsed(base_prefix:str) -> Tuple[str, Dict[str, Any]]:
+    markdown_key, page_map_key = _parsed_keys(base_prefix)
 
-    # download markdown
-    md_obj = r2_client.get_object(Bucket=R2_BUCKET, Key=markdown_key)
-    markdown_text = md_obj["Body"].read().decode("utf-8")
+    if not R2_CACHE_DIR:
+        # No cache: both bodies in parallel, straight into memory
+        bodies = transfer_pool.map(
+            lambda key: r2_client.get_object(Bucket=R2_BUCKET, Key=key)["Body"].read().decode("utf-8"),
+            [markdown_key, page_map_key]
+        )
+        markdown_text, page_map_json = bodies
+        return markdown_text, json.loads(page_map_json)
 
-    # download page_map
-    page_map_obj = r2_client.get_object(Bucket=R2_BUCKET, Key=page_map_key)
-    page_map = json.loads(page_map_obj["Body"].read().decode("utf-8"))
+    # Both through the artifact cache, in parallel (unchanged objects are 304s)
+    paths = fetch_objects([markdown_key, page_map_key])
+    markdown_text = paths[markdown_key].read_text(encoding="utf-8")
+    page_map = json.loads(paths[page_map_key].read_text(encoding="utf-8"))
 
     return markdown_text, page_map
+
+def upload_parsed_files(doc_id:str,markdown_text:str,page_map:Dict[str,Any]):
+    return _put_parsed(f"documents/{doc_id}/", markdown_text, page_map)
+
+def download_parsed_files(doc_id: str) -> Tuple[str, Dict[str, Any]]:
+    return _get_parsed(f"documents/{doc_id}/")
+
+def list_doc_ids(prefix: str = "documents/") -> List[str]:
+    """
+    List doc_ids stored under an R2 prefix (one "folder" per document:
+    {prefix}{doc_id}/...).
+    """
+    if not prefix.endswith("/"):
+        prefix += "/"
+    doc_ids = []
+    paginator = r2_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=R2_BUCKET, Prefix=prefix, Delimiter="/"):
+        for common_prefix in page.get("CommonPrefixes", []):
+            doc_ids.append(common_prefix["Prefix"][len(prefix):].rstrip("/"))
+    return doc_ids
+
+def parsed_files_exist(doc_id: str) -> bool:
+    """True if markdown.md and page_map.json are already stored for doc_id."""
+    return all(transfer_pool.map(_object_exists, _parsed_keys(f"documents/{doc_id}/")))
@@ -0,0 +1,186 @@
+"""
+Rate-limit-aware, bounded-concurrency scheduler for OpenAI calls.
+
+- A fixed pool of workers caps in-flight requests (max_concurrency)
+- Token buckets keep requests/min and tokens/min under the API tier limits
+- Rate-limit (429) and transient errors are retried with jittered
+  exponential backoff, honouring Retry-After; a 429 pauses every worker so
+  one throttled call doesn't turn into a storm
+- One failing item never fails the batch: it is reported and returns None
+- Progress and throughput are logged as calls complete, whether they come
+  from run() or from callers running their own workers through call()
+"""
+import os
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, TypeVar
+import openai
+from tracing import get_logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+DEFAULT_RPM = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+DEFAULT_TPM = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """Continuous-refill token bucket with a per-minute budget."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_per_second = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)  # a single oversized request must still be able to run
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.refill_per_second)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Server-suggested wait in seconds, if the error response carries one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitedScheduler:
+    def __init__(
+        self,
+        name: str = "requests",
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_minute: int = DEFAULT_RPM,
+        tokens_per_minute: int = DEFAULT_TPM,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        progress_every: int = 50,
+    ):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.progress_every = progress_every
+        self._paused_until = 0.0
+        self._started: Optional[float] = None  # first call (throughput is measured from here)
+        self.stats: Dict[str, Any] = {"done": 0, "failed": 0, "retries": 0, "rate_limited": 0}
+        self.errors: Dict[int, Exception] = {}
+
+    async def call(self, fn: Callable[[T], Awaitable[R]], item: T, tokens: int = 1) -> R:
+        """
+        Run fn(item) with rate limiting and jittered exponential backoff
+        (raises after max_retries). Counts the outcome in stats["done"] /
+        stats["failed"] and logs progress every progress_every calls.
+        """
+        if self._started is None:
+            self._started = time.monotonic()
+        try:
+            result = await self._call_with_retries(fn, item, tokens)
+        except Exception:
+            self.stats["failed"] += 1
+            self._progress()
+            raise
+        self.stats["done"] += 1
+        self._progress()
+        return result
+
+    async def _call_with_retries(self, fn: Callable[[T], Awaitable[R]], item: T, tokens: int) -> R:
+        attempt = 0
+        while True:
+            # Respect a global pause triggered by any worker's 429
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(tokens)
+            try:
+                return await fn(item)
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                delay = _retry_after(e) or random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if isinstance(e, openai.RateLimitError):
+                    self.stats["rate_limited"] += 1
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                await asyncio.sleep(delay)
+
+    async def run(
+        self,
+        fn: Callable[[T], Awaitable[R]],
+        items: Sequence[T],
+        estimate_tokens: Callable[[T], int] = lambda item: 1,
+    ) -> List[Optional[R]]:
+        """
+        Apply fn to every item through the worker pool.
+
+        Returns:
+            Results in input order; None where an item failed after retries
+            (the exception is kept in self.errors[index])
+        """
+        results: List[Optional[R]] = [None] * len(items)
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in range(len(items)):
+            queue.put_nowait(index)
+
+        async def worker():
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    results[index] = await self.call(fn, items[index], estimate_tokens(items[index]))
+                except Exception as e:  # one bad item must not sink the batch
+                    self.errors[index] = e
+                    logger.warning(f"{self.name} item {index} failed: {type(e).__name__}: {e}")
+
+        await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, len(items)))))
+        if items:
+            self.report()
+        return results
+
+    def _progress(self):
+        if (self.stats["done"] + self.stats["failed"]) % self.progress_every == 0:
+            self.report()
+
+    def report(self):
+        """Log calls finished so far, throughput since the first call, retries and failures."""
+        finished = self.stats["done"] + self.stats["failed"]
+        elapsed = max(time.monotonic() - (self._started or time.monotonic()), 1e-9)
+        self.stats["throughput_per_s"] = round(finished / elapsed, 2)
+        logger.info(
+            f"{self.name}: {finished} done ({self.stats['throughput_per_s']}/s), "
+            f"{self.stats['retries']} retries ({self.stats['rate_limited']} rate-limited), {self.stats['failed']} failed"
+        )
@@ -1,253 +1,528 @@
 import os
-import chromadb
-from openai import OpenAI
-from dotenv import load_dotenv
-from rank_bm25 import BM25Okapi
-from model.schema import DenseRetrievalResults, SparseRetrievalResults, QueryRetrievalResult, RetrievalChunk, RankedChunk, FinalRankedResults
-from query_translate import query_translate
-from typing import List, Tuple
-
-
-load_dotenv()
-
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_or_create_collection(
-    name="vector_store",
-    metadata={"hnsw:space": "cosine"}  
-)
-
-# Initialize BM25 index once at module load (for sparse retrieval)
-print("Loading all chunks for BM25 index...")
-all_chunks_data = collection.get(include=["metadatas"])
-metadatas = all_chunks_data.get("metadatas", []) if all_chunks_data else []
-
-if len(metadatas) == 0:
-    print("WARNING: No chunks found in ChromaDB. Run `python src/main.py` to build the vector store.")
-    bm25_corpus = []
-    tokenized_corpus = []
-    bm25_index = None
-else:
-    bm25_corpus = [metadata["text"] for metadata in metadatas]
-    tokenized_corpus = [doc.lower().split() for doc in bm25_corpus]
-    bm25_index = BM25Okapi(tokenized_corpus)
-    print(f"BM25 index ready with {len(bm25_corpus)} chunks")
-
-
-def hybrid_retrieval(query:str)->Tuple[DenseRetrievalResults,SparseRetrievalResults]:
-    final_queries = query_translate(query)
-    all_queries = [final_queries.original_query] + final_queries.variations
-    print(f"Total queries: {len(all_queries)}")
-    dense_results = dense_retrieval(all_queries)
-    sparse_results = sparse_retrieval(all_queries)
-    return dense_results, sparse_results
+import asyncio
+import threading
+import numpy as np
+from bm25_index import BM25Index, tokenize
+from chunk_store import ChunkStore
+from engine import get_engine, snapshot_stamp
+from index_store import DENSE_BACKEND, VECTOR_QUANTIZATION, MATRYOSHKA_DIM, MATRYOSHKA_CANDIDATES
+from vector_index import two_stage_search
+from model.schema import RankedChunk, FinalRankedResults
+from retrieval_records import QueryHits, RetrievalHits, FusedHit
+from query_translate import query_translate, query_translate_stream, cached_variations
+from embedding_cache import embed_texts
+from tracing import span, get_logger
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 
-# DENSE RETRIEVAL
+logger = get_logger(__name__)
+
+# OpenAI / ChromaDB clients and the chunk store + BM25 index live on the shared
+# engine and are created on first use (see engine.py)
+#
+# Between stages, hits are retrieval_records (chunk store rows + scores); the
+# Pydantic models are built only for the final ranking (merge_and_rerank)
+
+
+def get_indexes() -> Tuple[ChunkStore, BM25Index]:
+    """Chunk store and BM25 index, loaded once per process by the shared engine."""
+    return get_engine().get_indexes()
+
+
+def get_chunk_store() -> ChunkStore:
+    return get_indexes()[0]
+
 
-def dense_retrieval(all_queries: List[str]) -> DenseRetrievalResults:
+def get_bm25_index() -> BM25Index:
+    return get_indexes()[1]
+
+
+def index_version() -> str:
+    """
+    Cheap version stamp of everything retrieval reads (used to invalidate caches).
     
-    # Step 2: Retrieve for each query
-    results = []
+    Combines the Chroma collection size with the BM25 snapshot file stamp;
+    ingestion rewrites the snapshot whenever it changes the collection.
+    """
+    return f"{get_engine().collection.count()}:{snapshot_stamp()}"
+
+
+def embed_query(query: str) -> List[float]:
+    """Embedding of a single query (through the embedding cache)."""
+    return embed_texts(get_engine().openai_client, [query])[0]
+
+
+def hybrid_retrieval(query:str, concurrent: bool = True, adaptive: Optional[bool] = None)->Tuple[RetrievalHits,RetrievalHits]:
+    """
+    Dense + BM25 retrieval for the query and its variations.
     
-    for q in all_queries:
-        print(f"Retrieving for: {q}")
+    With adaptive (default: ADAPTIVE_TRANSLATION), the original query is
+    retrieved first and variations are only generated when its dense and
+    BM25 results disagree (see needs_translation); otherwise the results
+    cover the original query alone.
+    """
+    adaptive = ADAPTIVE_TRANSLATION if adaptive is None else adaptive
+    with span("hybrid_retrieval", concurrent=concurrent, adaptive=adaptive):
+        if concurrent:
+            return asyncio.run(hybrid_retrieval_async(query, adaptive=adaptive))
         
-        # Embed the query
-        query_embedding = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=q
-        ).data[0].embedding
+        cached = cached_variations(query)
+        first_pass = adaptive and cached is None
+        if first_pass:
+            dense_results, sparse_results = dense_retrieval([query]), sparse_retrieval([query])
+            if not _translation_gate(dense_results.results[0], sparse_results.results[0]):
+                translation_stats.record("skipped")
+                return dense_results, sparse_results
+        translation_stats.record("cached" if cached is not None else "generated")
         
-        # Search ChromaDB (which has summary embeddings)
-        search_results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=5,
-            include=["metadatas", "distances"]
-        )
+        final_queries = query_translate(query, cached=cached)
+        all_queries = [final_queries.original_query] + final_queries.variations
+        logger.info(f"Total queries: {len(all_queries)}")
+        if not first_pass:
+            return dense_retrieval(all_queries), sparse_retrieval(all_queries)
+        
+        # The original query was already retrieved by the first pass: only the variations remain
+        dense_results = RetrievalHits("dense", dense_results.results + dense_retrieval(final_queries.variations).results)
+        sparse_results = RetrievalHits("sparse", sparse_results.results + sparse_retrieval(final_queries.variations).results)
+        return dense_results, sparse_results
+
+
+async def hybrid_retrieval_async(query: str, translate: Optional[Callable[[str, Optional[List[str]]], AsyncIterator[str]]] = None,
+                                 adaptive: Optional[bool] = None) -> Tuple[RetrievalHits, RetrievalHits]:
+    """
+    Run hybrid retrieval as a concurrent DAG instead of a sequence.
+    
+    Dense and sparse retrieval for the original query start immediately,
+    alongside query translation. Each variation gets its own dense and sparse
+    branch as soon as the translation stream yields it, so total time is close
+    to the slowest single branch rather than the sum of all of them.
+    
+    With adaptive, variations are only used if needs_translation says they
+    are likely to help once the original query's results are in. Translation
+    then starts after that first pass, unless SPECULATIVE_TRANSLATION starts
+    it alongside (and cancels it if the first pass is conclusive): that hides
+    the first pass's latency on queries that need variations, but every
+    query pays for at least part of a translation call.
+    
+    Args:
+        query: Original user query
+        translate: translate(query, cached) -> async stream of variations,
+            where cached is the variation cache lookup already done here.
+            Default: the blocking query_translate_stream run in a worker
+            thread. The HTTP service passes query_translate_stream_async so
+            that cancelling the call also aborts the translation request.
+        adaptive: Gate translation on the first pass (default:
+            ADAPTIVE_TRANSLATION). Cached variations are always used.
+    """
+    adaptive = ADAPTIVE_TRANSLATION if adaptive is None else adaptive
+    cached = cached_variations(query)
+    gated = adaptive and cached is None
+    variations = (translate or _threaded_variations)(query, cached)  # lazy: nothing runs until iterated
+    variation_queue: asyncio.Queue = asyncio.Queue()
+    translation = None
+    
+    async def forward_variations():
+        try:
+            async for variation in variations:
+                variation_queue.put_nowait(variation)
+        finally:
+            variation_queue.put_nowait(None)  # end of stream
+    
+    # Original query branches start right away, in parallel with translation
+    dense_tasks = [asyncio.create_task(asyncio.to_thread(_dense_retrieval_serial, [query]))]
+    sparse_tasks = [asyncio.create_task(asyncio.to_thread(_sparse_retrieval, [query]))]
+    
+    try:
+        if not gated or SPECULATIVE_TRANSLATION:
+            translation = asyncio.create_task(forward_variations())
+        if gated:
+            (first_dense,), (first_sparse,) = await asyncio.gather(dense_tasks[0], sparse_tasks[0])
+            if not _translation_gate(first_dense, first_sparse):
+                translation_stats.record("skipped", speculative=translation is not None)
+                logger.info("Total queries: 1 (translation skipped)")
+                if translation is not None:
+                    translation.cancel()
+                    await asyncio.gather(translation, return_exceptions=True)
+                return RetrievalHits("dense", [first_dense]), RetrievalHits("sparse", [first_sparse])
+        translation_stats.record("cached" if cached is not None else "generated")
+        if translation is None:
+            translation = asyncio.create_task(forward_variations())
         
-        # Convert to RetrievalChunk objects
-        chunks = []
-        for i, metadata in enumerate(search_results["metadatas"][0]):
-            # For cosine distance: similarity = 1 - distance (distance is 0-2, similarity is 0-1)
-            similarity_score = 1 - search_results["distances"][0][i]
-            
-            chunk = RetrievalChunk(
-                chunk_id=metadata["chunk_id"],
-                text=metadata["text"],
-                similarity_score=round(similarity_score, 4),
-                page_start=metadata["page_start"],
-                page_end=metadata["page_end"]
-            )
-            chunks.append(chunk)
+        # Fan out each variation as it arrives
+        while (variation := await variation_queue.get()) is not None:
+            dense_tasks.append(asyncio.create_task(asyncio.to_thread(_dense_retrieval_serial, [variation])))
+            sparse_tasks.append(asyncio.create_task(asyncio.to_thread(_sparse_retrieval, [variation])))
+        await translation  # re-raises a failed translation
         
-        # Create QueryRetrievalResult for this query
-        query_result = QueryRetrievalResult(
-            question=q,
-            chunks=chunks
+        dense_parts, sparse_parts = await asyncio.gather(
+            asyncio.gather(*dense_tasks),
+            asyncio.gather(*sparse_tasks)
         )
-        results.append(query_result)
+    except BaseException:
+        for task in [*dense_tasks, *sparse_tasks, *([translation] if translation else [])]:
+            task.cancel()
+        raise
+    
+    logger.info(f"Total queries: {len(dense_tasks)}")
+    
+    # Tasks were created in query order: original first, then variations
+    dense_results = RetrievalHits("dense", [r for part in dense_parts for r in part])
+    sparse_results = RetrievalHits("sparse", [r for part in sparse_parts for r in part])
+    return dense_results, sparse_results
+
+
+async def _threaded_variations(query: str, cached: Optional[List[str]]) -> AsyncIterator[str]:
+    """query_translate_stream in a worker thread, as an async stream."""
+    loop = asyncio.get_running_loop()
+    variation_queue: asyncio.Queue = asyncio.Queue()
+    
+    def stream_variations():
+        try:
+            with span("query_translate", streaming=True) as s:
+                for variation in query_translate_stream(query, cached=cached):
+                    s.add("variations")
+                    loop.call_soon_threadsafe(variation_queue.put_nowait, variation)
+        finally:
+            loop.call_soon_threadsafe(variation_queue.put_nowait, None)  # end of stream
+    
+    translation = asyncio.create_task(asyncio.to_thread(stream_variations))
+    try:
+        while (variation := await variation_queue.get()) is not None:
+            yield variation
+        await translation
+    finally:
+        translation.cancel()
+
+
+# ADAPTIVE QUERY TRANSLATION
+#
+# Variations cost a gpt-5-mini round-trip before they can be searched. When
+# the original query's dense and BM25 results already agree (same top chunk,
+# overlapping top 5) and at least one of them has a clear winner, rewording
+# the query rarely changes the merged top-k, so the call is skipped.
+
+ADAPTIVE_TRANSLATION = os.getenv("ADAPTIVE_TRANSLATION", "1") == "1"
+SPECULATIVE_TRANSLATION = os.getenv("SPECULATIVE_TRANSLATION", "0") == "1"  # async path: translate during the first pass
+SKIP_MIN_OVERLAP = float(os.getenv("TRANSLATION_SKIP_MIN_OVERLAP", "0.4"))  # share of the top 5 found by both
+SKIP_MIN_DENSE_MARGIN = float(os.getenv("TRANSLATION_SKIP_MIN_DENSE_MARGIN", "0.03"))  # similarity gap, dense #1 vs #2
+SKIP_MIN_SPARSE_MARGIN = float(os.getenv("TRANSLATION_SKIP_MIN_SPARSE_MARGIN", "0.2"))  # relative BM25 gap, #1 vs #2
+
+
+class TranslationStats:
+    """
+    How often translation was skipped, served from the variation cache, or
+    generated. A skip after a speculative start still made (part of) the call.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"skipped": 0, "cached": 0, "generated": 0}
+        self.speculative_skips = 0
+    
+    def record(self, outcome: str, speculative: bool = False):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.speculative_skips += speculative
+    
+    def reset(self):
+        with self._lock:
+            self.counts = dict.fromkeys(self.counts, 0)
+            self.speculative_skips = 0
+    
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counts = dict(self.counts)
+            speculative_skips = self.speculative_skips
+        total = sum(counts.values())
+        saved = counts["skipped"] - speculative_skips + counts["cached"]
+        return {
+            **counts,
+            "total": total,
+            "speculative_skips": speculative_skips,
+            "skip_rate": round(counts["skipped"] / total, 4) if total else 0.0,
+            "llm_calls_saved_rate": round(saved / total, 4) if total else 0.0,
+        }
+
+
+translation_stats = TranslationStats()
+
+
+def agreement_signals(dense: QueryHits, sparse: QueryHits) -> Dict[str, float]:
+    """Agreement and score margins of one query's dense and BM25 results."""
+    dense_keys = dense.keys()
+    sparse_keys = sparse.keys()
+    overlap = len(set(dense_keys) & set(sparse_keys)) / max(len(dense_keys), len(sparse_keys), 1)
+    top1_agree = bool(dense_keys) and bool(sparse_keys) and dense_keys[0] == sparse_keys[0]
+    
+    dense_scores = dense.scores
+    sparse_scores = sparse.scores
+    dense_margin = dense_scores[0] - dense_scores[1] if len(dense_scores) > 1 else 0.0
+    sparse_margin = (sparse_scores[0] - sparse_scores[1]) / sparse_scores[0] if len(sparse_scores) > 1 and sparse_scores[0] > 0 else 0.0
+    return {
+        "overlap": round(overlap, 3),
+        "top1_agree": top1_agree,
+        "dense_margin": round(dense_margin, 4),
+        "sparse_margin": round(sparse_margin, 4),
+    }
+
+
+def needs_translation(signals: Dict[str, float]) -> bool:
+    """False when the original query's results agree and one retriever has a clear winner."""
+    clear_winner = signals["dense_margin"] >= SKIP_MIN_DENSE_MARGIN or signals["sparse_margin"] >= SKIP_MIN_SPARSE_MARGIN
+    return not (signals["top1_agree"] and signals["overlap"] >= SKIP_MIN_OVERLAP and clear_winner)
+
+
+def _translation_gate(dense: QueryHits, sparse: QueryHits) -> bool:
+    """Decide (and trace) whether to generate variations for a query."""
+    signals = agreement_signals(dense, sparse)
+    with span("translation_gate", **signals) as s:
+        translate = needs_translation(signals)
+        s.set(translate=translate)
+    return translate
+
+
+# DENSE RETRIEVAL
+
+def dense_retrieval(all_queries: List[str], batched: bool = True, backend: Optional[str] = None) -> RetrievalHits:
+    """
+    Dense retrieval over chunk summary embeddings.
+
+    Args:
+        all_queries: Original query followed by its variations
+        batched: Embed every query in one request and search with a single
+            multi-embedding query (default). When False, each query is
+            embedded and searched on its own.
+        backend: "chroma" (HNSW), "flat" (exact scan over the in-process
+            vector index) or "two_stage" (scan a MATRYOSHKA_DIM-d prefix
+            index, re-score the candidates with the full vectors), see
+            vector_index. Default: $DENSE_BACKEND.
+
+    Returns:
+        RetrievalHits with one QueryHits per query, in order (to_model()
+        gives DenseRetrievalResults)
+    """
+    backend = backend or DENSE_BACKEND
+    with span("dense_retrieval", queries=len(all_queries), batched=batched, backend=backend) as s:
+        if batched:
+            results = _dense_retrieval_batched(all_queries, backend)
+        else:
+            results = _dense_retrieval_serial(all_queries, backend)
+        s.set(chunks=sum(len(r) for r in results))
     
-    print(f"Dense retrieval complete. Retrieved {len(results)} query results with {len(results) * 5} total chunks")
+    logger.info(f"Dense retrieval complete. Retrieved {len(results)} query results with {len(results) * 5} total chunks")
+    
+    return RetrievalHits("dense", results)
+
+
+def _dense_retrieval_batched(all_queries: List[str], backend: Optional[str] = None) -> List[QueryHits]:
+    """One embeddings round-trip and one vector search for all queries."""
+    logger.debug(f"Retrieving (batched) for {len(all_queries)} queries")
     
-    # Return DenseRetrievalResults
-    return DenseRetrievalResults(results=results)
+    # Embed all queries in a single request (cached queries skip the API entirely)
+    query_embeddings = embed_texts(get_engine().openai_client, all_queries)
+    
+    # Search once with every query embedding, then fan results back out per query
+    return _dense_search(all_queries, query_embeddings, backend)
+
+
+def _dense_retrieval_serial(all_queries: List[str], backend: Optional[str] = None) -> List[QueryHits]:
+    """One embeddings round-trip and one vector search per query."""
+    results = []
+    
+    for q in all_queries:
+        logger.debug(f"Retrieving for: {q}")
+        
+        with span("dense_query"):
+            # Embed the query (through the embedding cache)
+            query_embedding = embed_texts(get_engine().openai_client, [q])[0]
+            results.extend(_dense_search([q], [query_embedding], backend))
+    
+    return results
+
+
+def _dense_search(questions: List[str], query_embeddings: List[List[float]], backend: Optional[str] = None, k: int = 5) -> List[QueryHits]:
+    """Top-k summary embeddings for each query embedding, from ChromaDB or the flat vector index(es)."""
+    backend = backend or DENSE_BACKEND
+    
+    if backend in ("flat", "two_stage"):
+        vector_index = get_engine().get_vector_index()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if backend == "two_stage":
+            coarse_index = get_engine().get_vector_index(VECTOR_QUANTIZATION, dims=MATRYOSHKA_DIM)
+            with span("two_stage.query", queries=len(queries), dims=coarse_index.dim, candidates=MATRYOSHKA_CANDIDATES):
+                rows, scores = two_stage_search(coarse_index, vector_index, queries, k, MATRYOSHKA_CANDIDATES)
+        else:
+            with span("flat.query", queries=len(queries), quantization=vector_index.quantization):
+                rows, scores = vector_index.search(queries, k)
+        chunk_store = get_chunk_store()
+        return [
+            QueryHits(q, chunk_store, rows[i].tolist(), [round(score, 4) for score in scores[i].tolist()])
+            for i, q in enumerate(questions)
+        ]
+    
+    # ChromaDB (which has summary embeddings)
+    with span("chroma.query", queries=len(query_embeddings)):
+        search_results = get_engine().collection.query(
+            query_embeddings=query_embeddings,
+            n_results=k,
+            include=["distances"]  # chunk data comes from the chunk store, not Chroma metadata
+        )
+    return [
+        _to_query_result(q, search_results["ids"][i], search_results["distances"][i])
+        for i, q in enumerate(questions)
+    ]
+
+
+def _to_query_result(question: str, ids: List[str], distances: List[float]) -> QueryHits:
+    """
+    Convert one query's ChromaDB hits into chunk store rows.
+
+    Hits the chunk store doesn't know yet (stored after its snapshot) are
+    skipped, and the indexes are re-checked against ChromaDB on the next call.
+    """
+    chunk_store = get_chunk_store()
+    rows, scores = [], []
+    unknown = 0
+    for chroma_id, distance in zip(ids, distances):
+        row = chunk_store.row_by_id.get(chroma_id)
+        if row is None:
+            unknown += 1
+            continue
+        rows.append(row)
+        # For cosine distance: similarity = 1 - distance (distance is 0-2, similarity is 0-1)
+        scores.append(round(1 - distance, 4))
+    if unknown:
+        logger.warning(f"Skipped {unknown} dense hits missing from the chunk store (snapshot behind ChromaDB); reloading indexes")
+        get_engine().mark_indexes_stale()
+    return QueryHits(question, chunk_store, rows, scores)
 
 
 # SPARSE RETRIEVAL (BM25)
 
-def sparse_retrieval(all_queries: List[str]) -> SparseRetrievalResults:
-    """Uses pre-built global BM25 index for fast keyword search."""
+def sparse_retrieval(all_queries: List[str]) -> RetrievalHits:
+    """Uses the BM25 snapshot index (loaded on first use) for fast keyword search."""
     
-    if bm25_index is None:
-        raise RuntimeError("BM25 index is empty. Run `python src/main.py` to build the vector store before querying.")
+    with span("sparse_retrieval", queries=len(all_queries)) as s:
+        results = _sparse_retrieval(all_queries)
+        s.set(chunks=sum(len(r) for r in results))
+    
+    logger.info(f"Sparse retrieval complete. Retrieved {len(results)} query results with {len(results) * 5} total chunks")
+    
+    return RetrievalHits("sparse", results)
+
+
+def _sparse_retrieval(all_queries: List[str]) -> List[QueryHits]:
+    """BM25 top-5 for each query against the shared BM25 index."""
     
-    # Step 1: Retrieve for each query (using global bm25_index)
+    chunk_store, bm25_index = get_indexes()
+    
+    # Step 1: Retrieve for each query
     results = []
     
     for q in all_queries:
-        print(f"BM25 retrieving for: {q}")
+        logger.debug(f"BM25 retrieving for: {q}")
         
         # Tokenize query
-        tokenized_query = q.lower().split()
-        
-        # Get BM25 scores for all documents
-        scores = bm25_index.get_scores(tokenized_query)
+        tokenized_query = tokenize(q)
         
-        # Get top 5 indices
-        top_k_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:5]
+        # Score only documents in the query terms' postings and take the top 5
+        with span("bm25_query", terms=len(tokenized_query)):
+            top_k = bm25_index.top_k(tokenized_query, k=5)
         
-        # Convert to RetrievalChunk objects
-        chunks = []
-        for idx in top_k_indices:
-            metadata = all_chunks_data["metadatas"][idx]
-            bm25_score = scores[idx]
-            
-            chunk = RetrievalChunk(
-                chunk_id=metadata["chunk_id"],
-                text=metadata["text"],
-                similarity_score=round(bm25_score, 4),  # BM25 score (not 0-1 range)
-                page_start=metadata["page_start"],
-                page_end=metadata["page_end"]
-            )
-            chunks.append(chunk)
-        
-        # Create QueryRetrievalResult for this query
-        query_result = QueryRetrievalResult(
-            question=q,
-            chunks=chunks
-        )
-        results.append(query_result)
+        # BM25 rows are chunk store rows; BM25 scores are not in the 0-1 range
+        results.append(QueryHits(
+            q,
+            chunk_store,
+            [row for row, _ in top_k],
+            [round(bm25_score, 4) for _, bm25_score in top_k]
+        ))
     
-    print(f"Sparse retrieval complete. Retrieved {len(results)} query results with {len(results) * 5} total chunks")
-    
-    # Return SparseRetrievalResults
-    return SparseRetrievalResults(results=results)
+    return results
 
 
 # MERGE AND RERANK USING RRF
 
-def merge_and_rerank(dense_results: DenseRetrievalResults, sparse_results: SparseRetrievalResults, top_k: int = 10) -> FinalRankedResults:
+def merge_and_rerank(dense_results: RetrievalHits, sparse_results: RetrievalHits, top_k: int = 10) -> FinalRankedResults:
     """
     Merge dense and sparse results using Reciprocal Rank Fusion (RRF).
-    Deduplicates by chunk_id and reranks by combined RRF score.
+    Deduplicates by (doc_id, chunk_id) and reranks by combined RRF score.
     
     Args:
-        dense_results: Results from dense retrieval (20 chunks)
-        sparse_results: Results from sparse retrieval (20 chunks)
+        dense_results: Results from dense retrieval (20 chunks);
+            DenseRetrievalResults are accepted too
+        sparse_results: Results from sparse retrieval (20 chunks);
+            SparseRetrievalResults are accepted too
         top_k: Number of top chunks to return (default: 10)
         
     Returns:
         FinalRankedResults with deduplicated and reranked chunks
     """
-    print(f"\nMerging and reranking results...")
-    
-    # Step 1: Flatten all results with rank information
-    all_results = []
-    
-    # From dense retrieval
-    for query_result in dense_results.results:
-        for rank, chunk in enumerate(query_result.chunks):
-            all_results.append({
-                "chunk_id": chunk.chunk_id,
-                "chunk": chunk,
-                "rank": rank,
-                "source": "dense"
-            })
-    
-    # From sparse retrieval
-    for query_result in sparse_results.results:
-        for rank, chunk in enumerate(query_result.chunks):
-            all_results.append({
-                "chunk_id": chunk.chunk_id,
-                "chunk": chunk,
-                "rank": rank,
-                "source": "sparse"
-            })
-    
-    total_before_dedup = len(all_results)
-    print(f"Total chunks before deduplication: {total_before_dedup}")
-    
-    # Step 2: Calculate RRF scores (deduplicates by chunk_id)
-    rrf_scores = {}
+    if not isinstance(dense_results, RetrievalHits):
+        dense_results = RetrievalHits.from_model("dense", dense_results, get_chunk_store())
+    if not isinstance(sparse_results, RetrievalHits):
+        sparse_results = RetrievalHits.from_model("sparse", sparse_results, get_chunk_store())
+    
+    with span("merge_and_rerank", top_k=top_k) as s:
+        final_results = _merge_and_rerank(dense_results, sparse_results, top_k)
+        s.set(
+            chunks_before_dedup=final_results.total_before_dedup,
+            chunks_after_dedup=final_results.total_after_dedup,
+            chunks_returned=len(final_results.chunks)
+        )
+    return final_results
+
+
+def _merge_and_rerank(dense_results: RetrievalHits, sparse_results: RetrievalHits, top_k: int) -> FinalRankedResults:
+    logger.debug("Merging and reranking results...")
+    query_results = dense_results.results + sparse_results.results
+    
+    # Step 1: Calculate RRF scores, deduplicating by chunk. Rows identify
+    # chunks within one store; hits from different stores (an index reload
+    # between stages) are matched by (doc_id, chunk_id) instead.
+    by_row = len({id(query_hits.store) for query_hits in query_results}) <= 1
+    fused: Dict[object, FusedHit] = {}
     k = 60  # Standard RRF constant
     
-    for result in all_results:
-        chunk_id = result["chunk_id"]
-        rank = result["rank"]
-        source = result["source"]
-        rrf_score = 1.0 / (k + rank)
-        
-        if chunk_id not in rrf_scores:
-            rrf_scores[chunk_id] = {
-                "chunk": result["chunk"],
-                "rrf_score": 0,
-                "appearances": 0,
-                "sources": set()
-            }
-        
-        rrf_scores[chunk_id]["rrf_score"] += rrf_score
-        rrf_scores[chunk_id]["appearances"] += 1
-        rrf_scores[chunk_id]["sources"].add(source)
-    
-    total_after_dedup = len(rrf_scores)
-    print(f"Total unique chunks after deduplication: {total_after_dedup}")
-    
-    # Step 3: Sort by RRF score
-    sorted_chunks = sorted(
-        rrf_scores.items(),
-        key=lambda x: x[1]["rrf_score"],
-        reverse=True
-    )
+    total_before_dedup = 0
+    for hits in (dense_results, sparse_results):
+        for query_hits in hits.results:
+            keys = query_hits.rows if by_row else query_hits.keys()
+            for rank, (key, row) in enumerate(zip(keys, query_hits.rows)):
+                entry = fused.get(key)
+                if entry is None:
+                    entry = fused[key] = FusedHit(query_hits.store, row)
+                entry.rrf_score += 1.0 / (k + rank)
+                entry.appearances += 1
+                entry.sources.add(hits.source)
+            total_before_dedup += len(query_hits)
+    
+    total_after_dedup = len(fused)
+    logger.debug(f"Total chunks before deduplication: {total_before_dedup}")
+    logger.debug(f"Total unique chunks after deduplication: {total_after_dedup}")
     
-    # Step 4: Convert to RankedChunk objects
+    # Step 2: Sort by RRF score (ties keep first-seen order)
+    ranked = sorted(fused.values(), key=lambda entry: entry.rrf_score, reverse=True)
+    
+    # Step 3: Build RankedChunk objects for the top k only; text, summary and
+    # offsets come straight from the chunk store row
     ranked_chunks = []
-    for chunk_id, data in sorted_chunks[:top_k]:
-        chunk = data["chunk"]
-        
-        # Get chunk_summary from ChromaDB metadata
-        chunk_metadata = collection.get(ids=[str(chunk.chunk_id)], include=["metadatas"])
-        chunk_summary = chunk_metadata["metadatas"][0]["chunk_summary"] if chunk_metadata["metadatas"] else ""
-        
-        # Convert sources set to sorted list
-        sources_list = sorted(list(data["sources"]))
-        
-        ranked_chunk = RankedChunk(
-            chunk_id=chunk.chunk_id,
-            text=chunk.text,
-            chunk_summary=chunk_summary,
-            page_start=chunk.page_start,
-            page_end=chunk.page_end,
-            rrf_score=round(data["rrf_score"], 6),
-            appearances=data["appearances"],
-            sources=sources_list
-        )
-        ranked_chunks.append(ranked_chunk)
+    for entry in ranked[:top_k]:
+        chunk_store, row = entry.store, entry.row
+        ranked_chunks.append(RankedChunk(
+            chunk_id=chunk_store.get(row, "chunk_id"),
+            doc_id=chunk_store.doc_ids[row],
+            text=chunk_store.text(row),
+            chunk_summary=chunk_store.summary(row),
+            page_start=chunk_store.get(row, "page_start"),
+            page_end=chunk_store.get(row, "page_end"),
+            rrf_score=round(entry.rrf_score, 6),
+            appearances=entry.appearances,
+            sources=sorted(entry.sources),
+            start_offset=chunk_store.get(row, "start_offset"),
+            end_offset=chunk_store.get(row, "end_offset")
+        ))
     
-    print(f"Returning top {len(ranked_chunks)} chunks")
+    logger.info(f"Returning top {len(ranked_chunks)} chunks")
     
     # Return FinalRankedResults
     return FinalRankedResults(
@@ -255,5 +530,3 @@ def merge_and_rerank(dense_results: DenseRetrievalResults, sparse_results: Spars
         total_before_dedup=total_before_dedup,
         total_after_dedup=total_after_dedup
     )
-
-
@@ -0,0 +1,130 @@
+"""
+Compact records passed between retrieval stages.
+
+Dense and sparse retrieval used to build a RetrievalChunk Pydantic model per
+hit (40 per question with 3 variations), each copying the chunk's full text
+out of the chunk store, validate them into QueryRetrievalResult and
+Dense/SparseRetrievalResults, and merge_and_rerank then flattened them into
+dicts again. Between stages a query's hits are now just chunk store rows
+and scores plus a reference to the store. Chunk fields are read from the
+store on access, so text is decoded only for the chunks that make the final
+ranking.
+
+The Pydantic models in model.schema are built at the boundary only:
+merge_and_rerank returns FinalRankedResults, and to_model() converts hits
+for callers that need the validated schema (from_model converts back).
+"""
+from typing import List, Tuple
+from chunk_store import ChunkStore
+from model.schema import RetrievalChunk, QueryRetrievalResult, DenseRetrievalResults, SparseRetrievalResults
+
+SOURCES = ("dense", "sparse")
+
+
+class ChunkHit:
+    """One hit: a chunk store row and its score. Fields are read from the store when accessed."""
+    __slots__ = ("store", "row", "similarity_score")
+
+    def __init__(self, store: ChunkStore, row: int, similarity_score: float):
+        self.store = store
+        self.row = row
+        self.similarity_score = similarity_score
+
+    @property
+    def chunk_id(self) -> int:
+        return self.store.get(self.row, "chunk_id")
+
+    @property
+    def doc_id(self) -> str:
+        return self.store.doc_ids[self.row]
+
+    @property
+    def text(self) -> str:
+        return self.store.text(self.row)
+
+    @property
+    def page_start(self) -> int:
+        return self.store.get(self.row, "page_start")
+
+    @property
+    def page_end(self) -> int:
+        return self.store.get(self.row, "page_end")
+
+    def to_model(self) -> RetrievalChunk:
+        return RetrievalChunk(
+            chunk_id=self.chunk_id,
+            doc_id=self.doc_id,
+            text=self.text,
+            similarity_score=self.similarity_score,
+            page_start=self.page_start,
+            page_end=self.page_end
+        )
+
+
+class QueryHits:
+    """Top hits for one question: chunk store rows and their scores, best first."""
+    __slots__ = ("question", "store", "rows", "scores")
+
+    def __init__(self, question: str, store: ChunkStore, rows: List[int], scores: List[float]):
+        self.question = question
+        self.store = store
+        self.rows = rows
+        self.scores = scores  # cosine similarity (dense) or BM25 score (sparse), rounded to 4 places
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def chunks(self) -> List[ChunkHit]:
+        """Per-hit views (built on access; the merge path never needs them)."""
+        return [ChunkHit(self.store, row, score) for row, score in zip(self.rows, self.scores)]
+
+    def keys(self) -> List[Tuple[str, int]]:
+        """(doc_id, chunk_id) of each hit."""
+        doc_ids, chunk_ids = self.store.doc_ids, self.store.columns["chunk_id"]
+        return [(doc_ids[row], int(chunk_ids[row])) for row in self.rows]
+
+    def to_model(self) -> QueryRetrievalResult:
+        return QueryRetrievalResult(question=self.question, chunks=[chunk.to_model() for chunk in self.chunks])
+
+
+class RetrievalHits:
+    """One retriever's hits for the original question and its variations, in query order."""
+    __slots__ = ("source", "results")
+
+    def __init__(self, source: str, results: List[QueryHits]):
+        if source not in SOURCES:
+            raise ValueError(f"Unknown retrieval source {source!r}, expected one of {SOURCES}")
+        self.source = source
+        self.results = results
+
+    def to_model(self):
+        """DenseRetrievalResults or SparseRetrievalResults (validated, chunk text copied in)."""
+        model = DenseRetrievalResults if self.source == "dense" else SparseRetrievalResults
+        return model(results=[query_hits.to_model() for query_hits in self.results])
+
+    @classmethod
+    def from_model(cls, source: str, results, store: ChunkStore) -> "RetrievalHits":
+        """Records for Dense/SparseRetrievalResults; chunks missing from the store are dropped."""
+        converted = []
+        for query_result in results.results:
+            rows, scores = [], []
+            for chunk in query_result.chunks:
+                row = store.row_for_chunk_id(chunk.chunk_id, chunk.doc_id)
+                if row is not None:
+                    rows.append(row)
+                    scores.append(chunk.similarity_score)
+            converted.append(QueryHits(query_result.question, store, rows, scores))
+        return cls(source, converted)
+
+
+class FusedHit:
+    """A chunk's accumulated Reciprocal Rank Fusion state in merge_and_rerank."""
+    __slots__ = ("store", "row", "rrf_score", "appearances", "sources")
+
+    def __init__(self, store: ChunkStore, row: int):
+        self.store = store
+        self.row = row
+        self.rrf_score = 0.0
+        self.appearances = 0
+        self.sources = set()
@@ -0,0 +1,368 @@
+"""
+Async HTTP query service (aiohttp), alongside the Streamlit app.
+
+Endpoints:
+    POST /query     {"query": ..., "top_k": 10, "timeout_s": 30, "stream": true}
+    POST /retrieve  {"query": ..., "top_k": 10, "timeout_s": 30}
+    GET  /health
+
+Every request shares one warm engine (one Chroma client, indexes loaded at
+startup) and the query cache, so many concurrent callers are served by one
+process.
+
+- Admission control: at most MAX_IN_FLIGHT pipeline runs at once.
+  Others wait up to QUEUE_TIMEOUT seconds for a slot (never past their own
+  deadline) and are then rejected with 503 and Retry-After.
+- Deadlines: each request gets timeout_s (default DEFAULT_TIMEOUT, capped
+  at MAX_TIMEOUT). When it passes, the request's pipeline task is
+  cancelled. That aborts in-flight LLM calls, which go through the async
+  Instructor client. The caller gets 504, or a final "error" event if the
+  stream had already started. A client disconnect cancels the same way.
+- Coalescing: concurrent requests for the same normalized query share one
+  pipeline run (singleflight) and get the same events/results. Admission
+  and the 503 apply per run, not per request. A run is cancelled only
+  when every request sharing it has gone.
+- Streaming: /query with "stream": true returns NDJSON events:
+    {"type": "retrieval", "results": {...}, "cached": false}
+    {"type": "delta", "text": "..."}            (repeated)
+    {"type": "answer", "answer": {...}, "trace_id": ..., "duration_ms": ...}
+    {"type": "error", "status": 504, "error": "..."}
+
+Usage (from the repo root):
+    python src/server.py --port 8080 --max-in-flight 8
+"""
+import os
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+from pydantic import ValidationError
+from model.schema import QueryRequest, FinalRankedResults
+from engine import get_engine
+from retrieval import hybrid_retrieval_async, merge_and_rerank, embed_query, index_version, translation_stats
+from query_translate import query_translate_stream_async, variation_cache
+from answer_gen import generate_answer_async, generate_answer_stream
+from query_cache import query_cache, normalize_query
+from embedding_cache import embedding_flight
+from singleflight import AsyncSingleFlight
+from tracing import configure_logging, get_logger, span
+
+HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+PORT = int(os.getenv("SERVER_PORT", "8080"))
+MAX_IN_FLIGHT = int(os.getenv("SERVER_MAX_IN_FLIGHT", "8"))
+QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", "2.0"))
+DEFAULT_TIMEOUT = float(os.getenv("SERVER_DEFAULT_TIMEOUT", "30"))
+MAX_TIMEOUT = float(os.getenv("SERVER_MAX_TIMEOUT", "120"))
+CACHEABLE_TOP_K = 10  # cached answers (shared with the app) were built from the top 10 chunks
+
+logger = get_logger(__name__)
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = asyncio.get_running_loop().time() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - asyncio.get_running_loop().time())
+
+
+class Admission:
+    """Bounded number of in-flight pipeline requests, with a short wait for a free slot."""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, queue_timeout: float = QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, deadline: Deadline):
+        """Hold one slot for the duration of the block; 503 if none frees up in time."""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), min(self.queue_timeout, deadline.remaining()))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise web.HTTPServiceUnavailable(
+                text=json.dumps({"error": "server busy, retry later"}),
+                content_type="application/json",
+                headers={"Retry-After": "1"},
+            )
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, default=str) + "\n").encode("utf-8")
+
+
+async def _parse_request(request: web.Request) -> QueryRequest:
+    try:
+        return QueryRequest.model_validate(await request.json())
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise web.HTTPBadRequest(text=json.dumps({"error": str(e)}), content_type="application/json")
+
+
+def _deadline(body: QueryRequest) -> Deadline:
+    return Deadline(min(body.timeout_s or DEFAULT_TIMEOUT, MAX_TIMEOUT))
+
+
+# PIPELINE
+
+async def retrieve(query: str, top_k: int) -> FinalRankedResults:
+    """Hybrid retrieval with async (cancellable) query translation, then RRF."""
+    dense_results, sparse_results = await hybrid_retrieval_async(query, query_translate_stream_async)
+    return merge_and_rerank(dense_results, sparse_results, top_k=top_k)
+
+
+async def answer_events(body: QueryRequest, stream: bool) -> AsyncIterator[Dict[str, Any]]:
+    """
+    The /query pipeline as a sequence of events: retrieval results, answer
+    text deltas (streaming only) and the final answer.
+    """
+    # Same or near-identical question answered recently? Serve it from the cache
+    cache_hit = None
+    if body.top_k == CACHEABLE_TOP_K:
+        current_version = await asyncio.to_thread(index_version)
+        cache_hit = query_cache.get_exact(body.query, current_version)
+        if cache_hit is None:
+            # Only a semantic match (and the cache entry stored below) needs the embedding
+            query_embedding = await asyncio.to_thread(embed_query, body.query)
+            cache_hit = query_cache.get_similar(query_embedding, current_version)
+
+    if cache_hit:
+        entry, hit_type = cache_hit
+        yield {"type": "retrieval", "results": entry.final_results.model_dump(), "cached": hit_type}
+        if stream:
+            yield {"type": "delta", "text": entry.answer.answer}
+        yield {"type": "answer", "answer": entry.answer.model_dump(), "cached": hit_type}
+        return
+
+    final_results = await retrieve(body.query, body.top_k)
+    yield {"type": "retrieval", "results": final_results.model_dump(), "cached": False}
+
+    if stream:
+        answer_stream = generate_answer_stream(body.query, final_results)
+        async for delta in answer_stream.text_deltas_async():
+            yield {"type": "delta", "text": delta}
+        answer = answer_stream.answer
+        if answer is None:
+            raise RuntimeError("Answer stream ended without a response")
+    else:
+        answer = await generate_answer_async(body.query, final_results)
+
+    if body.top_k == CACHEABLE_TOP_K:
+        query_cache.put(body.query, current_version, final_results, answer, query_embedding)
+    yield {"type": "answer", "answer": answer.model_dump(), "cached": False}
+
+
+async def _collect(events: AsyncIterator[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [event async for event in events]
+
+
+# HANDLERS
+#
+# Admission is taken by the shared pipeline run, not by each request: requests
+# that join an identical run already in flight don't need a slot, and if the
+# run can't be admitted every request sharing it gets the same 503.
+
+def _deadline_exceeded(deadline: Deadline) -> web.Response:
+    return web.json_response({"error": f"deadline of {deadline.seconds:g}s exceeded"}, status=504)
+
+
+async def _admitted_call(admission: Admission, deadline: Deadline, fn: Callable[[], Awaitable[Any]]) -> Any:
+    async with admission.slot(deadline):
+        return await fn()
+
+
+async def _admitted_events(admission: Admission, deadline: Deadline, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    async with admission.slot(deadline):
+        async for event in events:
+            yield event
+
+
+async def handle_query(request: web.Request) -> web.StreamResponse:
+    body = await _parse_request(request)
+    deadline = _deadline(body)
+    admission, flights = request.app["admission"], request.app["flights"]
+    key = ("query", normalize_query(body.query), body.top_k, body.stream)
+    with span("http.query", query=body.query, top_k=body.top_k, stream=body.stream) as root:
+        if body.stream:
+            return await _stream_query(request, body, key, deadline, root)
+
+        try:
+            events, shared = await asyncio.wait_for(
+                flights.do(key, lambda: _admitted_call(admission, deadline, lambda: _collect(answer_events(body, stream=False)))),
+                deadline.remaining()
+            )
+        except asyncio.TimeoutError:
+            root.set(deadline_exceeded=True)
+            return _deadline_exceeded(deadline)
+
+        retrieval, answer = events[0], events[-1]
+        root.set(cached=bool(answer["cached"]), coalesced=shared)
+        return web.json_response({
+            "answer": answer["answer"],
+            "results": retrieval["results"],
+            "cached": answer["cached"],
+            "coalesced": shared,
+            "trace_id": root.trace_id,
+            "duration_ms": round(root.elapsed_ms(), 1),
+        })
+
+
+async def _stream_query(request: web.Request, body: QueryRequest, key: Tuple, deadline: Deadline, root) -> web.StreamResponse:
+    admission = request.app["admission"]
+    events, shared = request.app["flights"].stream(
+        key, lambda: _admitted_events(admission, deadline, answer_events(body, stream=True))
+    )
+    root.set(coalesced=shared)
+
+    async def next_event() -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(events.__anext__(), deadline.remaining())
+        except StopAsyncIteration:
+            return None
+
+    response = None
+    try:
+        # Headers go out with the first event (retrieval results), so a run
+        # that can't be admitted or fails during retrieval still gets a
+        # proper status code (503, 504 or 500)
+        event = await next_event()
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        while event is not None:
+            if event["type"] == "answer":
+                # Events are shared with coalesced requests: copy before adding this request's fields
+                event = dict(event, coalesced=shared, trace_id=root.trace_id, duration_ms=round(root.elapsed_ms(), 1))
+                root.set(cached=bool(event["cached"]))
+            await response.write(_ndjson(event))
+            event = await next_event()
+    except asyncio.TimeoutError:
+        root.set(deadline_exceeded=True)
+        if response is None:
+            return _deadline_exceeded(deadline)
+        await response.write(_ndjson({"type": "error", "status": 504, "error": f"deadline of {deadline.seconds:g}s exceeded"}))
+    except ConnectionResetError:
+        root.set(client_disconnected=True)
+        return response
+    except Exception as e:
+        if response is None:
+            raise
+        logger.exception("query pipeline failed")
+        await response.write(_ndjson({"type": "error", "status": 500, "error": f"{type(e).__name__}: {e}"}))
+    finally:
+        # Stop following the shared run; once no request follows it, it is
+        # cancelled along with its outstanding LLM calls
+        await events.aclose()
+
+    await response.write_eof()
+    return response
+
+
+async def handle_retrieve(request: web.Request) -> web.Response:
+    body = await _parse_request(request)
+    deadline = _deadline(body)
+    admission, flights = request.app["admission"], request.app["flights"]
+    key = ("retrieve", normalize_query(body.query), body.top_k)
+    with span("http.retrieve", query=body.query, top_k=body.top_k) as root:
+        try:
+            final_results, shared = await asyncio.wait_for(
+                flights.do(key, lambda: _admitted_call(admission, deadline, lambda: retrieve(body.query, body.top_k))),
+                deadline.remaining()
+            )
+        except asyncio.TimeoutError:
+            root.set(deadline_exceeded=True)
+            return _deadline_exceeded(deadline)
+        root.set(coalesced=shared)
+        return web.json_response({
+            "results": final_results.model_dump(),
+            "coalesced": shared,
+            "trace_id": root.trace_id,
+            "duration_ms": round(root.elapsed_ms(), 1),
+        })
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "ok",
+        "admission": request.app["admission"].stats(),
+        "query_cache": query_cache.stats(),
+        "singleflight": request.app["flights"].stats(),
+        "embedding_singleflight": embedding_flight.stats(),
+        "query_translation": translation_stats.stats(),
+        "variation_cache": variation_cache.stats(),
+    })
+
+
+# APP
+
+def create_app(max_in_flight: int = MAX_IN_FLIGHT, queue_timeout: float = QUEUE_TIMEOUT, warm_up: bool = True) -> web.Application:
+    app = web.Application()
+    app["max_in_flight"] = max_in_flight
+    app["queue_timeout"] = queue_timeout
+    app["warm_up"] = warm_up
+    app.on_startup.append(_on_startup)
+    app.add_routes([
+        web.post("/query", handle_query),
+        web.post("/retrieve", handle_retrieve),
+        web.get("/health", handle_health),
+    ])
+    return app
+
+
+async def _on_startup(app: web.Application):
+    # Created here so the semaphore belongs to the server's event loop
+    app["admission"] = Admission(app["max_in_flight"], app["queue_timeout"])
+    app["flights"] = AsyncSingleFlight()
+
+    # Each admitted request runs up to 8 retrieval branches in worker threads
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=app["max_in_flight"] * 8))
+
+    if app["warm_up"]:
+        engine = get_engine()
+        await asyncio.to_thread(engine.warm_up)
+        engine.async_instructor_client
+        logger.info(f"Engine warm; accepting up to {app['max_in_flight']} concurrent requests")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Async HTTP query service for the insurance policy RAG pipeline.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent pipeline requests (default: %(default)s)")
+    parser.add_argument("--queue-timeout", type=float, default=QUEUE_TIMEOUT, help="seconds a request may wait for a slot before 503 (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    app = create_app(max_in_flight=args.max_in_flight, queue_timeout=args.queue_timeout)
+    # handler_cancellation: a client disconnect cancels its request (and its LLM calls)
+    web.run_app(app, host=args.host, port=args.port, handler_cancellation=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""
+Singleflight: coalesce identical in-flight work.
+
+Concurrent callers that ask for the same key share one execution instead of
+each running their own. The first caller (the leader) starts the work.
+Callers arriving while it is still running wait for it and receive the same
+result, or the same exception. Once the work finishes the key is forgotten,
+so later callers start fresh (the query and embedding caches serve repeats
+after that).
+
+- SingleFlight: blocking callers in threads (Streamlit sessions, embedding
+  calls from retrieval worker threads)
+- AsyncSingleFlight: asyncio callers (the HTTP service). The shared work runs
+  in its own task, so one caller's deadline or disconnect doesn't cancel it
+  for the others; it is cancelled only when every caller has gone.
+
+Both also coalesce streams: stream() replays every item the shared producer
+has emitted so far and then follows it live, so a caller that joins late
+still sees the whole stream.
+"""
+import asyncio
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Stream:
+    def __init__(self):
+        self.items: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls from threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, Tuple[_Stream, threading.Condition]] = {}
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Returns:
+            (result, shared): shared is True if this caller joined another
+            caller's execution instead of running fn itself
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def stream(self, key: Hashable, factory: Callable[[], Iterable[T]]) -> Tuple[Iterator[T], bool]:
+        """
+        Share one run of factory()'s iterator between concurrent callers.
+
+        The producer runs in a background thread (in the leader's context, so
+        its spans join the leader's trace) and always runs to completion;
+        callers that stop reading early simply stop following it.
+
+        Returns:
+            (items, shared): an iterator over every item the producer yields
+        """
+        with self._lock:
+            entry = self._streams.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._streams[key] = (_Stream(), threading.Condition())
+                self.executions += 1
+            else:
+                self.shared += 1
+        state, condition = entry
+
+        if leader:
+            def produce():
+                try:
+                    for item in factory():
+                        with condition:
+                            state.items.append(item)
+                            condition.notify_all()
+                except BaseException as e:
+                    state.error = e
+                finally:
+                    with self._lock:
+                        del self._streams[key]
+                    with condition:
+                        state.finished = True
+                        condition.notify_all()
+
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(produce,), name="singleflight-stream", daemon=True).start()
+
+        def follow() -> Iterator[T]:
+            position = 0
+            while True:
+                with condition:
+                    condition.wait_for(lambda: len(state.items) > position or state.finished)
+                    batch = state.items[position:]
+                    finished = state.finished
+                yield from batch
+                position += len(batch)
+                if finished and position == len(state.items):
+                    if state.error is not None:
+                        raise state.error
+                    return
+
+        return follow(), not leader
+
+    def stats(self) -> Dict[str, int]:
+        """Executions started vs. callers that joined one already in flight."""
+        return {"executions": self.executions, "shared": self.shared}
+
+
+class _AsyncFollower:
+    """
+    A follower's async iterator. aclose() releases the subscription even if
+    iteration never started (an unstarted async generator skips its finally).
+    """
+
+    def __init__(self, items: AsyncIterator[T], release: Callable[[], None]):
+        self._items = items
+        self._release = release
+
+    def __aiter__(self) -> "_AsyncFollower":
+        return self
+
+    async def __anext__(self) -> T:
+        return await self._items.__anext__()
+
+    async def aclose(self):
+        try:
+            await self._items.aclose()
+        finally:
+            self._release()
+
+
+class AsyncSingleFlight:
+    """Coalesces identical concurrent calls from asyncio tasks (one event loop)."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Tuple[asyncio.Task, List[int]]] = {}
+        self._streams: Dict[Hashable, Tuple[_Stream, asyncio.Condition, asyncio.Task, List[int]]] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Await fn() once for all concurrent callers with the same key.
+
+        A caller that is cancelled stops waiting; the shared task is cancelled
+        only if no caller is left waiting for it.
+
+        Returns:
+            (result, shared), as in SingleFlight.do
+        """
+        entry = self._calls.get(key)
+        leader = entry is None
+        if leader:
+            task = asyncio.create_task(fn())
+            entry = self._calls[key] = (task, [0])
+            task.add_done_callback(lambda _: self._forget(self._calls, key, entry))
+            self.executions += 1
+        else:
+            self.shared += 1
+        task, waiters = entry
+
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task), not leader
+        finally:
+            waiters[0] -= 1
+            if waiters[0] == 0 and not task.done():
+                self._forget(self._calls, key, entry)
+                task.cancel()
+
+    def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> Tuple[AsyncIterator[T], bool]:
+        """
+        Share one run of factory()'s async iterator between concurrent callers.
+
+        The producer runs in its own task and is cancelled once every caller
+        has stopped following it (finished early, cancelled or disconnected).
+
+        Returns:
+            (items, shared): an async iterator over every item the producer yields
+        """
+        entry = self._streams.get(key)
+        leader = entry is None
+        if leader:
+            state, condition = _Stream(), asyncio.Condition()
+
+            async def produce():
+                try:
+                    async for item in factory():
+                        async with condition:
+                            state.items.append(item)
+                            condition.notify_all()
+                except BaseException as e:
+                    state.error = e
+                    if not isinstance(e, Exception):
+                        raise
+                finally:
+                    self._forget(self._streams, key, entry)
+                    state.finished = True
+                    async with condition:
+                        condition.notify_all()
+
+            task = asyncio.create_task(produce())
+            entry = self._streams[key] = (state, condition, task, [0])
+            self.executions += 1
+        else:
+            self.shared += 1
+        state, condition, task, followers = entry
+        followers[0] += 1  # counted from subscription, so a follower that hasn't started yet keeps the producer alive
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            followers[0] -= 1
+            if followers[0] == 0 and not task.done():
+                self._forget(self._streams, key, entry)
+                task.cancel()
+
+        async def follow() -> AsyncIterator[T]:
+            position = 0
+            try:
+                while True:
+                    async with condition:
+                        await condition.wait_for(lambda: len(state.items) > position or state.finished)
+                        batch = state.items[position:]
+                        finished = state.finished
+                    for item in batch:
+                        yield item
+                    position += len(batch)
+                    if finished and position == len(state.items):
+                        if state.error is not None:
+                            raise state.error
+                        return
+            finally:
+                release()
+
+        return _AsyncFollower(follow(), release), not leader
+
+    @staticmethod
+    def _forget(registry: Dict[Hashable, Any], key: Hashable, entry: Any):
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"executions": self.executions, "shared": self.shared}
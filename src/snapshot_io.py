@@ -0,0 +1,97 @@
+"""
+Binary snapshot files for in-process indexes (BM25 postings, chunk store).
+
+Layout: MAGIC | uint32 header length | JSON header | arrays (64-byte aligned)
+
+The JSON header carries the format version, caller metadata and the dtype,
+shape and offset of every array, so arrays can be read straight out of a
+memory map with np.frombuffer (no parsing, no copies).
+"""
+import os
+import json
+import mmap
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+ALIGNMENT = 64
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def write_arrays(path: str, magic: bytes, header: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    """Write header + arrays to path atomically (tmp file + rename)."""
+    specs = {}
+    offset = 0
+    for name, arr in arrays.items():
+        specs[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += _align(arr.nbytes)
+    header_bytes = json.dumps({**header, "arrays": specs}).encode("utf-8")
+    data_start = _align(len(magic) + 4 + len(header_bytes))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(magic + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + specs[name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_arrays(path: str, magic: bytes, format_version: int, use_mmap: bool = True) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+    """
+    Read a snapshot written by write_arrays.
+
+    Returns:
+        (header, arrays), or None if the file is missing, foreign or from
+        another format version. Arrays are read-only views over the mmap.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        if use_mmap and os.fstat(f.fileno()).st_size > 0:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f.read()
+
+    if buffer[:len(magic)] != magic:
+        return None
+    (header_len,) = struct.unpack_from("<I", buffer, len(magic))
+    header_start = len(magic) + 4
+    header = json.loads(bytes(buffer[header_start:header_start + header_len]).decode("utf-8"))
+    if header.get("format_version") != format_version:
+        return None
+    data_start = _align(header_start + header_len)
+
+    arrays = {}
+    for name, spec in header.pop("arrays").items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+        if count == 0:
+            arrays[name] = np.zeros(spec["shape"], dtype=dtype)
+            continue
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec["offset"]).reshape(spec["shape"])
+    return header, arrays
+
+
+def encode_lines(values: List[str]) -> np.ndarray:
+    """Newline-joined UTF-8 blob (for values that never contain newlines)."""
+    return np.frombuffer("\n".join(values).encode("utf-8"), dtype=np.uint8)
+
+
+def decode_lines(blob: np.ndarray) -> List[str]:
+    text = blob.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+def encode_texts(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenated UTF-8 blob plus int64 byte offsets (len(values) + 1) for arbitrary text."""
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
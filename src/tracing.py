@@ -0,0 +1,277 @@
+"""
+Structured tracing and logging for the RAG pipeline.
+
+A span times one pipeline stage or external call and carries attributes
+such as token counts, cache hits and chunk counts. The current span lives in
+a contextvar, so spans nest correctly across asyncio tasks and
+asyncio.to_thread workers.
+
+Finished spans are:
+1. written as one JSON object per line to the "rag.trace" logger, which
+   configure_logging points at $TRACE_JSON_PATH (a file, or "-" for stderr)
+2. mirrored to OpenTelemetry (OTLP) when TRACE_OTEL=1 or
+   OTEL_EXPORTER_OTLP_ENDPOINT is set and the SDK is installed
+3. collected on their root span, so a whole request can be rendered as a
+   waterfall (see Span.trace and waterfall)
+
+Modules log through get_logger(__name__) instead of print.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+MAX_SPANS_PER_TRACE = 2000  # cap on spans kept in memory for one waterfall
+
+logger = logging.getLogger("rag")
+trace_logger = logging.getLogger("rag.trace")
+trace_logger.propagate = False  # JSON span lines never go to the console handler
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_exporters: List[Callable[[Dict[str, Any]], None]] = []
+_otel_tracer = None
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Module logger under the "rag" namespace (configured by configure_logging)."""
+    return logging.getLogger(f"rag.{name}")
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.root: "Span" = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self.duration_ms: Optional[float] = None
+        self._start = time.perf_counter()
+        self._finished: List[Dict[str, Any]] = []  # root only: finished spans of this trace
+        self._lock = threading.Lock()
+        self._otel = _otel_start(self)
+
+    def set(self, **attributes) -> "Span":
+        """Set (overwrite) attributes."""
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, name: str, amount: float = 1) -> "Span":
+        """Increment a numeric attribute (e.g. tokens accumulated over several calls)."""
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+        return self
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def fail(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        """Finish the span and export it (idempotent)."""
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = self.elapsed_ms()
+        record = self.to_dict()
+        with self.root._lock:
+            if len(self.root._finished) < MAX_SPANS_PER_TRACE:
+                self.root._finished.append(record)
+        _otel_end(self)
+        for exporter in _exporters:
+            try:
+                exporter(record)
+            except Exception as e:  # tracing must never break the pipeline
+                logger.debug(f"span exporter failed: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "depth": self.depth,
+            "start_time": self.start_time,
+            "offset_ms": round((self.start_time - self.root.start_time) * 1000, 3),
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def trace(self) -> List[Dict[str, Any]]:
+        """Finished spans of this span's trace in tree order (each span followed by its children, by start time)."""
+        with self.root._lock:
+            records = sorted(self.root._finished, key=lambda record: record["start_time"])
+        children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for record in records:
+            children.setdefault(record["parent_id"], []).append(record)
+        ids = {record["span_id"] for record in records}
+        ordered: List[Dict[str, Any]] = []
+        stack = [r for r in reversed(records) if r["parent_id"] not in ids]  # roots (and orphans)
+        while stack:
+            record = stack.pop()
+            ordered.append(record)
+            stack.extend(reversed(children.get(record["span_id"], [])))
+        return ordered
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Time a block as a child of the current span (or as a new trace's root).
+
+    Example:
+        with span("dense_retrieval", queries=len(all_queries)) as s:
+            ...
+            s.set(chunks=len(chunks))
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def start_span(name: str, **attributes) -> Span:
+    """
+    Start a span without making it current; call .end() when done.
+
+    For work that spans generator yields (streaming), where a context
+    manager would leak the span into the consumer's context.
+    """
+    return Span(name, _current_span.get(), attributes)
+
+
+def set_attributes(**attributes):
+    """Set attributes on the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def usage_attributes(completion) -> dict:
+    """input/output token counts of a Responses API completion, for span attributes."""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return {}
+    return {"input_tokens": usage.input_tokens, "output_tokens": usage.output_tokens}
+
+
+def add_exporter(exporter: Callable[[Dict[str, Any]], None]):
+    """Register a callable that receives every finished span as a dict."""
+    _exporters.append(exporter)
+
+
+def _json_log_exporter(record: Dict[str, Any]):
+    if trace_logger.isEnabledFor(logging.INFO):
+        trace_logger.info(json.dumps(record, default=str))
+
+
+def waterfall(spans: List[Dict[str, Any]], width: int = 30) -> str:
+    """Text waterfall of a trace: one line per span, indented by depth, bar at its offset."""
+    if not spans:
+        return ""
+    total = max(s["offset_ms"] + (s["duration_ms"] or 0) for s in spans) or 1.0
+    lines = []
+    for s in spans:
+        duration = s["duration_ms"] or 0
+        start_col = int(s["offset_ms"] / total * width)
+        bar_len = max(1, int(round(duration / total * width)))
+        bar = " " * start_col + "█" * min(bar_len, width - start_col or 1)
+        label = ("  " * s["depth"] + s["name"])[:26]
+        lines.append(f"{label:<26} {bar:<{width}} {duration:8.1f} ms")
+    return "\n".join(lines)
+
+
+# OpenTelemetry (optional)
+
+def enable_opentelemetry(service_name: str = "insurance-policy-rag") -> bool:
+    """Mirror spans to an OTLP collector; returns False if the SDK isn't installed."""
+    global _otel_tracer
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.warning("OpenTelemetry SDK / OTLP exporter not installed; spans are only logged as JSON")
+        return False
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    _otel_tracer = provider.get_tracer("rag")
+    return True
+
+
+def _otel_start(s: Span):
+    if _otel_tracer is None:
+        return None
+    from opentelemetry import trace as otel_trace
+    parent = s.parent._otel if s.parent is not None else None
+    context = otel_trace.set_span_in_context(parent) if parent is not None else None
+    return _otel_tracer.start_span(s.name, context=context, start_time=time.time_ns())
+
+
+def _otel_end(s: Span):
+    if s._otel is None:
+        return
+    from opentelemetry.trace import Status, StatusCode
+    for key, value in s.attributes.items():
+        if isinstance(value, (str, bool, int, float)):
+            s._otel.set_attribute(key, value)
+    if s.status == "error":
+        s._otel.set_status(Status(StatusCode.ERROR, s.error))
+    s._otel.end()
+
+
+def configure_logging(level: Optional[str] = None):
+    """
+    Console logging for the "rag" loggers, JSON span lines to $TRACE_JSON_PATH,
+    and the OpenTelemetry exporter when enabled. Safe to call more than once.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+
+        level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+
+        json_path = os.getenv("TRACE_JSON_PATH")  # "-" writes span lines to stderr
+        if json_path:
+            if json_path == "-":
+                json_handler = logging.StreamHandler()
+            else:
+                os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+                json_handler = logging.FileHandler(json_path, encoding="utf-8")
+            json_handler.setFormatter(logging.Formatter("%(message)s"))
+            trace_logger.addHandler(json_handler)
+            trace_logger.setLevel(logging.INFO)
+            add_exporter(_json_log_exporter)
+
+        if os.getenv("TRACE_OTEL") == "1" or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+            enable_opentelemetry()
@@ -0,0 +1,102 @@
+"""
+Persistent cache of generated query variations.
+
+query_translate asks gpt-5-mini for 3 rewordings of every question. The same
+(normalized) question always gets the same treatment, so the variations are
+stored in SQLite, keyed by sha256(model + translation prompt), and reused
+across restarts. Unlike answers, variations don't depend on the indexed data
+and never expire. The store is bounded by max_entries, least recently used
+first, with a small in-memory LRU in front.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.getenv("VARIATION_CACHE_DIR", "./variation_cache"), "variations.sqlite3")
+
+
+class VariationCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, memory_size: int = 1024, max_entries: int = 100_000):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.enabled = True
+        self._memory: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the SQLite store on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS variations ("
+                "key TEXT PRIMARY KEY, variations TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_variations_last_access ON variations(last_access)")
+        return self._conn
+
+    def _remember(self, key: str, variations: List[str]):
+        self._memory[key] = variations
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, prompt: str) -> Optional[List[str]]:
+        """Cached variations for this model and prompt, or None."""
+        if not self.enabled:
+            return None
+        key = self.key(model, prompt)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return list(self._memory[key])
+            db = self._db()
+            row = db.execute("SELECT variations FROM variations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            variations = json.loads(row[0])
+            db.execute("UPDATE variations SET last_access = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+            self._remember(key, variations)
+            self.hits += 1
+            return list(variations)
+
+    def put(self, model: str, prompt: str, variations: List[str]):
+        if not self.enabled:
+            return
+        key = self.key(model, prompt)
+        with self._lock:
+            self._remember(key, list(variations))
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO variations VALUES (?, ?, ?)", (key, json.dumps(variations), time.time()))
+            (count,) = db.execute("SELECT COUNT(*) FROM variations").fetchone()
+            if count > self.max_entries:
+                db.execute(
+                    "DELETE FROM variations WHERE key IN (SELECT key FROM variations ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,197 @@
+"""
+Flat (exact) vector index for dense retrieval.
+
+An alternative to Chroma's HNSW for corpora of a few hundred to a few
+hundred thousand chunks: the summary embeddings live in one row-major
+matrix, one row per chunk store row, and a query batch is scored against
+every row with a matrix multiply. The result is exact top-k (no recall
+loss from the graph), with no SQLite or metadata access on the query path.
+
+Rows are L2-normalised at build time, so the dot product is the cosine
+similarity (1 - Chroma's cosine distance). The matrix can be stored as:
+- float32: exact
+- float16: half the memory, scores within ~1e-3
+- int8:    a quarter of the memory, one float32 scale per row (symmetric
+           per-row quantization), scores within ~1e-2
+
+Quantized blocks are converted to float32 before the matmul (NumPy has no
+fast float16/int8 GEMM), so they trade some scan time for memory: int8
+scans at close to float32 speed, float16's conversion is the slowest (see
+benchmarks/vector_backends.py).
+
+The index is persisted as a versioned snapshot (see snapshot_io) and
+memory-mapped on load, so only the pages a scan touches are read in.
+
+Two-stage (Matryoshka) search: text-embedding-3 models are trained so that
+a prefix of the embedding, re-normalised, is itself a usable embedding. A
+coarse index over the first 256 dimensions is scanned for a wide candidate
+set, and only those candidates are re-scored against the full vectors
+(see two_stage_search). The scan touches 1536 / 256 = 6x fewer bytes.
+"""
+import os
+from typing import Optional, Tuple
+import numpy as np
+from snapshot_io import write_arrays, read_arrays
+
+SNAPSHOT_MAGIC = b"VECINDEX"
+SNAPSHOT_FORMAT_VERSION = 1
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+SEARCH_BLOCK_ROWS = int(os.getenv("VECTOR_SEARCH_BLOCK_ROWS", "1024"))  # rows converted per matmul (cache-sized scratch)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length (zero rows left as they are)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k (rows, scores) per query: score descending, ties broken by row."""
+    order = np.lexsort((rows, -scores), axis=1)[:, :k]
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+def two_stage_search(coarse: "FlatVectorIndex", full: "FlatVectorIndex", queries: np.ndarray, k: int = 5,
+                     candidates: int = 64) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coarse-to-fine search: scan the truncated (coarse) index for candidates,
+    then re-score them with the full vectors.
+
+    Args:
+        coarse: Index over the first coarse.dim dimensions, same rows as full
+        full: Index over the full embeddings
+        queries: (n, full.dim) query embeddings
+        k: Results per query
+        candidates: Coarse results re-scored per query (recall vs. cost)
+
+    Returns:
+        (rows, scores) as in FlatVectorIndex.search, scored with the full vectors
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    candidate_rows, _ = coarse.search(queries, max(k, candidates))
+    if candidate_rows.shape[1] == 0:
+        return candidate_rows, np.zeros(candidate_rows.shape, dtype=np.float32)
+    return top_k(candidate_rows, full.score_rows(queries, candidate_rows), k)
+
+
+class FlatVectorIndex:
+    def __init__(self, vectors: np.ndarray, scales: Optional[np.ndarray], quantization: str, version: str = ""):
+        self.vectors = vectors  # (rows, dim), dtype per quantization
+        self.scales = scales  # (rows,) float32 for int8, else None
+        self.quantization = quantization
+        self.version = version  # collection version (same as the chunk store it is aligned with)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, quantization: str = "float16", version: str = "") -> "FlatVectorIndex":
+        """
+        Build from raw embeddings (one row per chunk store row).
+
+        Args:
+            embeddings: (rows, dim) float array; pass embeddings[:, :256]
+                for a coarse Matryoshka index
+            quantization: float32, float16 or int8
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        matrix = normalize(embeddings)
+
+        scales = None
+        if quantization == "float32":
+            vectors = np.ascontiguousarray(matrix)
+        elif quantization == "float16":
+            vectors = matrix.astype(np.float16)
+        else:
+            max_abs = np.abs(matrix).max(axis=1)
+            scales = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+            vectors = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return cls(vectors, scales, quantization, version=version)
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def search(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k by cosine similarity for a batch of query embeddings.
+
+        Args:
+            queries: (n, dim) query embeddings (normalised here; longer
+                embeddings are truncated to dim first, Matryoshka-style)
+            k: Results per query
+
+        Returns:
+            (rows, scores): (n, k) arrays, best first; ties broken by row
+        """
+        queries = normalize(np.atleast_2d(queries)[:, :self.dim])
+        if len(self) == 0 or k <= 0:
+            return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+        queries_t = np.ascontiguousarray(queries.T)
+        k = min(k, len(self))
+
+        # Scan in blocks: dequantize, score with one matmul, keep each block's top k
+        best_rows, best_scores = [], []
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores = (block if block.dtype == np.float32 else block.astype(np.float32)) @ queries_t
+            if self.scales is not None:
+                scores *= self.scales[start:start + SEARCH_BLOCK_ROWS, None]
+            scores = scores.T  # (n, block rows)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_rows.append(top + start)
+            best_scores.append(np.take_along_axis(scores, top, axis=1))
+
+        return top_k(np.concatenate(best_rows, axis=1), np.concatenate(best_scores, axis=1), k)
+    
+    def score_rows(self, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        Exact scores of selected rows (e.g. a coarse search's candidates).
+
+        Args:
+            queries: (n, dim) query embeddings (normalised here)
+            rows: (n, c) row indices, c candidates per query
+
+        Returns:
+            (n, c) cosine similarities
+        """
+        queries = normalize(np.atleast_2d(queries)[:, :self.dim])
+        # Gather only the candidate rows (from a memory-mapped index, only their pages are read)
+        vectors = self.vectors[rows.ravel()].astype(np.float32).reshape(rows.shape + (self.dim,))
+        scores = np.einsum("ncd,nd->nc", vectors, queries)
+        if self.scales is not None:
+            scores *= self.scales[rows]
+        return scores
+
+    # SNAPSHOT PERSISTENCE (see snapshot_io for the file layout)
+
+    def save(self, path: str):
+        """Write the index to a versioned snapshot file (atomically)."""
+        arrays = {"vectors": self.vectors}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        write_arrays(
+            path,
+            SNAPSHOT_MAGIC,
+            {"format_version": SNAPSHOT_FORMAT_VERSION, "version": self.version, "quantization": self.quantization},
+            arrays,
+        )
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = True) -> Optional["FlatVectorIndex"]:
+        """Load a snapshot (memory-mapped by default). Returns None if missing or incompatible."""
+        snapshot = read_arrays(path, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, use_mmap=use_mmap)
+        if snapshot is None:
+            return None
+        header, arrays = snapshot
+        return cls(arrays["vectors"], arrays.get("scales"), header["quantization"], version=header["version"])
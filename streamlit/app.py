@@ -1,13 +1,71 @@
 import streamlit as st
 import sys
+import time
 from pathlib import Path
 
 # Add project src/ to path dynamically (works in local and container runs)
 ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(ROOT / "src"))
 
-from retrieval import hybrid_retrieval, merge_and_rerank
-from answer_gen import generate_answer
+# Pipeline modules are light to import: clients, Chroma and the indexes are
+# only created by the shared engine (see load_engine below)
+_import_started = time.perf_counter()
+from engine import get_engine
+from retrieval import hybrid_retrieval, merge_and_rerank, embed_query, index_version, translation_stats
+from query_cache import query_cache, normalize_query
+from answer_gen import generate_answer_stream
+from singleflight import SingleFlight
+from tracing import configure_logging, get_logger, span, waterfall
+IMPORT_MS = (time.perf_counter() - _import_started) * 1000
+
+configure_logging()
+logger = get_logger("app")
+
+
+@st.cache_resource(show_spinner="Loading retrieval engine...")
+def load_engine():
+    """
+    Open the clients and load the indexes once per server process; every
+    session and rerun shares the result (and its single Chroma client).
+    """
+    started = time.perf_counter()
+    engine = get_engine()
+    engine.warm_up()
+    warm_up_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Engine ready: imports {IMPORT_MS:.0f} ms, warm-up {warm_up_ms:.0f} ms")
+    return engine, warm_up_ms
+
+
+@st.cache_resource
+def get_query_flight() -> SingleFlight:
+    """Shared by all sessions: identical questions asked at the same time run the pipeline once."""
+    return SingleFlight()
+
+
+def citation_label(doc_id: str, chunk_id: int) -> str:
+    """Chunk ids repeat across documents, so citations name the document too."""
+    return f"{doc_id}, Chunk {chunk_id}" if doc_id else f"Chunk {chunk_id}"
+
+
+def pipeline_events(query, current_version, query_embedding):
+    """
+    Retrieval, streamed answer and cache update for one question, as
+    ("retrieval", FinalRankedResults), ("delta", str)..., ("answer", Answer) events.
+    """
+    dense_results, sparse_results = hybrid_retrieval(query)
+    final_results = merge_and_rerank(dense_results, sparse_results, top_k=10)
+    yield "retrieval", final_results
+    
+    answer_stream = generate_answer_stream(query, final_results)
+    for delta in answer_stream.text_deltas():
+        yield "delta", delta
+    
+    # Citations and confidence are final once the stream ends
+    answer = answer_stream.answer
+    if answer is None:
+        raise RuntimeError("Answer stream ended without a response")
+    query_cache.put(query, current_version, final_results, answer, query_embedding)
+    yield "answer", answer
 
 # Page config
 st.set_page_config(
@@ -31,7 +89,7 @@ for message in st.session_state.messages:
         if message["role"] == "assistant" and "citations" in message:
             with st.expander("📚 View Citations"):
                 for i, citation in enumerate(message["citations"], 1):
-                    st.markdown(f"**{i}.** Chunk {citation['chunk_id']} (Pages {citation['page_start']}-{citation['page_end']})")
+                    st.markdown(f"**{i}.** {citation_label(citation.get('doc_id', ''), citation['chunk_id'])} (Pages {citation['page_start']}-{citation['page_end']})")
             if "confidence" in message:
                 confidence_color = {
                     "high": "🟢",
@@ -50,19 +108,51 @@ if query := st.chat_input("Ask a question about your insurance policy..."):
     # Generate response
     with st.chat_message("assistant"):
         try:
-            with st.status("Running pipeline...", expanded=True) as status:
-                status.write("Translating query and running dense + BM25 retrieval...")
-                dense_results, sparse_results = hybrid_retrieval(query)
-                
-                status.write("Merging and reranking results (RRF)...")
-                final_results = merge_and_rerank(dense_results, sparse_results, top_k=10)
-                
-                status.write("Generating answer with inline citations...")
-                answer = generate_answer(query, final_results)
-                status.update(label="Done", state="complete")
+            load_engine()
             
-            # Display answer (includes inline citations)
-            st.markdown(answer.answer)
+            # Every stage below is traced under one root span for the sidebar waterfall
+            with span("query", query=query) as trace_root:
+                # Same or near-identical question answered recently? Serve it from the cache
+                current_version = index_version()
+                cache_hit = query_cache.get_exact(query, current_version)
+                if cache_hit is None:
+                    # Only a semantic match (and the pipeline's cache entry) needs the embedding
+                    query_embedding = embed_query(query)
+                    cache_hit = query_cache.get_similar(query_embedding, current_version)
+                
+                if cache_hit:
+                    entry, hit_type = cache_hit
+                    final_results, answer = entry.final_results, entry.answer
+                    st.caption(f"⚡ Cached answer ({hit_type} match: \"{entry.query}\")")
+                    st.markdown(answer.answer)
+                else:
+                    # Identical question already running in another session? Follow that run instead
+                    events, shared = get_query_flight().stream(
+                        normalize_query(query),
+                        lambda: pipeline_events(query, current_version, query_embedding)
+                    )
+                    trace_root.set(coalesced=shared)
+                    
+                    with st.status("Running pipeline...", expanded=True) as status:
+                        if shared:
+                            status.write("Joining an identical question already in progress...")
+                        status.write("Translating query, running dense + BM25 retrieval and merging results (RRF)...")
+                        _, final_results = next(events)
+                        status.update(label="Retrieval complete", state="complete", expanded=False)
+                    
+                    # Stream the answer text token by token (includes inline citations)
+                    final_answer = []
+                    
+                    def answer_deltas():
+                        for kind, value in events:
+                            if kind == "delta":
+                                yield value
+                            else:
+                                final_answer.append(value)
+                    
+                    st.write_stream(answer_deltas())
+                    answer = final_answer[-1]
+                trace_root.set(cache_hit=bool(cache_hit))
             
             # Add to chat history
             st.session_state.messages.append({
@@ -70,6 +160,7 @@ if query := st.chat_input("Ask a question about your insurance policy..."):
                 "content": answer.answer,
                 "citations": [
                     {
+                        "doc_id": c.doc_id,
                         "chunk_id": c.chunk_id,
                         "page_start": c.page_start,
                         "page_end": c.page_end
@@ -81,7 +172,13 @@ if query := st.chat_input("Ask a question about your insurance policy..."):
             # Display citations
             with st.expander("📚 View Citations"):
                 for i, citation in enumerate(answer.citations, 1):
-                    st.markdown(f"**{i}.** Chunk {citation.chunk_id} (Pages {citation.page_start}-{citation.page_end})")
+                    st.markdown(f"**{i}.** {citation_label(citation.doc_id, citation.chunk_id)} (Pages {citation.page_start}-{citation.page_end})")
+            confidence_color = {
+                "high": "🟢",
+                "medium": "🟡",
+                "low": "🔴"
+            }
+            st.caption(f"{confidence_color.get(answer.confidence, '⚪')} Confidence: {answer.confidence}")
             
             # Display retrieval stats and confidence in sidebar
             with st.sidebar:
@@ -90,6 +187,16 @@ if query := st.chat_input("Ask a question about your insurance policy..."):
                 st.metric("Unique Chunks", final_results.total_after_dedup)
                 st.metric("Top Chunks Used", len(final_results.chunks))
                 st.caption(f"Confidence: {answer.confidence}")
+                st.caption(f"Query cache: {query_cache.stats()}")
+                st.caption(f"Query translation: {translation_stats.stats()}")
+                
+                # Per-stage waterfall for this query
+                trace = trace_root.trace()
+                st.markdown(f"**⏱️ Stage timings** ({trace_root.duration_ms:.0f} ms total)")
+                st.code(waterfall(trace), language=None)
+                with st.expander("🧾 Span details"):
+                    for record in trace:
+                        st.caption(f"{'  ' * record['depth']}{record['name']}: {record['duration_ms']:.1f} ms {record['attributes']}")
                 
                 with st.expander("🔍 View Retrieved Chunks"):
                     for i, chunk in enumerate(final_results.chunks, 1):
@@ -118,3 +225,10 @@ with st.sidebar:
     if st.button("🗑️ Clear Chat History"):
         st.session_state.messages = []
         st.rerun()
+
+# Warm the engine after the page has rendered (no-op once cached)
+try:
+    _, engine_warm_up_ms = load_engine()
+    st.sidebar.caption(f"Engine: imports {IMPORT_MS:.0f} ms, warm-up {engine_warm_up_ms:.0f} ms")
+except Exception as e:
+    st.sidebar.warning(f"Engine not ready: {e}")
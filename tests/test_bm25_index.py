@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from bm25_index import BM25Index, tokenize
+
+rank_bm25 = pytest.importorskip("rank_bm25")
+
+CORPUS = [
+    "The policy covers hospitalization expenses up to the sum insured",
+    "Pre-existing diseases are covered after a waiting period of 36 months",
+    "Maternity expenses are covered after a waiting period of 9 months",
+    "The deductible applies to each claim under the policy",
+    "Ambulance charges are covered up to 2000 per hospitalization",
+    "Claims must be intimated within 24 hours of hospitalization",
+    "The policy excludes cosmetic surgery and dental treatment",
+    "Room rent is capped at one percent of the sum insured per day",
+]
+QUERIES = [
+    "waiting period for pre-existing diseases",
+    "policy policy sum insured",  # repeated term
+    "ambulance",  # matches one document: the rest is zero-score fill
+    "cosmetic dental surgery exclusions",
+    "the",  # term in most documents (epsilon idf floor)
+    "unknown words only",  # matches nothing
+]
+
+
+@pytest.fixture(scope="module")
+def indexes():
+    tokenized = [tokenize(text) for text in CORPUS]
+    return BM25Index.build(tokenized), rank_bm25.BM25Okapi(tokenized)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_scores_match_bm25okapi(indexes, query):
+    index, reference = indexes
+    tokens = tokenize(query)
+    np.testing.assert_allclose(index.get_scores(tokens), reference.get_scores(tokens), rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+@pytest.mark.parametrize("k", [1, 3, 5, len(CORPUS), len(CORPUS) + 3])
+def test_top_k_matches_stable_sort_of_bm25okapi(indexes, query, k):
+    index, reference = indexes
+    tokens = tokenize(query)
+    expected_scores = reference.get_scores(tokens)
+    expected = np.argsort(-expected_scores, kind="stable")[:k]
+
+    top = index.top_k(tokens, k=k)
+    assert [doc_idx for doc_idx, _ in top] == expected.tolist()
+    np.testing.assert_allclose([score for _, score in top], expected_scores[expected], rtol=0, atol=1e-12)
+
+
+def test_top_k_fills_with_zero_scores_in_doc_order(indexes):
+    index, _ = indexes
+    top = index.top_k(tokenize("ambulance"), k=4)
+    assert top[0][0] == 4 and top[0][1] > 0
+    assert top[1:] == [(0, 0.0), (1, 0.0), (2, 0.0)]
+
+
+def test_snapshot_round_trip(indexes, tmp_path):
+    index, _ = indexes
+    path = str(tmp_path / "bm25.bin")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    for query in QUERIES:
+        assert loaded.top_k(tokenize(query), k=5) == index.top_k(tokenize(query), k=5)
@@ -0,0 +1,66 @@
+import random
+import numpy as np
+import pytest
+from chunking import PageIndex, split_markdown
+
+
+def linear_page(page_map, offset, fallback):
+    """The per-chunk scan PageIndex replaced: first page whose interval contains offset."""
+    for page_info in page_map.values():
+        if page_info["start_offset"] <= offset <= page_info["end_offset"]:
+            return page_info["page"]
+    return fallback
+
+
+def make_page_map(rng: random.Random, pages: int, gaps: bool):
+    """page_map.json-style map (string keys); with gaps, some characters belong to no page."""
+    page_map, offset = {}, 0
+    for i in range(pages):
+        length = rng.randint(1, 400)
+        page_map[str(i)] = {"page": i + 1, "start_offset": offset, "end_offset": offset + length - 1}
+        offset += length + (rng.randint(0, 5) if gaps else 0)
+    return page_map, offset
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("gaps", [False, True])
+def test_lookup_matches_linear_scan(seed, gaps):
+    rng = random.Random(seed)
+    page_map, length = make_page_map(rng, rng.randint(1, 60), gaps)
+    index = PageIndex(page_map)
+    first, last = page_map["0"]["page"], page_map[str(len(page_map) - 1)]["page"]
+    offsets = np.arange(-3, length + 3)
+
+    assert index.lookup(offsets, first).tolist() == [linear_page(page_map, o, first) for o in offsets]
+    assert index.lookup(offsets, last).tolist() == [linear_page(page_map, o, last) for o in offsets]
+
+
+def test_int_and_string_keys_agree():
+    page_map, length = make_page_map(random.Random(0), 20, gaps=True)
+    offsets = np.arange(length)
+    by_int = PageIndex({int(key): info for key, info in page_map.items()})
+    by_str = PageIndex(page_map)
+    assert by_int.lookup(offsets, -1).tolist() == by_str.lookup(offsets, -1).tolist()
+    assert (by_int.first_page, by_int.last_page) == (1, 20)
+
+
+def test_empty_page_map_is_rejected():
+    with pytest.raises(ValueError):
+        PageIndex({})
+
+
+def test_split_markdown_pages_match_linear_scan():
+    rng = random.Random(1)
+    pages = [f"## Section {i}\n\n" + " ".join(f"clause{i}_{j}" for j in range(rng.randint(20, 300))) for i in range(12)]
+    markdown_text, page_map, offset = "", {}, 0
+    for i, page in enumerate(pages):
+        page_map[str(i)] = {"page": i + 1, "start_offset": offset, "end_offset": offset + len(page) - 1}
+        markdown_text += page + "\n\n"
+        offset += len(page) + 2
+
+    chunks = split_markdown(markdown_text, page_map, workers=1)
+    assert len(chunks) > len(pages) // 2
+    for chunk in chunks:
+        assert markdown_text[chunk.start_offset:chunk.end_offset + 1] == chunk.text
+        assert chunk.page_start == linear_page(page_map, chunk.start_offset, 1)
+        assert chunk.page_end == linear_page(page_map, chunk.end_offset, len(pages))
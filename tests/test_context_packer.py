@@ -0,0 +1,79 @@
+from context_packer import merge_chunks, pack_context, context_text, count_tokens, format_section
+from model.schema import RankedChunk
+
+DOCUMENT = "".join(f"Clause {i}: the insurer pays benefit {i} after the waiting period. " for i in range(40))
+
+
+def chunk(chunk_id: int, start: int, end: int, doc_id: str = "policy_a", text: str = None) -> RankedChunk:
+    """A ranked chunk over DOCUMENT[start:end + 1] (end inclusive, like the chunk store)."""
+    return RankedChunk(
+        chunk_id=chunk_id, doc_id=doc_id, text=DOCUMENT[start:end + 1] if text is None else text,
+        chunk_summary="", page_start=1 + start // 1000, page_end=1 + end // 1000,
+        rrf_score=1.0, appearances=1, sources=["dense"], start_offset=start, end_offset=end,
+    )
+
+
+def test_overlapping_chunks_merge_with_overlap_once():
+    sections = merge_chunks([chunk(2, 150, 449), chunk(1, 0, 299)])
+    assert len(sections) == 1
+    assert sections[0].chunk_ids == [1, 2]  # document order
+    assert sections[0].text == DOCUMENT[0:450]
+
+
+def test_adjacent_chunks_merge_but_distant_ones_do_not():
+    sections = merge_chunks([chunk(1, 0, 99), chunk(2, 101, 199), chunk(3, 400, 499)])
+    assert [section.chunk_ids for section in sections] == [[1, 2], [3]]
+    assert sections[0].text == DOCUMENT[0:100] + "\n" + DOCUMENT[101:200]
+
+
+def test_chunk_contained_in_another_adds_no_text():
+    sections = merge_chunks([chunk(1, 0, 299), chunk(2, 100, 199)])
+    assert sections[0].text == DOCUMENT[0:300]
+
+
+def test_documents_and_chunks_without_offsets_are_never_merged():
+    loose = chunk(9, 0, 0, text="no offsets").model_copy(update={"start_offset": None, "end_offset": None})
+    sections = merge_chunks([chunk(1, 0, 299), chunk(1, 0, 299, doc_id="policy_b"), loose])
+    assert [(section.doc_id, section.chunk_ids) for section in sections] == [
+        ("policy_a", [1]), ("policy_b", [1]), ("policy_a", [9])
+    ]
+
+
+def test_sections_are_ordered_by_best_rank():
+    sections = merge_chunks([chunk(5, 2000, 2299), chunk(1, 0, 299), chunk(6, 2200, 2499)])
+    assert [section.chunk_ids for section in sections] == [[5, 6], [1]]
+
+
+def test_labels_name_the_document():
+    assert format_section("policy_a", [3], 1, 2, "text").startswith("[policy_a, Chunk 3] (Pages 1-2)")
+    assert format_section("policy_a", [3, 4], 1, 2, "text").startswith("[policy_a, Chunks 3, 4]")
+    assert format_section("", [3], 1, 2, "text").startswith("[Chunk 3]")
+    packed = pack_context([chunk(1, 0, 299), chunk(1, 0, 299, doc_id="policy_b")], token_budget=10_000)
+    text = context_text(packed)
+    assert "[policy_a, Chunk 1]" in text and "[policy_b, Chunk 1]" in text
+
+
+def test_budget_drops_lower_ranked_chunks():
+    chunks = [chunk(1, 0, 299), chunk(2, 1000, 1299), chunk(3, 2000, 2299)]
+    one = merge_chunks(chunks[:1])[0].tokens
+    packed = pack_context(chunks, token_budget=2 * one + 1)
+    assert [section.chunk_ids for section in packed.sections] == [[1], [2]]
+    assert packed.chunks_dropped == 1
+    assert packed.tokens <= packed.token_budget
+
+
+def test_overlap_extending_a_passage_only_costs_its_new_text():
+    chunks = [chunk(1, 0, 299), chunk(2, 1000, 1299), chunk(3, 150, 449)]
+    packed = pack_context(chunks, token_budget=10_000)
+    assert [section.chunk_ids for section in packed.sections] == [[1, 3], [2]]
+    assert packed.tokens_saved > 0
+    assert packed.tokens_unpacked == sum(
+        count_tokens(format_section(c.doc_id, [c.chunk_id], c.page_start, c.page_end, c.text)) for c in chunks
+    )
+
+
+def test_top_chunk_is_kept_even_over_budget():
+    packed = pack_context([chunk(1, 0, 999), chunk(2, 1000, 1099)], token_budget=5)
+    assert [section.chunk_ids for section in packed.sections] == [[1]]
+    assert packed.chunks_dropped == 1
+    assert packed.tokens > packed.token_budget
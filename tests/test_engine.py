@@ -0,0 +1,66 @@
+import pytest
+from engine import Engine
+
+
+class FakeCollection:
+    """The slice of a Chroma collection the index snapshots are built from."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, doc_id: str, chunk_id: int, text: str):
+        self.rows[f"{doc_id}:{chunk_id}"] = {
+            "chunk_id": chunk_id, "doc_id": doc_id, "text": text, "chunk_summary": "",
+            "page_start": 1, "page_end": 1, "start_offset": 0, "end_offset": len(text) - 1,
+        }
+
+    def count(self) -> int:
+        return len(self.rows)
+
+    def get(self, include=None, **_):
+        return {"ids": list(self.rows), "metadatas": list(self.rows.values())}
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # snapshots go to ./index_snapshot
+    collection = FakeCollection()
+    collection.add("doc", 1, "hospitalization is covered")
+    collection.add("doc", 2, "maternity has a waiting period")
+    engine = Engine()
+    engine.__dict__["collection"] = collection
+    return engine
+
+
+def test_indexes_are_loaded_once(engine):
+    assert engine.get_indexes() is engine.get_indexes()
+
+
+def test_indexes_reload_when_chroma_gets_ahead_of_the_snapshots(engine):
+    chunk_store, _ = engine.get_indexes()
+    # Upserted, but no snapshot written (ingestion still running, or crashed)
+    engine.collection.add("doc", 3, "ambulance charges are covered")
+    reloaded, bm25_index = engine.get_indexes()
+    assert reloaded is not chunk_store
+    assert reloaded.row("doc:3") == 2
+    assert len(bm25_index.doc_ids) == 3
+
+
+def test_mark_indexes_stale_forces_a_version_check(engine):
+    chunk_store, _ = engine.get_indexes()
+    # Same row count, different ids: only a version check notices
+    metadata = engine.collection.rows.pop("doc:2")
+    engine.collection.rows["doc:9"] = {**metadata, "chunk_id": 9}
+    assert engine.get_indexes()[0] is chunk_store
+    engine.mark_indexes_stale()
+    assert "doc:9" in engine.get_indexes()[0].row_by_id
+
+
+def test_dense_hits_missing_from_the_chunk_store_are_skipped(engine, monkeypatch):
+    import retrieval
+    monkeypatch.setattr(retrieval, "get_engine", lambda: engine)
+    engine.get_indexes()
+    hits = retrieval._to_query_result("q", ["doc:2", "doc:3", "doc:1"], [0.1, 0.2, 0.3])
+    assert hits.keys() == [("doc", 2), ("doc", 1)]
+    assert hits.scores == [0.9, 0.7]
+    assert engine._indexes_stale
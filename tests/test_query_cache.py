@@ -0,0 +1,83 @@
+import pytest
+import query_cache as query_cache_module
+from query_cache import QueryResultCache, normalize_query
+from model.schema import FinalRankedResults, Answer
+
+RESULTS = FinalRankedResults(chunks=[], total_before_dedup=0, total_after_dedup=0)
+
+
+def answer(text: str) -> Answer:
+    return Answer(answer=text, citations=[], confidence="high")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time() as seen by query_cache."""
+    now = [1000.0]
+    monkeypatch.setattr(query_cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_normalize_query():
+    assert normalize_query("  What IS   the waiting period?? ") == "what is the waiting period"
+
+
+def test_exact_hit_needs_no_embedding_and_does_not_count_a_miss():
+    cache = QueryResultCache()
+    cache.put("What is covered?", "v1", RESULTS, answer("a"), query_embedding=[1.0, 0.0])
+    entry, kind = cache.get_exact("what is covered", "v1")
+    assert (entry.answer.answer, kind) == ("a", "exact")
+    assert cache.get_exact("something else", "v1") is None
+    assert cache.stats() == {"entries": 1, "exact_hits": 1, "semantic_hits": 0, "misses": 0}
+
+
+def test_semantic_hit_above_threshold_only():
+    cache = QueryResultCache(similarity_threshold=0.95)
+    cache.put("what is covered", "v1", RESULTS, answer("a"), query_embedding=[1.0, 0.0])
+    entry, kind = cache.get_similar([0.99, 0.05], "v1")
+    assert (entry.answer.answer, kind) == ("a", "semantic")
+    assert cache.get_similar([0.0, 1.0], "v1") is None
+    assert cache.get_similar(None, "v1") is None
+    assert cache.stats()["semantic_hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_get_tries_exact_then_similar():
+    cache = QueryResultCache()
+    cache.put("what is covered", "v1", RESULTS, answer("a"), query_embedding=[1.0, 0.0])
+    assert cache.get("What is covered?", "v1")[1] == "exact"
+    assert cache.get("which things are covered", "v1", query_embedding=[1.0, 0.01])[1] == "semantic"
+    assert cache.get("which things are covered", "v1") is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = QueryResultCache(ttl_seconds=60)
+    cache.put("old", "v1", RESULTS, answer("old"))
+    clock[0] += 30
+    cache.put("new", "v1", RESULTS, answer("new"))
+    clock[0] += 31  # "old" is 61s old, "new" 31s
+    assert cache.get_exact("old", "v1") is None
+    assert cache.get_exact("new", "v1") is not None
+    assert cache.stats()["entries"] == 1
+
+
+def test_lru_evicts_least_recently_used():
+    cache = QueryResultCache(max_entries=2)
+    cache.put("a", "v1", RESULTS, answer("a"))
+    cache.put("b", "v1", RESULTS, answer("b"))
+    cache.get_exact("a", "v1")  # "b" is now the least recently used
+    cache.put("c", "v1", RESULTS, answer("c"))
+    assert cache.get_exact("b", "v1") is None
+    assert cache.get_exact("a", "v1") is not None
+    assert cache.get_exact("c", "v1") is not None
+
+
+def test_index_version_change_invalidates_everything():
+    cache = QueryResultCache()
+    cache.put("a", "v1", RESULTS, answer("a"), query_embedding=[1.0, 0.0])
+    assert cache.get_exact("a", "v2") is None
+    assert cache.get_similar([1.0, 0.0], "v2") is None
+    assert cache.stats()["entries"] == 0
+    # Entries stored under the new version are served again
+    cache.put("a", "v2", RESULTS, answer("a2"))
+    assert cache.get_exact("a", "v2")[0].answer.answer == "a2"
@@ -0,0 +1,37 @@
+import asyncio
+import logging
+import pytest
+from rate_limit import RateLimitedScheduler
+
+
+async def double(item: int) -> int:
+    if item < 0:
+        raise ValueError("negative")
+    return item * 2
+
+
+def test_call_counts_outcomes_and_reports_progress(caplog):
+    scheduler = RateLimitedScheduler(name="Summaries", progress_every=2)
+
+    async def main():
+        # Callers running their own workers (as ingest_pipeline does) go through call()
+        results = [await scheduler.call(double, 1), await scheduler.call(double, 2)]
+        with pytest.raises(ValueError):
+            await scheduler.call(double, -1)
+        return results
+
+    with caplog.at_level(logging.INFO, logger="rag.rate_limit"):
+        assert asyncio.run(main()) == [2, 4]
+    assert (scheduler.stats["done"], scheduler.stats["failed"]) == (2, 1)
+    assert "throughput_per_s" in scheduler.stats
+    assert [r.getMessage().split(" (")[0] for r in caplog.records] == ["Summaries: 2 done"]
+
+
+def test_run_keeps_order_and_isolates_failures(caplog):
+    scheduler = RateLimitedScheduler(name="Summaries", max_concurrency=2, progress_every=100)
+    with caplog.at_level(logging.INFO, logger="rag.rate_limit"):
+        results = asyncio.run(scheduler.run(double, [1, -1, 3]))
+    assert results == [2, None, 6]
+    assert isinstance(scheduler.errors[1], ValueError)
+    assert (scheduler.stats["done"], scheduler.stats["failed"]) == (2, 1)
+    assert "Summaries: 3 done" in caplog.records[-1].getMessage()
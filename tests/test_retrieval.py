@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+import retrieval
+from model.schema import FinalQueries
+from retrieval_records import QueryHits
+
+VARIATIONS = ["v1", "v2", "v3"]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Stub retrievers and the variation cache; records retrieved queries and cache lookups."""
+    calls = {"dense": [], "sparse": [], "lookups": 0, "translated": [], "translation_cancelled": False}
+
+    def retriever(name):
+        def retrieve(queries):
+            calls[name] += queries
+            return [QueryHits(q, None, [], []) for q in queries]
+        return retrieve
+
+    def lookup(query):
+        calls["lookups"] += 1
+        return calls.get("cached")
+
+    monkeypatch.setattr(retrieval, "_dense_retrieval_serial", retriever("dense"))
+    monkeypatch.setattr(retrieval, "_sparse_retrieval", retriever("sparse"))
+    monkeypatch.setattr(retrieval, "dense_retrieval", lambda queries: retrieval.RetrievalHits("dense", retriever("dense")(queries)))
+    monkeypatch.setattr(retrieval, "sparse_retrieval", lambda queries: retrieval.RetrievalHits("sparse", retriever("sparse")(queries)))
+    monkeypatch.setattr(retrieval, "cached_variations", lookup)
+    monkeypatch.setattr(retrieval, "_translation_gate", lambda dense, sparse: calls["translate"])
+    retrieval.translation_stats.reset()
+    return calls
+
+
+async def translate(query, cached, calls):
+    calls["translated"].append(cached)
+    try:
+        for variation in cached or VARIATIONS:
+            await asyncio.sleep(0.01)
+            yield variation
+    except (asyncio.CancelledError, GeneratorExit):
+        calls["translation_cancelled"] = True
+        raise
+
+
+def questions(results):
+    return [hits.question for hits in results.results]
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_async_translates_when_the_gate_says_so(calls, monkeypatch, speculative):
+    monkeypatch.setattr(retrieval, "SPECULATIVE_TRANSLATION", speculative)
+    calls["translate"] = True
+    dense, sparse = asyncio.run(retrieval.hybrid_retrieval_async(
+        "q", lambda query, cached: translate(query, cached, calls), adaptive=True))
+    assert questions(dense) == questions(sparse) == ["q"] + VARIATIONS
+    assert calls["dense"] == ["q"] + VARIATIONS  # the original query is retrieved once
+    assert calls["lookups"] == 1 and calls["translated"] == [None]
+    assert retrieval.translation_stats.stats()["generated"] == 1
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_async_skip_cancels_speculative_translation(calls, monkeypatch, speculative):
+    monkeypatch.setattr(retrieval, "SPECULATIVE_TRANSLATION", speculative)
+    calls["translate"] = False
+    dense, _ = asyncio.run(retrieval.hybrid_retrieval_async(
+        "q", lambda query, cached: translate(query, cached, calls), adaptive=True))
+    assert questions(dense) == ["q"]
+    assert calls["translated"] == ([None] if speculative else [])
+    assert calls["translation_cancelled"] == speculative
+    stats = retrieval.translation_stats.stats()
+    assert (stats["skipped"], stats["speculative_skips"]) == (1, int(speculative))
+    assert stats["llm_calls_saved_rate"] == (0.0 if speculative else 1.0)
+
+
+def test_async_cached_variations_are_looked_up_once(calls):
+    calls["cached"] = ["c1", "c2", "c3"]
+    dense, _ = asyncio.run(retrieval.hybrid_retrieval_async(
+        "q", lambda query, cached: translate(query, cached, calls), adaptive=True))
+    assert questions(dense) == ["q", "c1", "c2", "c3"]
+    assert calls["lookups"] == 1 and calls["translated"] == [["c1", "c2", "c3"]]
+
+
+def test_sequential_retrieves_only_the_variations_after_the_first_pass(calls, monkeypatch):
+    translated = []
+
+    def query_translate(query, cached):
+        translated.append(cached)
+        return FinalQueries(original_query=query, variations=VARIATIONS)
+
+    monkeypatch.setattr(retrieval, "query_translate", query_translate)
+    calls["translate"] = True
+    dense, sparse = retrieval.hybrid_retrieval("q", concurrent=False, adaptive=True)
+    assert questions(dense) == questions(sparse) == ["q"] + VARIATIONS
+    assert calls["dense"] == ["q"] + VARIATIONS
+    assert calls["lookups"] == 1 and translated == [None]
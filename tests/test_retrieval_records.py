@@ -0,0 +1,26 @@
+import pytest
+from chunk_store import ChunkStore
+from retrieval_records import QueryHits, RetrievalHits
+
+
+@pytest.fixture
+def store():
+    metadatas = [
+        {"doc_id": "policy_a", "chunk_id": i, "text": f"clause {i}", "page_start": 1, "page_end": 1,
+         "start_offset": 100 * i, "end_offset": 100 * i + 99}
+        for i in range(4)
+    ]
+    return ChunkStore.from_metadatas([f"policy_a_{i}" for i in range(4)], metadatas)
+
+
+@pytest.mark.parametrize("hits", [1, 2, 3, 4])
+def test_fewer_than_five_hits_convert_to_models(store, hits):
+    query_hits = QueryHits("q", store, list(range(hits)), [0.9 - 0.1 * i for i in range(hits)])
+    result = query_hits.to_model()
+    assert [chunk.chunk_id for chunk in result.chunks] == list(range(hits))
+    assert result.chunks[0].text == "clause 0" and result.chunks[0].doc_id == "policy_a"
+
+    for source in ("dense", "sparse"):
+        model = RetrievalHits(source, [query_hits]).to_model()
+        back = RetrievalHits.from_model(source, model, store)
+        assert back.results[0].rows == query_hits.rows
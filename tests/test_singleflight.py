@@ -0,0 +1,234 @@
+import asyncio
+import threading
+import pytest
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+class Boom(Exception):
+    pass
+
+
+# AsyncSingleFlight.do
+
+def test_do_shares_one_execution():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return calls, results, flight.stats()
+
+    calls, results, stats = asyncio.run(main())
+    assert calls == 1
+    assert [result for result, _ in results] == ["result"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert stats == {"executions": 1, "shared": 4}
+
+
+def test_do_follower_survives_leader_cancellation():
+    async def main():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == ("result", True)
+
+
+def test_do_cancels_work_once_every_caller_has_gone():
+    async def main():
+        flight = AsyncSingleFlight()
+        started, cancelled = asyncio.Event(), asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        callers = [asyncio.create_task(flight.do("key", work)) for _ in range(2)]
+        await started.wait()
+        callers[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()  # one caller is still waiting
+        callers[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.gather(*callers, return_exceptions=True)
+
+        # The key is forgotten: the next caller starts a fresh execution
+        async def again():
+            return "fresh"
+        return await flight.do("key", again)
+
+    assert asyncio.run(main()) == ("fresh", False)
+
+
+def test_do_propagates_exceptions_to_every_caller():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise Boom("failed")
+
+        return await asyncio.gather(*(flight.do("key", work) for _ in range(3)), return_exceptions=True), flight.stats()
+
+    results, stats = asyncio.run(main())
+    assert all(isinstance(result, Boom) for result in results)
+    assert stats["executions"] == 1
+
+
+# AsyncSingleFlight.stream
+
+def test_stream_replays_items_to_late_joiners():
+    async def main():
+        flight = AsyncSingleFlight()
+        produced, resume = asyncio.Event(), asyncio.Event()
+
+        async def items():
+            yield 1
+            yield 2
+            produced.set()
+            await resume.wait()
+            yield 3
+
+        first, shared_first = flight.stream("key", items)
+        first_items = []
+
+        async def read_first():
+            async for item in first:
+                first_items.append(item)
+
+        reader = asyncio.create_task(read_first())
+        await produced.wait()
+        late, shared_late = flight.stream("key", items)
+        resume.set()
+        late_items = [item async for item in late]
+        await reader
+        return first_items, late_items, shared_first, shared_late, flight.stats()
+
+    first_items, late_items, shared_first, shared_late, stats = asyncio.run(main())
+    assert first_items == late_items == [1, 2, 3]
+    assert (shared_first, shared_late) == (False, True)
+    assert stats == {"executions": 1, "shared": 1}
+
+
+def test_stream_propagates_exceptions_to_every_follower():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def items():
+            yield 1
+            await asyncio.sleep(0.01)
+            raise Boom("failed")
+
+        async def read(stream):
+            received = []
+            with pytest.raises(Boom):
+                async for item in stream:
+                    received.append(item)
+            return received
+
+        streams = [flight.stream("key", items)[0] for _ in range(2)]
+        return await asyncio.gather(*(read(stream) for stream in streams))
+
+    assert asyncio.run(main()) == [[1], [1]]
+
+
+def test_stream_cancels_producer_once_every_follower_has_gone():
+    async def main():
+        flight = AsyncSingleFlight()
+        cancelled = asyncio.Event()
+
+        async def items():
+            try:
+                for i in range(1000):
+                    yield i
+                    await asyncio.sleep(0.01)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        streams = [flight.stream("key", items)[0] for _ in range(2)]
+        assert await streams[0].__anext__() == 0
+        await streams[0].aclose()
+        await asyncio.sleep(0.03)
+        assert not cancelled.is_set()  # the second follower still keeps it alive
+        await streams[1].aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    asyncio.run(main())
+
+
+# SingleFlight (threads)
+
+def test_thread_do_shares_result_and_exceptions():
+    flight = SingleFlight()
+    entered, release = threading.Event(), threading.Event()
+    results = []
+
+    def work():
+        entered.set()
+        release.wait(1)
+        return "result"
+
+    def call():
+        results.append(flight.do("key", work))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    entered.wait(1)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()["shared"] < 3:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+
+    def fail():
+        raise Boom("failed")
+
+    with pytest.raises(Boom):
+        flight.do("key", fail)
+
+
+def test_thread_stream_replays_items_to_late_joiners():
+    flight = SingleFlight()
+    resume = threading.Event()
+
+    def items():
+        yield 1
+        resume.wait(1)
+        yield 2
+
+    first, _ = flight.stream("key", items)
+    assert next(first) == 1
+    late, shared = flight.stream("key", items)
+    resume.set()
+    assert shared
+    assert list(late) == [1, 2]
+    assert list(first) == [2]
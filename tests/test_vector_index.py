@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from vector_index import FlatVectorIndex, two_stage_search
+
+DIM = 256
+COARSE_DIM = 64
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    """Clustered unit vectors whose leading dimensions carry most of the variance (Matryoshka-like)."""
+    rng = np.random.default_rng(0)
+    decay = (1 / np.sqrt(1 + np.arange(DIM) / 16)).astype(np.float32)
+    centers = rng.normal(size=(40, DIM)).astype(np.float32) * decay
+    vectors = centers[rng.integers(0, 40, 2000)] + 0.8 * rng.normal(size=(2000, DIM)).astype(np.float32) * decay
+    queries = vectors[rng.integers(0, 2000, 100)] + 0.05 * rng.normal(size=(100, DIM)).astype(np.float32) * decay
+    return vectors, queries
+
+
+def exact_top_k(vectors, queries, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ vectors.T), axis=1, kind="stable")[:, :k]
+
+
+def recall(found, expected):
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found.tolist(), expected.tolist())])
+
+
+def test_flat_float32_search_is_exact(corpus):
+    vectors, queries = corpus
+    rows, scores = FlatVectorIndex.build(vectors, "float32").search(queries, 5)
+    assert (rows == exact_top_k(vectors, queries, 5)).all()
+    assert (np.diff(scores, axis=1) <= 1e-6).all()  # best first
+
+
+@pytest.mark.parametrize("quantization, min_recall", [("float32", 0.97), ("int8", 0.93)])
+def test_two_stage_recall_close_to_flat_search(corpus, quantization, min_recall):
+    vectors, queries = corpus
+    full = FlatVectorIndex.build(vectors, quantization)
+    coarse = FlatVectorIndex.build(vectors[:, :COARSE_DIM], quantization)
+    flat_rows, _ = full.search(queries, 5)
+    rows, scores = two_stage_search(coarse, full, queries, 5, candidates=64)
+    assert recall(rows, flat_rows) >= min_recall
+    # Scores come from the full vectors, so shared hits score as in the flat search
+    np.testing.assert_allclose(full.score_rows(queries, rows), scores, atol=1e-5)
+
+
+def test_two_stage_with_every_row_as_candidate_equals_flat_search(corpus):
+    vectors, queries = corpus
+    full = FlatVectorIndex.build(vectors[:300], "float32")
+    coarse = FlatVectorIndex.build(vectors[:300, :COARSE_DIM], "float32")
+    rows, _ = two_stage_search(coarse, full, queries, 5, candidates=300)
+    assert (rows == full.search(queries, 5)[0]).all()
+
+
+def test_more_candidates_never_lower_recall(corpus):
+    vectors, queries = corpus
+    full = FlatVectorIndex.build(vectors, "float32")
+    coarse = FlatVectorIndex.build(vectors[:, :COARSE_DIM], "float32")
+    expected = full.search(queries, 5)[0]
+    recalls = [recall(two_stage_search(coarse, full, queries, 5, candidates=c)[0], expected) for c in (5, 16, 64, 256)]
+    assert recalls == sorted(recalls)